@@ -4,11 +4,18 @@ import argparse
 
 from SkullModPy import app_info
 from SkullModPy.formats.dds import DDSReader
+from SkullModPy.formats.dds_info import format_json, format_table, get_dds_info
 from SkullModPy.formats.gfs import GFSReader, GFSWriter
+from SkullModPy.formats.gfs_bundle import export_bundle, is_zip_path, pack_bundle
+from SkullModPy.formats.gfs_order import ORDER_POLICIES
+from SkullModPy.formats.gfs_patch import patch_archive
+from SkullModPy.formats.gfs_manifest import diff_archives, get_manifest, get_manifest_path, verify_archive, \
+    write_manifest
 from SkullModPy.formats.pcx import PCXReader
 from SkullModPy.formats.spr import SPR
 
-if __name__ == "__main__":
+
+def print_banner():
     try:
         print(" ██ █ █ █  █ █  █  █   █  ██  ██ ")
         print("█   ██  █  █ █  █  ██ ██ █  █ █ █")
@@ -26,27 +33,84 @@ if __name__ == "__main__":
     print("Version: " + app_info.APPLICATION_VERSION + " " + app_info.APPLICATION_DATE)
     print("Made by 0xFAIL\n")
 
+
+if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Modding tool for SkullGirls", prog="SkullMod")
 
-    parser.add_argument('-do', choices=('unpack', 'pack'), help="Default: unpack", default='unpack', required=False)
+    parser.add_argument('-do', choices=('unpack', 'pack', 'list', 'manifest', 'verify', 'diff', 'patch', 'info'),
+                        help="Default: unpack, manifest/verify: hash .gfs entries (file.gfs.manifest.txt), "
+                             "diff: compare two .gfs files, patch: replace .gfs entries (see -gfs_patch), "
+                             "info: list the headers of .dds files, .dds entries of .gfs files or directories",
+                        default='unpack', required=False)
     parser.add_argument('-gfs', action='store_true', help="Pack/Unpack .gfs", required=False)
     parser.add_argument('-gfs_pack_align', action='store_true', default=False, help="GFS 4k alignment flag", required=False)
+    parser.add_argument('-gfs_pack_incremental', action='store_true', default=False,
+                        help="Copy unchanged files from the existing .gfs when packing, files with the size and date "
+                             "of the last unpack/pack (.smsrc) are not read, other files are compared",
+                        required=False)
+    parser.add_argument('-gfs_order', choices=ORDER_POLICIES, default='walk', required=False,
+                        help="Order of the files when packing (Default: walk), stem: same name next to each other, "
+                             "trace: order of -gfs_order_trace")
+    parser.add_argument('-gfs_order_trace', metavar='f', required=False,
+                        help="Access order trace for -gfs_order trace (one path per line)")
+    parser.add_argument('-gfs_mmap', action='store_true', default=False, help="Memory map .gfs files when unpacking",
+                        required=False)
+    parser.add_argument('-gfs_cache', action='store_true', default=False,
+                        help="Keep a copy of the .gfs header next to the file (.smidx) to read it faster",
+                        required=False)
+    parser.add_argument('-gfs_include', nargs='+', metavar='p', required=False,
+                        help="Only use .gfs entries matching a pattern (glob like *.dds or stages/, 're:' for regex)")
+    parser.add_argument('-gfs_exclude', nargs='+', metavar='p', required=False,
+                        help="Skip .gfs entries matching a pattern (see -gfs_include)")
+    parser.add_argument('-gfs_min_size', type=int, metavar='n', required=False, help="Skip .gfs entries below n bytes")
+    parser.add_argument('-gfs_max_size', type=int, metavar='n', required=False, help="Skip .gfs entries above n bytes")
+    parser.add_argument('-gfs_bundle', metavar='f', required=False,
+                        help="unpack: write the entries into one .tar/.zip (stored) file, - for a tar on stdout; "
+                             "pack: read the entries from a .tar/.zip file, - for stdin, -files is the .gfs file")
+    parser.add_argument('-gfs_patch', nargs=2, metavar=('entry', 'f'), action='append', required=False,
+                        help="Replace a .gfs entry with a file (can be used more than once), written in place "
+                             "if it fits, otherwise the .gfs is repacked")
+    parser.add_argument('-gfs_threads', type=int, metavar='n', default=None, required=False,
+                        help="Threads for .gfs unpack/pack (Default: 1), "
+                             "manifest/verify/diff (Default: number of CPUs)")
     parser.add_argument('-lvl', action='store_true', help="Export/Import level")
     parser.add_argument('-spr', action='store_true', help="Export/Import sprite")
     parser.add_argument('-spr_charselect', action='store_true', help="Export charselect with palette")
     parser.add_argument('-spr_charselect_p', nargs=1, metavar='f', action='store', help="Palette file for charselect")
     parser.add_argument('-dds', action='store_true', help="Export dds to png (no import)")
+    parser.add_argument('-dds_engine', choices=DDSReader.ENGINES, required=False,
+                        help="DXT decoder for dds/spr (Default: numpy if installed, python otherwise)")
+    parser.add_argument('-dds_mip', metavar='n', action='store', required=False,
+                        help="Mip level to export (Default: 0, the full image), all: every level, "
+                             "levels after the first are written to name.mipN.png")
+    parser.add_argument('-dds_json', action='store_true', default=False, required=False,
+                        help="Print the result of info as JSON (other messages go to stderr)")
+    parser.add_argument('-dds_threads', type=int, metavar='n', required=False,
+                        help="Threads for dds info (Default: number of CPUs)")
     parser.add_argument('-pcx', action='store_true', help="Export pcx to png (no import)")
     parser.add_argument('-files', nargs='+', metavar="f", help="Files or directories to work with", required=True)
 
     # Don't print an error message if there are no arguments, display help instead
     if len(sys.argv) == 1:
+        print_banner()
         parser.print_help()
         os.system("pause")  # Windows only
         sys.exit(0)
 
     args = vars(parser.parse_args())
 
+    # A bundle written to stdout must not be mixed up with the messages, they go to stderr instead
+    bundle_stdout = None
+    if args['gfs_bundle'] == '-' and args['do'] == 'unpack':
+        bundle_stdout = sys.stdout.buffer
+        sys.stdout = sys.stderr
+    # Same for JSON
+    json_stdout = None
+    if args['dds_json'] and args['do'] == 'info':
+        json_stdout = sys.stdout
+        sys.stdout = sys.stderr
+    print_banner()
+
     # Check if only one mode was selected
     if args['lvl'] + args['spr'] + args['gfs'] + args['dds'] + args['pcx'] + args['spr_charselect'] != 1:
         print("\nError: Select only one filetype to process (lvl/spr/gfs/dds")
@@ -61,23 +125,184 @@ if __name__ == "__main__":
         parser.print_help()
         print("\nError: gfs_pack_align without gfs and pack")
         sys.exit(1)
+    if (args['gfs'] is False or args['do'] != 'pack') and args['gfs_pack_incremental'] is True:
+        parser.print_help()
+        print("\nError: gfs_pack_incremental without gfs and pack")
+        sys.exit(1)
+    if (args['gfs'] is False or args['do'] != 'pack' or args['gfs_bundle'] is not None) and \
+            (args['gfs_order'] != 'walk' or args['gfs_order_trace'] is not None):
+        parser.print_help()
+        print("\nError: gfs_order/gfs_order_trace without gfs and pack of a directory")
+        sys.exit(1)
+    if (args['gfs_order'] == 'trace') != (args['gfs_order_trace'] is not None):
+        parser.print_help()
+        print("\nError: gfs_order trace and gfs_order_trace have to be used together")
+        sys.exit(1)
+    if args['gfs'] is False and args['gfs_mmap'] is True:
+        parser.print_help()
+        print("\nError: gfs_mmap without gfs")
+        sys.exit(1)
+    if args['gfs'] is False and args['gfs_cache'] is True:
+        parser.print_help()
+        print("\nError: gfs_cache without gfs")
+        sys.exit(1)
+    if args['do'] in ('list', 'manifest', 'verify', 'diff', 'patch') and not args['gfs']:
+        parser.print_help()
+        print("\nError: " + args['do'] + " is only available for gfs")
+        sys.exit(1)
+    if args['do'] == 'info' and not args['dds']:
+        parser.print_help()
+        print("\nError: info is only available for dds")
+        sys.exit(1)
+    if args['do'] != 'info' and (args['dds_json'] or args['dds_threads'] is not None):
+        parser.print_help()
+        print("\nError: dds_json/dds_threads only work with dds info")
+        sys.exit(1)
+    if args['dds_threads'] is not None and args['dds_threads'] < 1:
+        parser.print_help()
+        print("\nError: dds_threads has to be 1 or more")
+        sys.exit(1)
+    gfs_filters = (args['gfs_include'], args['gfs_exclude'], args['gfs_min_size'], args['gfs_max_size'])
+    if any(gfs_filter is not None for gfs_filter in gfs_filters) and \
+            (not args['gfs'] or args['do'] not in ('unpack', 'list', 'manifest')):
+        parser.print_help()
+        print("\nError: gfs_include/exclude/min_size/max_size only work with gfs unpack, list and manifest")
+        sys.exit(1)
+    if args['gfs_bundle'] is not None and (not args['gfs'] or args['do'] not in ('unpack', 'pack') or
+                                           len(args['files']) != 1):
+        parser.print_help()
+        print("\nError: gfs_bundle only works with gfs unpack and pack of one file")
+        sys.exit(1)
+    if args['gfs_bundle'] is not None and args['gfs_pack_incremental']:
+        parser.print_help()
+        print("\nError: gfs_bundle can't be combined with gfs_pack_incremental")
+        sys.exit(1)
+    if (args['do'] == 'patch') != (args['gfs_patch'] is not None):
+        parser.print_help()
+        print("\nError: patch and gfs_patch have to be used together")
+        sys.exit(1)
+    if args['gfs_threads'] is not None and args['gfs_threads'] < 1:
+        parser.print_help()
+        print("\nError: gfs_threads has to be 1 or more")
+        sys.exit(1)
+    if args['dds_engine'] is not None and not (args['dds'] or args['spr'] or args['spr_charselect']):
+        parser.print_help()
+        print("\nError: dds_engine only works with dds, spr and spr_charselect")
+        sys.exit(1)
+    if args['dds_mip'] is not None and (not args['dds'] or args['do'] != 'unpack'):
+        parser.print_help()
+        print("\nError: dds_mip only works with dds unpack")
+        sys.exit(1)
+    if args['dds_mip'] is not None and args['dds_mip'] != 'all' and not args['dds_mip'].isdigit():
+        parser.print_help()
+        print("\nError: dds_mip has to be a level (0 or more) or all")
+        sys.exit(1)
     if args['spr_charselect'] is True and args['spr_charselect_p'] is None:
         parser.print_help()
         print("\nError: spr_charselelect_p is not defined")
         sys.exit(1)
 
+    if args['do'] == 'diff':
+        if len(args['files']) != 2:
+            parser.print_help()
+            print("\nError: diff requires exactly two files (old and new)")
+            sys.exit(1)
+        try:
+            differences = diff_archives(args['files'][0], args['files'][1], args['gfs_threads'], args['gfs_mmap'])
+        except (OSError, ValueError) as e:
+            print("Error: " + str(e))
+            sys.exit(1)
+        for marker, key in (('+', 'added'), ('-', 'removed'), ('M', 'modified')):
+            for path in differences[key]:
+                print(marker + ' ' + path)
+        print(str(len(differences['added'])) + " added, " + str(len(differences['removed'])) + " removed, " +
+              str(len(differences['modified'])) + " modified")
+        sys.exit(0)
+
+    if args['do'] == 'info':
+        dds_info = get_dds_info(args['files'], args['dds_threads'])
+        if json_stdout is not None:
+            json_stdout.write(format_json(dds_info) + '\n')
+        else:
+            print(format_table(dds_info))
+        sys.exit(0)
+
     # Iterate through files
     for file in args['files']:
         print("Processing: " + os.path.basename(file))
         if args['gfs']:
             if args['do'] == 'unpack':
                 try:
-                    gfs_file = GFSReader(file)
-                    gfs_file.export_files(gfs_file.get_metadata())
+                    gfs_file = GFSReader(file, args['gfs_mmap'])
+                    gfs_metadata = GFSReader.filter_metadata(gfs_file.get_metadata(args['gfs_cache']), *gfs_filters)
+                    if args['gfs_bundle'] is not None:
+                        if bundle_stdout is not None:
+                            export_bundle(gfs_file, gfs_metadata, bundle_stdout)
+                        else:
+                            export_bundle(gfs_file, gfs_metadata, args['gfs_bundle'], is_zip_path(args['gfs_bundle']))
+                    elif args['gfs_threads'] is not None and args['gfs_threads'] > 1:
+                        gfs_file.export_files_parallel(gfs_metadata, args['gfs_threads'])
+                    else:
+                        gfs_file.export_files(gfs_metadata)
+                    gfs_file.close()
                     print('Done')
                 except Exception as e:
                     print("Please report this error: " + str(e))
                     sys.exit(1)
+            elif args['do'] == 'list':
+                try:
+                    gfs_file = GFSReader(file)
+                    gfs_metadata = GFSReader.filter_metadata(gfs_file.get_metadata(args['gfs_cache']), *gfs_filters)
+                    for entry in gfs_metadata['metadata']:
+                        print(str(entry[1]).rjust(12) + ' ' + entry[2])
+                    gfs_file.close()
+                except Exception as e:
+                    print("Please report this error: " + str(e))
+                    sys.exit(1)
+            elif args['do'] == 'manifest':
+                try:
+                    gfs_file = GFSReader(file, args['gfs_mmap'])
+                    gfs_metadata = GFSReader.filter_metadata(gfs_file.get_metadata(args['gfs_cache']), *gfs_filters)
+                    manifest = get_manifest(gfs_file, gfs_metadata['metadata'], args['gfs_threads'])
+                    gfs_file.close()
+                    manifest_filters = None
+                    if any(gfs_filter is not None for gfs_filter in gfs_filters):  # Verify only checks these entries
+                        manifest_filters = dict(zip(('include', 'exclude', 'min_size', 'max_size'), gfs_filters))
+                    write_manifest(get_manifest_path(file), manifest, filters=manifest_filters)
+                    print("Manifest written: " + os.path.basename(get_manifest_path(file)))
+                except (OSError, ValueError) as e:
+                    print("Error: " + str(e))
+                    sys.exit(1)
+            elif args['do'] == 'verify':
+                try:
+                    manifest_path = get_manifest_path(file) if os.path.isfile(get_manifest_path(file)) else None
+                    if manifest_path is None:
+                        print("No manifest found, checking the archive only")
+                    problems = verify_archive(file, manifest_path, args['gfs_threads'], args['gfs_mmap'])
+                except (OSError, ValueError) as e:
+                    print("Error: " + str(e))
+                    sys.exit(1)
+                for problem in problems:
+                    print(problem)
+                if problems:
+                    print("Verification failed")
+                    sys.exit(1)
+                print("OK")
+            elif args['do'] == 'patch':
+                try:
+                    if patch_archive(file, dict(args['gfs_patch']), args['gfs_threads']):
+                        print("Patched in place")
+                    else:
+                        print("Doesn't fit in place, repacked")
+                except (OSError, ValueError) as e:
+                    print("Error: " + str(e) + ", the archive is unchanged")
+                    sys.exit(1)
+            elif args['do'] == 'pack' and args['gfs_bundle'] is not None:
+                if args['gfs_bundle'] == '-':
+                    pack_bundle(sys.stdin.buffer, file, args['gfs_pack_align'], args['gfs_threads'])
+                else:
+                    pack_bundle(args['gfs_bundle'], file, args['gfs_pack_align'], args['gfs_threads'])
+                print("Done")
             elif args['do'] == 'pack':
 
                 if os.path.basename(file) == 'characters-art-pt' and not args['gfs_pack_align']:
@@ -86,7 +311,11 @@ if __name__ == "__main__":
                     print('OR USE "GFS pack aligned.bat" FOR THIS FILE' + '\n')
                     continue
                 gfs_file = GFSWriter(file, args['gfs_pack_align'])
-                gfs_file.write_content(gfs_file.get_metadata())
+                previous_archive = None
+                if args['gfs_pack_incremental'] and os.path.isfile(gfs_file.dir_path + '.gfs'):
+                    previous_archive = gfs_file.dir_path + '.gfs'
+                gfs_metadata = gfs_file.get_metadata(args['gfs_order'], args['gfs_order_trace'])
+                gfs_file.write_content(gfs_metadata, previous_archive, args['gfs_threads'])
                 print("Done")
         if args['lvl']:
             if args['do'] == 'unpack':
@@ -97,7 +326,7 @@ if __name__ == "__main__":
                 print('Not implemented yet')
         if args['spr']:
             if args['do'] == 'unpack':
-                spr = SPR(file)
+                spr = SPR(file, engine=args['dds_engine'])
                 spr.read_spr()
                 print("Done")
             else:
@@ -106,10 +335,19 @@ if __name__ == "__main__":
         if args['dds']:
             if args['do'] == 'unpack':
                 print("Unpacking DDS is slow, may take a while")
-                dds = DDSReader(file)
-                dds.check_destination()
-                dds.write_png(dds.get_png_data())
-                print("Done")
+                try:
+                    dds = DDSReader(file, engine=args['dds_engine'])
+                    if args['dds_mip'] == 'all':
+                        levels = range(dds.probe()['mipmap_count'])
+                    else:
+                        levels = [0 if args['dds_mip'] is None else int(args['dds_mip'])]
+                    for level in levels:
+                        dds.check_destination(level)
+                    dds.write_png_stream(levels)
+                    print("Done")
+                except (OSError, ValueError) as e:
+                    print("Error: " + str(e))
+                    sys.exit(1)
             else:
                 print("Packing DDS is not implemented, use the NVidia Texture Tools")
         if args['pcx']:
@@ -124,9 +362,9 @@ if __name__ == "__main__":
         if args['spr_charselect']:
             if args['do'] == 'unpack':
                 palette_path = os.path.join(os.path.dirname(file), str(args['spr_charselect_p'][0]))
-                palette = DDSReader(palette_path)
+                palette = DDSReader(palette_path, engine=args['dds_engine'])
                 palette = palette.get_png_data()[0]
-                spr = SPR(file, charselect=True, charselect_palette=palette)
+                spr = SPR(file, charselect=True, charselect_palette=palette, engine=args['dds_engine'])
                 spr.read_spr()
                 print("Done")
             else:
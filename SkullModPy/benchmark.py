@@ -0,0 +1,167 @@
+"""
+Micro benchmarks for the slow parts of SkullMod
+Usage: python -m SkullModPy.benchmark [name [argument ...] ...] (runs all benchmarks without a name)
+"""
+import contextlib
+import io
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+from SkullModPy.formats.dds import DDSReader
+from SkullModPy.formats.gfs import GFSReader, GFSStreamWriter, GFSWriter
+from SkullModPy.formats.gfs_order import ORDER_POLICIES, get_seek_distance, order_metadata, read_trace
+
+
+def best_time(function, repeat):
+    """
+    :return: Fastest of repeat runs in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_gfs_header(n_of_entries=50000, repeat=5):
+    """
+    Parse the header of an archive with n_of_entries (empty) entries, with and without the index cache
+    """
+    n_of_entries = int(n_of_entries)
+    repeat = int(repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'benchmark.gfs')
+        GFSStreamWriter(file_path, True).write(('data/characters/benchmark/entry' + str(i) + '.spr.msb', 0, b'')
+                                               for i in range(n_of_entries))
+        reader = GFSReader(file_path)
+        reader.save_index_cache(reader.read_references())
+        header_time = best_time(reader.read_references, repeat)
+        cache_time = best_time(reader.load_index_cache, repeat)
+        reader.close()
+    print("GFS header, " + str(n_of_entries) + " entries")
+    print("  parse: {:.2f} ms per 10k entries".format(header_time * 1000 * 10000 / n_of_entries))
+    print("  index cache: {:.2f} ms per 10k entries".format(cache_time * 1000 * 10000 / n_of_entries))
+
+
+def get_sample_files(n_of_characters=20, seed=0):
+    """
+    Files that look like a part of characters-art-pt, in a random order (like os.walk() on some file systems)
+    and a trace that loads the characters one after another
+    :return: File list in form [name, size, name, size, ...], trace
+    """
+    rng = random.Random(seed)
+    names = []
+    trace = []
+    for character in range(n_of_characters):
+        character_files = []
+        for sprite in ('idle', 'walk', 'jump', 'attack'):
+            stem = 'characters/character' + str(character) + '/' + sprite
+            character_files += [stem + '.spr.msb', stem + '.dds']
+        character_files += ['palettes/character' + str(character) + '/palette' + str(i) + '.pal' for i in range(4)]
+        names += character_files
+        trace.append(character_files)
+    rng.shuffle(trace)
+    rng.shuffle(names)
+    file_list = []
+    for name in names:
+        file_list.append(name)
+        file_list.append(rng.randrange(1000, 400000) if name.endswith('.dds') else rng.randrange(100, 10000))
+    return file_list, [path for character_files in trace for path in character_files]
+
+
+def get_entries(file_list, alignment):
+    file_names = file_list[0::2]
+    file_sizes = file_list[1::2]
+    file_offsets = GFSWriter.get_layout(file_names, file_sizes, alignment)[1]
+    return [[offset, size, name, alignment] for name, size, offset in zip(file_names, file_sizes, file_offsets)]
+
+
+def benchmark_gfs_order(file_path=None, trace_path=None):
+    """
+    Seek distance of the order policies when the entries are read in the order of a trace
+    Without arguments a generated archive and trace are used
+    :param file_path: Existing .gfs file, the archive itself isn't changed
+    :param trace_path: Trace file for the archive (see gfs_order.read_trace())
+    """
+    if file_path is None:
+        file_list, trace = get_sample_files()
+        alignment = 4096
+    else:
+        if trace_path is None:
+            print("gfs_order needs a trace file for an archive")
+            sys.exit(1)
+        reader = GFSReader(file_path)
+        metadata = reader.get_metadata()['metadata']
+        reader.close()
+        file_list = [value for entry in metadata for value in (entry[2], entry[1])]
+        trace = read_trace(trace_path)
+        alignment = metadata[0][3] if len(metadata) > 0 else 1
+    with tempfile.TemporaryDirectory() as directory:
+        layout_trace_path = os.path.join(directory, 'trace.txt')
+        with open(layout_trace_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(trace))
+        print("GFS order, " + str(len(file_list) // 2) + " entries, " + str(len(trace)) + " reads in the trace")
+        for policy in ORDER_POLICIES:
+            result = get_seek_distance(get_entries(order_metadata(file_list, policy, layout_trace_path), alignment),
+                                       trace)
+            print("  " + policy.ljust(10) + " seeks: " + str(result['seeks']).rjust(6) +
+                  " distance: {:.1f} MiB".format(result['distance'] / 2 ** 20))
+
+
+def write_sample_dds(file_path, fourcc, size, seed=0):
+    """
+    Write a square DDS image with random blocks
+    """
+    block_size = 8 if fourcc == 'DXT1' else 16
+    rng = random.Random(seed)
+    with open(file_path, 'wb') as f:
+        f.write(DDSReader.DDS_MAGIC + struct.pack('<7I', 124, 0x81007, size, size, 0, 0, 1) + bytes(44))
+        f.write(struct.pack('<2I4s5I', 32, DDSReader.DDSF_FOURCC, fourcc.encode('ascii'), 0, 0, 0, 0, 0))
+        f.write(struct.pack('<5I', DDSReader.DDSCAPS_TEXTURE, 0, 0, 0, 0))
+        f.write(bytes(rng.getrandbits(8) for _ in range((size // 4) ** 2 * block_size)))
+
+
+def benchmark_dds_decode(size=256, repeat=3):
+    """
+    Decode DXT images with every available engine
+    """
+    size = int(size)
+    repeat = int(repeat)
+    engines = [engine for engine in DDSReader.ENGINES if engine != 'numpy' or DDSReader.has_numpy()]
+    with tempfile.TemporaryDirectory() as directory:
+        print("DDS decode, " + str(size) + "x" + str(size))
+        for fourcc in ('DXT1', 'DXT3', 'DXT5'):
+            file_path = os.path.join(directory, fourcc + '.dds')
+            write_sample_dds(file_path, fourcc, size)
+            for engine in engines:
+                def decode():
+                    with contextlib.redirect_stdout(io.StringIO()):  # No info messages
+                        DDSReader(file_path, engine=engine).get_png_data()
+                decode_time = best_time(decode, repeat)
+                print("  " + fourcc + " " + engine.ljust(7) + " {:.1f} ms".format(decode_time * 1000))
+
+
+BENCHMARKS = {
+    'dds_decode': benchmark_dds_decode,
+    'gfs_header': benchmark_gfs_header,
+    'gfs_order': benchmark_gfs_order,
+}
+
+if __name__ == "__main__":
+    # Arguments that aren't benchmark names belong to the benchmark before them
+    runs = []
+    for argument in sys.argv[1:]:
+        if argument in BENCHMARKS:
+            runs.append((argument, []))
+        elif runs:
+            runs[-1][1].append(argument)
+        else:
+            print("Unknown benchmark: " + argument + ", available: " + ', '.join(BENCHMARKS))
+            sys.exit(1)
+    for name, arguments in runs or [(name, []) for name in BENCHMARKS]:
+        BENCHMARKS[name](*arguments)
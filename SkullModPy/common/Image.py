@@ -0,0 +1,106 @@
+from array import array
+
+
+class Image:
+    """
+    Image with one int per pixel (abgr8, rgb565 for charselect dds before the palette is applied)
+    The pixels are stored in one flat array('I'), row after row, a row starts every stride pixels
+    (stride can be larger than width, like for padded DXT images, the pixels after width are ignored)
+    The array supports the buffer protocol (memoryview(image.data)), a 4096x4096 image takes 64 MiB
+    """
+    __slots__ = ('width', 'height', 'stride', 'data')
+
+    def __init__(self, width, height, data=None, stride=None):
+        """
+        :raise ValueError: Negative size, stride smaller than width or not enough pixels in data
+        :param data: array('I') of the pixels (used as it is, not copied), a transparent image is made if None
+        :param stride: Pixels from the start of a row to the start of the next one, default: width
+        """
+        stride = width if stride is None else stride
+        if width < 0 or height < 0 or stride < width:
+            raise ValueError("Invalid image size")
+        if data is None:
+            data = array('I', bytes(stride * height * 4))
+        elif len(data) < stride * height:
+            raise ValueError("Image data is shorter than the image")
+        self.width = width
+        self.height = height
+        self.stride = stride
+        self.data = data
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        :param rows: 2D array (first dimension ... y, second ... x), every row has the same length
+        """
+        data = array('I')
+        for row in rows:
+            data.extend(row)
+        return cls(len(rows[0]) if rows else 0, len(rows), data)
+
+    def __buffer__(self, flags):  # Python 3.12+, memoryview(image)
+        return memoryview(self.data)
+
+    def get_pixel(self, x, y):
+        return self.data[y * self.stride + x]
+
+    def set_pixel(self, x, y, color):
+        self.data[y * self.stride + x] = color
+
+    def get_row(self, y):
+        """
+        :return: Copy of a row (array('I') with width pixels)
+        """
+        start = y * self.stride
+        return self.data[start:start + self.width]
+
+    def tolist(self):
+        """
+        :return: 2D array (first dimension ... y, second ... x)
+        """
+        return [self.get_row(y).tolist() for y in range(self.height)]
+
+    def crop(self, width, height):
+        """
+        Use only the top left part of the image, the pixels are shared (not copied)
+        :raise ValueError: The size is larger than the image
+        """
+        if width > self.width or height > self.height:
+            raise ValueError("Cropped image is larger than the image")
+        return Image(width, height, self.data, self.stride)
+
+    def get_region(self, x, y, width, height):
+        """
+        :raise ValueError: The rectangle is not inside the image
+        :return: Copy of a rectangle of the image
+        """
+        if x < 0 or y < 0 or width < 0 or height < 0 or x + width > self.width or y + height > self.height:
+            raise ValueError("Region is outside of the image")
+        if x == 0 and width == self.stride:
+            return Image(width, height, self.data[y * width:(y + height) * width])
+        data = array('I')
+        for row in range(y, y + height):
+            start = row * self.stride + x
+            data.extend(self.data[start:start + width])
+        return Image(width, height, data)
+
+    def paste(self, image, x, y):
+        """
+        Copy an image into this image, row by row
+        :raise ValueError: The image doesn't fit at the position
+        """
+        if x < 0 or y < 0 or x + image.width > self.width or y + image.height > self.height:
+            raise ValueError("Pasted image is outside of the image")
+        width = image.width
+        for row in range(image.height):
+            start = (y + row) * self.stride + x
+            source_start = row * image.stride
+            self.data[start:start + width] = image.data[source_start:source_start + width]
+
+    def map(self, function):
+        """
+        :param function: Applied to every pixel (like a palette lookup)
+        :return: New image with the results
+        """
+        return Image(self.width, self.height, array('I', map(function, self.data[:self.stride * self.height])),
+                     self.stride)
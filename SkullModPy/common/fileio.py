@@ -0,0 +1,101 @@
+import errno
+import hashlib
+import os
+
+# Chunk size for the buffered fallback
+BUFFER_SIZE = 2 ** 20
+
+# Errors that mean "this way of copying isn't supported here", try the next one
+_UNSUPPORTED_ERRORS = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF)
+
+
+def copy_range(source_fd, destination_fd, source_offset, destination_offset, length_in_bytes, positional=False):
+    """
+    Copy bytes from one file to another at absolute positions
+    Tries os.copy_file_range, then os.sendfile and finally a buffered copy (the only one available on Windows)
+    Gaps in the destination are not filled, they become holes or zeros depending on the file system
+    The file position of the source is not used, the one of the destination may be changed (see positional)
+    :raise ValueError: The source ended before length_in_bytes were copied
+    :param source_fd: File descriptor to read from
+    :param destination_fd: File descriptor to write to
+    :param source_offset: Position in the source file
+    :param destination_offset: Position in the destination file
+    :param length_in_bytes: Number of bytes to copy
+    :param positional: Never use the file position of the destination (skips os.sendfile),
+                       required if other threads write to the same file descriptor
+    """
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        copied = _copy_loop(lambda offset, count: os.copy_file_range(source_fd, destination_fd, count,
+                                                                     source_offset + offset,
+                                                                     destination_offset + offset),
+                            copied, length_in_bytes)
+    if copied < length_in_bytes and hasattr(os, 'sendfile') and not positional:
+        os.lseek(destination_fd, destination_offset + copied, os.SEEK_SET)
+        copied = _copy_loop(lambda offset, count: os.sendfile(destination_fd, source_fd, source_offset + offset,
+                                                              count),
+                            copied, length_in_bytes)
+    while copied < length_in_bytes:
+        data = pread(source_fd, min(BUFFER_SIZE, length_in_bytes - copied), source_offset + copied)
+        if not data:
+            raise ValueError("Source file ended before all bytes were copied")
+        pwrite(destination_fd, data, destination_offset + copied)
+        copied += len(data)
+
+
+def _copy_loop(copy_function, copied, length_in_bytes):
+    """
+    Call copy_function(offset, count) until everything is copied, it fails or copies nothing
+    :return: Number of bytes copied so far
+    """
+    try:
+        while copied < length_in_bytes:
+            # Kernel copies are limited to a bit less than 2 GB per call on Linux
+            count = copy_function(copied, min(length_in_bytes - copied, 2 ** 30))
+            if count == 0:
+                break
+            copied += count
+    except OSError as e:
+        if e.errno not in _UNSUPPORTED_ERRORS:
+            raise
+    return copied
+
+
+def pread(fd, length_in_bytes, offset):
+    """
+    Positional read, falls back to seek+read if os.pread isn't available (moves the file position)
+    """
+    if hasattr(os, 'pread'):
+        return os.pread(fd, length_in_bytes, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, length_in_bytes)
+
+
+def pwrite(fd, data, offset):
+    """
+    Positional write of all bytes, falls back to seek+write if os.pwrite isn't available (moves the file position)
+    """
+    view = memoryview(data)
+    while len(view) > 0:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+def get_file_hash(file_path, algorithm='sha256'):
+    """
+    :param file_path: File to hash
+    :param algorithm: Any algorithm supported by hashlib
+    :return: Hex digest of the file content
+    """
+    file_hash = hashlib.new(algorithm)
+    with open(file_path, 'rb') as f:
+        data = f.read(BUFFER_SIZE)
+        while data:
+            file_hash.update(data)
+            data = f.read(BUFFER_SIZE)
+    return file_hash.hexdigest()
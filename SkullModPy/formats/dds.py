@@ -1,8 +1,17 @@
 import os
+import sys
+from array import array
+from collections import OrderedDict
 from SkullModPy.common.CommonConstants import LITTLE_ENDIAN
+from SkullModPy.common.Image import Image
 from SkullModPy.common.Reader import Reader
 from SkullModPy.common.helper import *  # includes struct and math
-from SkullModPy.formats.png import PNGWriter
+from SkullModPy.formats import dxt
+from SkullModPy.formats.png import PNGStreamWriter, PNGWriter
+try:
+    from SkullModPy.formats import dxt_numpy
+except ImportError:  # NumPy is optional
+    dxt_numpy = None
 
 
 class DDSReader(Reader):
@@ -54,90 +63,170 @@ class DDSReader(Reader):
     DDSCAPS2_CUBEMAP_NEGATIVEZ = 0x8000
     DDSCAPS2_VOLUME = 0x200000
 
-    def __init__(self, file_path, charselect=False):
+    # Decoders, python: block by block/pixel by pixel, table: lookup tables (see dxt.py),
+    # numpy: all blocks at once (requires NumPy), uncompressed images are converted in bulk by table and numpy
+    ENGINES = ('python', 'table', 'numpy')
+    # Rows of an uncompressed image that are converted at once by write_png_stream()
+    BAND_HEIGHT = 64
+
+    def __init__(self, file_path, charselect=False, engine=None):
+        """
+        :raise ValueError: Unknown engine or NumPy is not installed
+        :param engine: One of ENGINES, default: numpy if NumPy is installed, table otherwise
+        """
+        if engine is None:
+            engine = 'numpy' if dxt_numpy is not None else 'table'
+        if engine not in DDSReader.ENGINES:
+            raise ValueError("Unknown DDS engine: " + str(engine))
+        if engine == 'numpy' and dxt_numpy is None:
+            raise ValueError("The numpy DDS engine requires NumPy")
         super().__init__(open(file_path, "rb"), os.path.getsize(file_path), LITTLE_ENDIAN)
         self.file_path = os.path.abspath(file_path)
         self.charselect = charselect
-
-    def check_destination(self):
-        png_path = os.path.splitext(self.file_path)[0] + '.png'
+        self.engine = engine
+
+    @staticmethod
+    def has_numpy():
+        return dxt_numpy is not None
+
+    def get_png_path(self, level=0):
+        """
+        :return: Path of the png of a mip level, image.png for the first one and image.mipN.png for the others
+        """
+        if level == 0:
+            return os.path.splitext(self.file_path)[0] + '.png'
+        return os.path.splitext(self.file_path)[0] + '.mip' + str(level) + '.png'
+
+    def check_destination(self, level=0):
+        png_path = self.get_png_path(level)
         if os.path.exists(png_path) and os.path.isfile(png_path):
             print("Found a file at given path, will be overwritten")
         if os.path.exists(png_path) and not os.path.isfile(png_path):
             raise FileExistsError("Can not create dds file, there is a folder in the way with the same name")
 
-    def get_png_data(self):
-        # FOURCC check
-        if self.file.read(4) != DDSReader.DDS_MAGIC:
-            raise ValueError("Not a valid DDS file")
-
-        # === HEADER ===
-        if self.read_int() != 124:
-            raise ValueError("Not a valid DDS header")
-
-        dds_flags = self.read_int()
-
-        dds_has_caps = True if dds_flags & DDSReader.DDS_CAPS_FLAG else False
-        dds_has_height = True if dds_flags & DDSReader.DDS_HEIGHT_FLAG else False
-        dds_has_width = True if dds_flags & DDSReader.DDS_WIDTH_FLAG else False
-        dds_has_pitch = True if dds_flags & DDSReader.DDS_PITCH_FLAG else False
-        dds_has_pixelformat = True if dds_flags & DDSReader.DDS_PIXELFORMAT_FLAG else False
-        dds_has_mipmapcount = True if dds_flags & DDSReader.DDS_MIPMAPCOUNT_FLAG else False
-        dds_has_depth = True if dds_flags & DDSReader.DDS_DEPTH_FLAG else False
-
-        if dds_flags & ~(DDSReader.DDS_CAPS_FLAG | DDSReader.DDS_HEIGHT_FLAG | DDSReader.DDS_WIDTH_FLAG |
-                         DDSReader.DDS_PITCH_FLAG | DDSReader.DDS_PIXELFORMAT_FLAG |
-                         DDSReader.DDS_MIPMAPCOUNT_FLAG | DDSReader.DDS_DEPTH_FLAG) != 0:
+    def get_png_data(self, level=0):
+        """
+        :raise ValueError: Not a valid DDS file, an unsupported header or the file has no such mip level
+        :param level: Mip level, 0 is the full size image
+        :return: [image, width, height, fourcc] of the level, the Image is cropped to width and height
+        """
+        header = self.read_header()
+        image = self.read_image_data(header, level)
+        self.file.close()  # Close dds file
+        width, height = header.get_level_dimensions(level)
+        return [image.crop(width, height), width, height, header.fourcc]
+
+    def iter_png_data(self):
+        """
+        Decode every mip level, the file is closed after the last one
+        :raise ValueError: Not a valid DDS file or an unsupported header
+        :return: Generator of (level, [image, width, height, fourcc])
+        """
+        header = self.read_header()
+        try:
+            for level in range(header.get_mipmap_count()):
+                width, height = header.get_level_dimensions(level)
+                yield level, [self.read_image_data(header, level).crop(width, height), width, height, header.fourcc]
+        finally:
+            self.file.close()
+
+    def read_header(self):
+        """
+        Read the header with a single read and print what is worth knowing about it
+        :raise ValueError: Not a valid DDS file or an unsupported header
+        :return: DDSHeader
+        """
+        self.file.seek(0)
+        header = DDSHeader.from_bytes(self.file.read(DDSHeader.SIZE))
+        if header.has_unknown_flags():
             print("Info: An unknown bit is set in dds_flags, this is common")
-
-        # TODO check all flags for validity of dds_flags (and other combinations as well) and the vars below as well
-
-        dds_height = self.read_int()
-        dds_width = self.read_int()
-        dds_pitch_or_linear_size = self.read_int()
-        dds_depth = self.read_int()
-        dds_mipmapcount = self.read_int()
-
-        # 11 * 4 bytes of reserved fields
-        dds_reserved1 = self.file.read(11 * 4)
-        if dds_reserved1[36:40] == DDSReader.NVTT:
-            # See src/nvimage/DirectDrawSurface.cpp of NVTT for details
-            print("Info: DDS was made with Nvidia texture tools version " + str(dds_reserved1[42]) + "." +
-                  str(dds_reserved1[41]) + "." + str(dds_reserved1[40]))
-
-        # DDS Pixelformat
-        if self.read_int() != 32:
-            raise ValueError("DDS Pixelformat has an invalid length")
-        pixelformat_flags = self.read_int()
-
-        ddsf_has_alphapixels = True if pixelformat_flags & DDSReader.DDSF_ALPHAPIXELS else False
-        ddsf_has_alpha = True if pixelformat_flags & DDSReader.DDSF_ALPHA else False
-        ddsf_has_fourcc = True if pixelformat_flags & DDSReader.DDSF_FOURCC else False
-        ddsf_has_rgb = True if pixelformat_flags & DDSReader.DDSF_RGB else False
-        ddsf_has_yuv = True if pixelformat_flags & DDSReader.DDSF_YUV else False
-        ddsf_has_luminance = True if pixelformat_flags & DDSReader.DDSF_LUMINANCE else False
-
-        # Valid when dds_has_fourcc = True
-        dds_fourcc = str(self.file.read(4), encoding='ascii')
-
-        if dds_fourcc == 'DX10':
+        nvtt_version = header.get_nvtt_version()
+        if nvtt_version is not None:
+            print("Info: DDS was made with Nvidia texture tools version " + '.'.join(map(str, nvtt_version)))
+        if header.fourcc == 'DX10':
             print("Warning: Detected Direct X 10 dds, parsing will stop after normal header")
-
-        ddsf_bitcount = self.read_int()
-        ddsf_r_bitmask = self.read_int()
-        ddsf_g_bitmask = self.read_int()
-        ddsf_b_bitmask = self.read_int()
-        ddsf_a_bitmask = self.read_int()
-
-        if dds_fourcc == 'DX10':
             raise ValueError("Direct X 10 headers are not supported yet")
-
-        # DDS Header again
-        dds_caps1 = self.read_int()
-        dds_caps2 = self.read_int()
-        dds_caps3 = self.read_int()
-        dds_caps4 = self.read_int()
-        dds_reserved2 = self.read_int()
+        return header
+
+    def probe(self):
+        """
+        Read only the header, nothing is decoded or printed and the file stays open
+        :raise ValueError: Not a valid DDS file
+        :return: Dict of the image properties, see DDSHeader.get_info()
+        """
+        self.file.seek(0)
+        return DDSHeader.from_bytes(self.file.read(DDSHeader.SIZE)).get_info()
+
+    def get_image(self, cache_size=None, transform=None, level=0):
+        """
+        Open the image (or one of its mip levels) without decoding it, see DDSImage
+        :raise ValueError: Not a valid DDS file, an unsupported header or the file has no such mip level
+        """
+        return DDSImage(self, self.read_header(), cache_size, transform, level)
+
+    def decode_blocks(self, fourcc, data, x_blocks, y_blocks, has_alpha_pixels):
+        """
+        Decode DXT blocks with the table or numpy engine (the python engine has no block decoder, table is used)
+        :return: Flat array('I') of abgr8, row after row, the width is x_blocks * 4
+        """
+        if self.engine == 'numpy':
+            return array('I', dxt_numpy.decode(fourcc, data, x_blocks, y_blocks, has_alpha_pixels).tobytes())
+        return dxt.decode(fourcc, data, x_blocks, y_blocks, has_alpha_pixels)
+
+    def read_pixels(self, n_of_bytes):
+        """
+        Read the pixels of an uncompressed image (or a row of DXT blocks) with a single read
+        :raise ValueError: The file ends before the image
+        """
+        data = bytearray(n_of_bytes)
+        if self.file.readinto(data) != n_of_bytes:
+            raise ValueError("DDS file is shorter than its image data")
+        return data
+
+    def read_argb8(self, n_of_pixels):
+        """
+        Read uncompressed argb8 pixels, red and blue are swapped on byte level
+        :return: Flat array('I') of abgr8
+        """
+        data = self.read_pixels(n_of_pixels * 4)
+        red = data[2::4]
+        data[2::4] = data[0::4]  # Blue
+        data[0::4] = red
+        image = array('I', bytes(data))
+        if sys.byteorder == 'big':
+            image.byteswap()
+        return image
+
+    def read_rgb565(self, n_of_pixels):
+        """
+        Read uncompressed rgb565 pixels, they are converted with a lookup table (kept as they are for charselect)
+        :return: Flat array('I') of abgr8 (rgb565 for charselect)
+        """
+        colors = array('H', bytes(self.read_pixels(n_of_pixels * 2)))
+        if sys.byteorder == 'big':
+            colors.byteswap()
+        if self.charselect:
+            return array('I', colors)
+        return array('I', map(dxt.get_rgb565_table().__getitem__, colors))
+
+    def read_image_data(self, header, level=0):
+        """
+        Decode the image, the file is positioned at the start of the mip level first (the other levels are skipped)
+        :raise ValueError: The file has no such mip level or unknown image compression
+        :param header: DDSHeader of the file
+        :param level: Mip level, 0 is the full size image
+        :return: Image with abgr8 int (or rgb565 for charselect), DXT images have a size that is a multiple of 4
+        """
+        self.file.seek(header.get_level_offset(level))
+        dds_width, dds_height = header.get_level_dimensions(level)
+        dds_fourcc = header.fourcc
+        ddsf_has_alphapixels = header.has_alpha_pixels()
+        ddsf_has_rgb = True if header.pixelformat_flags & DDSReader.DDSF_RGB else False
+        ddsf_bitcount = header.bitcount
+        ddsf_r_bitmask = header.r_bitmask
+        ddsf_g_bitmask = header.g_bitmask
+        ddsf_b_bitmask = header.b_bitmask
+        ddsf_a_bitmask = header.a_bitmask
 
         # Start reading
         # Image height has to be a multiple of 4 for DXT1/3/5, ignored for anything else
@@ -147,14 +236,21 @@ class DDSReader(Reader):
         y_blocks = image_height // 4
         x_blocks = image_width // 4
 
-        if dds_fourcc == 'DXT1' or dds_fourcc == 'DXT3' or dds_fourcc == 'DXT5':
+        use_decoder = self.engine != 'python' and dds_fourcc in dxt.DECODERS
+        if use_decoder:
+            image_data = None  # Made by the decoder
+        elif dds_fourcc == 'DXT1' or dds_fourcc == 'DXT3' or dds_fourcc == 'DXT5':
             # Array of pixeldata, packed abgr8 is used because no conversion is needed for png
             image_data = [[0] * image_width for _ in range(image_height)]
         else:
             # Assuming uncompressed argb data
             image_data = [[0] * dds_width for _ in range(dds_height)]
 
-        if dds_fourcc == 'DXT5':
+        if use_decoder:
+            block_data = self.file.read(x_blocks * y_blocks * dxt.DECODERS[dds_fourcc][0])
+            image = self.decode_blocks(dds_fourcc, block_data, x_blocks, y_blocks, ddsf_has_alphapixels)
+            image_data = Image(image_width, image_height, image)
+        elif dds_fourcc == 'DXT5':
             for block in range(x_blocks * y_blocks):  # For each block
                 a = [0 for _ in range(8)]
                 c = [0 for _ in range(4)]
@@ -308,6 +404,10 @@ class DDSReader(Reader):
                         color_index = color_indices[y_block_pos * 4 + x_block_pos]
                         # Beware: x and y are flipped
                         image_data[x_pos][y_pos] = c[color_index]
+        elif self.engine != 'python' and header.is_argb8():
+            image_data = Image(dds_width, dds_height, self.read_argb8(dds_width * dds_height))
+        elif self.engine != 'python' and header.is_rgb565():
+            image_data = Image(dds_width, dds_height, self.read_rgb565(dds_width * dds_height))
         elif ddsf_has_rgb and ddsf_bitcount == 32 and ddsf_r_bitmask == 0xFF0000 and ddsf_g_bitmask == 0xFF00 and ddsf_b_bitmask == 0xFF and ddsf_a_bitmask == 0xFF000000:
             # Uncompressed argb8
             for y in range(dds_height):
@@ -331,12 +431,322 @@ class DDSReader(Reader):
                                                               (color & ddsf_b_bitmask)))
         else:
             raise ValueError("Unknown image compression used")
+        if isinstance(image_data, list):  # Decoded pixel by pixel
+            return Image.from_rows(image_data)
+        return image_data
 
-        self.file.close()  # Close dds file
-        return [image_data, dds_width, dds_height, dds_fourcc]
-
-    def write_png(self, data):
+    def write_png(self, data, level=0):
         # Write png
-        png = PNGWriter(os.path.splitext(self.file_path)[0] + '.png')
-        png.set_data_argb8_array(data[0], data[1], data[2])  # Truncate pixels that are not required
+        png = PNGWriter(self.get_png_path(level))
+        png.set_image(data[0].crop(data[1], data[2]))  # Truncate pixels that are not required
         png.write()
+
+    def write_png_stream(self, levels=None):
+        """
+        Decode mip levels straight into png files (see get_png_path()), the file is closed afterwards
+        A band of rows is decoded and compressed at a time (a row of blocks for DXT), the whole image is never
+        in memory (except for the python engine, it decodes the whole image first)
+        :raise ValueError: Not a valid DDS file, an unsupported header or the file has no such mip level
+        :param levels: Mip levels, default: all levels
+        """
+        header = self.read_header()
+        try:
+            for level in range(header.get_mipmap_count()) if levels is None else levels:
+                header.get_level_offset(level)  # Raises an error before the png is created
+                width, height = header.get_level_dimensions(level)
+                with PNGStreamWriter(self.get_png_path(level), width, height) as png:
+                    for band in self.iter_bands(header, level):
+                        png.write_rows(band)
+        finally:
+            self.file.close()
+
+    def iter_bands(self, header, level=0):
+        """
+        Decode a mip level band after band, from top to bottom
+        :return: Generator of Images (as wide as the level, cropped to its size)
+        """
+        self.file.seek(header.get_level_offset(level))
+        width, height = header.get_level_dimensions(level)
+        if self.engine == 'python':
+            yield self.read_image_data(header, level).crop(width, height)
+        elif header.fourcc in dxt.DECODERS:
+            x_blocks = (width + 3) // 4
+            row_length = x_blocks * dxt.DECODERS[header.fourcc][0]
+            for y in range(0, height, 4):
+                pixels = self.decode_blocks(header.fourcc, self.read_pixels(row_length), x_blocks, 1,
+                                            header.has_alpha_pixels())
+                yield Image(width, min(4, height - y), pixels, x_blocks * 4)
+        elif header.is_argb8() or header.is_rgb565():
+            read_pixels = self.read_argb8 if header.is_argb8() else self.read_rgb565
+            for y in range(0, height, DDSReader.BAND_HEIGHT):
+                band_height = min(DDSReader.BAND_HEIGHT, height - y)
+                yield Image(width, band_height, read_pixels(width * band_height))
+        else:
+            raise ValueError("Unknown image compression used")
+
+
+class DDSHeader:
+    """
+    The first 128 bytes of a DDS file (magic, header and pixel format)
+    """
+    SIZE = 128
+    # magic, size, flags, height, width, pitch/linear size, depth, mipmap count, reserved (11 ints),
+    # pixel format: size, flags, fourcc, bitcount, r/g/b/a bitmasks, caps 1-4, reserved
+    HEADER = struct.Struct(LITTLE_ENDIAN + '4s7I44s2I4s5I5I')
+    DXT_FOURCCS = ('DXT1', 'DXT3', 'DXT5')
+
+    def __init__(self, flags, height, width, pitch_or_linear_size, depth, mipmap_count, reserved1,
+                 pixelformat_flags, fourcc, bitcount, r_bitmask, g_bitmask, b_bitmask, a_bitmask,
+                 caps1, caps2, caps3, caps4):
+        self.flags = flags
+        self.height = height
+        self.width = width
+        self.pitch_or_linear_size = pitch_or_linear_size
+        self.depth = depth
+        self.mipmap_count = mipmap_count
+        self.reserved1 = reserved1
+        self.pixelformat_flags = pixelformat_flags
+        self.fourcc = fourcc  # Valid when DDSF_FOURCC is set
+        self.bitcount = bitcount
+        self.r_bitmask = r_bitmask
+        self.g_bitmask = g_bitmask
+        self.b_bitmask = b_bitmask
+        self.a_bitmask = a_bitmask
+        self.caps1 = caps1
+        self.caps2 = caps2
+        self.caps3 = caps3
+        self.caps4 = caps4
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        :raise ValueError: Not a valid DDS file
+        :param data: At least the first 128 bytes of the file
+        """
+        if len(data) < DDSHeader.SIZE or data[:4] != DDSReader.DDS_MAGIC:
+            raise ValueError("Not a valid DDS file")
+        (_, header_size, flags, height, width, pitch_or_linear_size, depth, mipmap_count, reserved1,
+         pixelformat_size, pixelformat_flags, fourcc, bitcount, r_bitmask, g_bitmask, b_bitmask, a_bitmask,
+         caps1, caps2, caps3, caps4, _) = DDSHeader.HEADER.unpack_from(data)
+        if header_size != DDSReader.DDS_HEADER_SIZE:
+            raise ValueError("Not a valid DDS header")
+        if pixelformat_size != 32:
+            raise ValueError("DDS Pixelformat has an invalid length")
+        return cls(flags, height, width, pitch_or_linear_size, depth, mipmap_count, reserved1, pixelformat_flags,
+                   str(fourcc, encoding='ascii'), bitcount, r_bitmask, g_bitmask, b_bitmask, a_bitmask,
+                   caps1, caps2, caps3, caps4)
+
+    def has_unknown_flags(self):
+        return self.flags & ~(DDSReader.DDS_CAPS_FLAG | DDSReader.DDS_HEIGHT_FLAG | DDSReader.DDS_WIDTH_FLAG |
+                              DDSReader.DDS_PITCH_FLAG | DDSReader.DDS_PIXELFORMAT_FLAG |
+                              DDSReader.DDS_MIPMAPCOUNT_FLAG | DDSReader.DDS_DEPTH_FLAG) != 0
+
+    def has_alpha_pixels(self):
+        return True if self.pixelformat_flags & DDSReader.DDSF_ALPHAPIXELS else False
+
+    def get_nvtt_version(self):
+        """
+        See src/nvimage/DirectDrawSurface.cpp of NVTT for details
+        :return: (major, minor, revision) if the file was made with the Nvidia texture tools, None otherwise
+        """
+        if self.reserved1[36:40] != DDSReader.NVTT:
+            return None
+        return self.reserved1[42], self.reserved1[41], self.reserved1[40]
+
+    def is_argb8(self):
+        return self.pixelformat_flags & DDSReader.DDSF_RGB and self.bitcount == 32 and \
+            self.r_bitmask == 0xFF0000 and self.g_bitmask == 0xFF00 and self.b_bitmask == 0xFF and \
+            self.a_bitmask == 0xFF000000
+
+    def is_rgb565(self):
+        return self.pixelformat_flags & DDSReader.DDSF_RGB and self.bitcount == 16 and \
+            self.r_bitmask == 0xF800 and self.g_bitmask == 0x7E0 and self.b_bitmask == 0x1F and self.a_bitmask == 0
+
+    def is_dxt(self):
+        return self.fourcc in DDSHeader.DXT_FOURCCS
+
+    def get_block_size(self):
+        """
+        :return: Bytes per 4x4 block of a DXT image
+        """
+        return 8 if self.fourcc == 'DXT1' else 16
+
+    def get_format(self):
+        """
+        :return: FOURCC, ARGB8 or RGB565 for the supported uncompressed formats, RGB + bitcount for other ones
+        """
+        if self.pixelformat_flags & DDSReader.DDSF_FOURCC:
+            return self.fourcc
+        if self.is_argb8():
+            return 'ARGB8'
+        if self.is_rgb565():
+            return 'RGB565'
+        return 'RGB' + str(self.bitcount)
+
+    def get_info(self):
+        """
+        :return: Dict with width, height, format, mipmap_count, nvtt_version (like '2.0.8' or None),
+                 alpha_pixels and data_length (bytes of all mip levels)
+        """
+        nvtt_version = self.get_nvtt_version()
+        mipmap_count = self.get_mipmap_count()
+        return {'width': self.width, 'height': self.height, 'format': self.get_format(),
+                'mipmap_count': mipmap_count,
+                'nvtt_version': None if nvtt_version is None else '.'.join(map(str, nvtt_version)),
+                'alpha_pixels': self.has_alpha_pixels(),
+                'data_length': sum(self.get_level_length(level) for level in range(mipmap_count))}
+
+    def get_mipmap_count(self):
+        """
+        :return: Number of mip levels in the file (1 if there are no mipmaps)
+        """
+        if self.flags & DDSReader.DDS_MIPMAPCOUNT_FLAG or self.caps1 & DDSReader.DDSCAPS_MIPMAP:
+            return max(self.mipmap_count, 1)
+        return 1
+
+    def get_level_dimensions(self, level):
+        """
+        Every level is half as large as the one before it (rounded down), but at least 1x1
+        :return: (width, height) of a mip level
+        """
+        return max(self.width >> level, 1), max(self.height >> level, 1)
+
+    def get_level_length(self, level):
+        """
+        :return: Bytes of the image data of a mip level
+        """
+        width, height = self.get_level_dimensions(level)
+        if self.is_dxt():
+            return ((width + 3) // 4) * ((height + 3) // 4) * self.get_block_size()
+        return width * height * ((self.bitcount + 7) // 8)
+
+    def get_level_offset(self, level):
+        """
+        The levels are stored one after another, largest first
+        :raise ValueError: The file has no such level
+        :return: Position of the image data of a mip level in the file
+        """
+        if not 0 <= level < self.get_mipmap_count():
+            raise ValueError("DDS file has no mip level " + str(level) + " (" + str(self.get_mipmap_count()) +
+                             " levels)")
+        return DDSHeader.SIZE + sum(self.get_level_length(i) for i in range(level))
+
+
+class DDSImage:
+    """
+    Lazy DDS image, the header is parsed once and only the 4x4 blocks that are used are decoded
+    Decoded blocks are kept in a bounded cache (least recently used blocks are removed first)
+    Images that are not DXT compressed are decoded completely on first use
+    """
+    DEFAULT_CACHE_SIZE = 16384  # Blocks, 1 MiB of pixels
+
+    def __init__(self, reader, header, cache_size=None, transform=None, level=0):
+        """
+        :raise ValueError: The file has no such mip level
+        :param reader: DDSReader, the file is kept open until close()
+        :param header: DDSHeader of the file
+        :param cache_size: Maximum number of decoded blocks that are kept
+        :param transform: Function that is applied to every decoded pixel (like a palette lookup)
+        :param level: Mip level, 0 is the full size image
+        """
+        self.reader = reader
+        self.header = header
+        self.level = level
+        self.offset = header.get_level_offset(level)
+        level_width, level_height = header.get_level_dimensions(level)
+        self.cache_size = DDSImage.DEFAULT_CACHE_SIZE if cache_size is None else cache_size
+        self.transform = transform
+        self.blocks = OrderedDict()  # (x_block, y_block) ==> array('I') of 16 pixels, row after row
+        self.image = None  # Images without blocks
+        if header.is_dxt():
+            # Image size has to be a multiple of 4 for DXT1/3/5
+            self.width = level_width + (4 - level_width % 4) % 4
+            self.height = level_height + (4 - level_height % 4) % 4
+        else:
+            self.width = level_width
+            self.height = level_height
+        self.x_blocks = self.width // 4
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_region(self, x, y, width, height):
+        """
+        Decode a rectangle of the image
+        :raise ValueError: The rectangle is not inside the image
+        :return: Image with abgr8 int
+        """
+        if x < 0 or y < 0 or width < 0 or height < 0 or x + width > self.width or y + height > self.height:
+            raise ValueError("Region is outside of the image")
+        if not self.header.is_dxt():
+            if self.image is None:
+                self.image = self.reader.read_image_data(self.header, self.level)
+                if self.transform is not None:
+                    self.image = self.image.map(self.transform)
+            return self.image.get_region(x, y, width, height)
+        region = array('I')
+        first_x_block = x // 4
+        x_in_blocks = x - first_x_block * 4
+        for y_block in range(y // 4, (y + height + 3) // 4):
+            blocks = self.get_blocks(first_x_block, (x + width + 3) // 4, y_block)
+            for y_in_block in range(max(y - y_block * 4, 0), min(y + height - y_block * 4, 4)):
+                start = y_in_block * 4
+                row = array('I')
+                for block in blocks:
+                    row += block[start:start + 4]
+                region += row[x_in_blocks:x_in_blocks + width]
+        return Image(width, height, region)
+
+    def get_blocks(self, first_x_block, end_x_block, y_block):
+        """
+        Get a horizontal run of blocks, blocks that are not cached are decoded with as few reads as possible
+        :return: List of blocks (array('I') of 16 pixels, row after row)
+        """
+        blocks = self.blocks
+        result = []
+        missing_start = None
+        for x_block in range(first_x_block, end_x_block):
+            block = blocks.get((x_block, y_block))
+            if block is None:
+                if missing_start is None:
+                    missing_start = x_block
+                continue
+            blocks.move_to_end((x_block, y_block))
+            if missing_start is not None:  # Decode the run before this block
+                result += self.decode_run(missing_start, x_block, y_block)
+                missing_start = None
+            result.append(block)
+        if missing_start is not None:
+            result += self.decode_run(missing_start, end_x_block, y_block)
+        while len(blocks) > self.cache_size:
+            blocks.popitem(last=False)
+        return result
+
+    def decode_run(self, first_x_block, end_x_block, y_block):
+        """
+        Decode the blocks [first_x_block, end_x_block) of a block row and cache them
+        """
+        n_of_blocks = end_x_block - first_x_block
+        block_size = self.header.get_block_size()
+        self.reader.file.seek(self.offset + (y_block * self.x_blocks + first_x_block) * block_size)
+        pixels = self.reader.decode_blocks(self.header.fourcc, self.reader.file.read(n_of_blocks * block_size),
+                                           n_of_blocks, 1, self.header.has_alpha_pixels())
+        if self.transform is not None:
+            pixels = array('I', map(self.transform, pixels))
+        row_length = n_of_blocks * 4
+        decoded = []
+        for i in range(n_of_blocks):
+            block = array('I')
+            for y_in_block in range(4):
+                start = y_in_block * row_length + i * 4
+                block += pixels[start:start + 4]
+            self.blocks[(first_x_block + i, y_block)] = block
+            decoded.append(block)
+        return decoded
+
+    def close(self):
+        self.reader.file.close()
+        self.blocks.clear()
@@ -0,0 +1,113 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from SkullModPy.formats.dds import DDSHeader
+from SkullModPy.formats.gfs import GFSReader
+
+# Columns of the table, the keys of a row are the same (see get_dds_info())
+INFO_COLUMNS = ('path', 'width', 'height', 'format', 'mipmap_count', 'nvtt_version', 'alpha_pixels', 'data_length',
+                'file_length')
+
+
+def get_dds_info(paths, workers=None):
+    """
+    Read the header of every DDS texture, only the first 128 bytes of each texture are read (in parallel)
+    :param paths: .dds files, .gfs files (their .dds entries are read) or directories (searched for both)
+    :param workers: Number of threads, default: number of CPUs
+    :return: List of dicts with path, file_length and DDSHeader.get_info() (or path and error), in order of paths
+    """
+    files = []
+    archives = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, dir_names, file_names in os.walk(path):
+                dir_names.sort()
+                for file_name in sorted(file_names):
+                    if is_dds_path(file_name) or is_gfs_path(file_name):
+                        files.append(os.path.join(dir_path, file_name))
+        else:
+            files.append(path)
+    tasks = []
+    try:
+        for path in files:
+            if not is_gfs_path(path):
+                tasks.append((path, None, path))
+                continue
+            try:
+                reader = GFSReader(path)
+            except OSError as e:
+                tasks.append((path, None, e))
+                continue
+            archives.append(reader)
+            try:
+                tasks += [(path + '/' + entry[2], reader, entry) for entry in reader.read_references()
+                          if is_dds_path(entry[2])]
+            except (OSError, ValueError) as e:  # The header of the archive can't be read
+                tasks.append((path, None, e))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda task: probe(*task), tasks))
+    finally:
+        for reader in archives:
+            reader.close()
+
+
+def probe(path, reader, source):
+    """
+    :param path: Path that is shown, archive path/entry path for entries
+    :param reader: Open GFSReader if source is an entry, None if it is a file path
+    :param source: Path to a .dds file, a metadata entry in form [offset,length,path,...]
+                   or the error of an archive that can't be read
+    :return: Dict for one row, see get_dds_info()
+    """
+    if isinstance(source, Exception):
+        return {'path': path, 'error': str(source)}
+    try:
+        if reader is None:
+            with open(source, 'rb') as f:
+                data = f.read(DDSHeader.SIZE)
+                file_length = os.fstat(f.fileno()).st_size
+        else:
+            data = reader.read_at(source[0], min(source[1], DDSHeader.SIZE))
+            file_length = source[1]
+        info = DDSHeader.from_bytes(data).get_info()
+    except (OSError, ValueError) as e:
+        return {'path': path, 'error': str(e)}
+    row = {'path': path}
+    row.update(info)
+    row['file_length'] = file_length
+    return row
+
+
+def is_dds_path(path):
+    return path.lower().endswith('.dds')
+
+
+def is_gfs_path(path):
+    return path.lower().endswith('.' + GFSReader.FILE_EXTENSION)
+
+
+def format_table(rows):
+    """
+    :return: Text table with one line per texture (the path is last, errors replace the other columns)
+             and a line with the totals
+    """
+    columns = INFO_COLUMNS[1:]
+    cells = [['-' if row.get(column) is None else str(row[column]) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(row_cells[i]) for row_cells in cells]) for i, column in enumerate(columns)]
+    lines = [' '.join(column.rjust(width) for column, width in zip(columns, widths)) + ' path']
+    errors = 0
+    data_length = 0
+    for row, row_cells in zip(rows, cells):
+        if 'error' in row:
+            errors += 1
+            lines.append(("error: " + row['error']).ljust(sum(widths) + len(widths) - 1) + ' ' + row['path'])
+            continue
+        data_length += row['data_length']
+        lines.append(' '.join(cell.rjust(width) for cell, width in zip(row_cells, widths)) + ' ' + row['path'])
+    lines.append(str(len(rows) - errors) + " textures, " + str(data_length) + " bytes of image data, " +
+                 str(errors) + " errors")
+    return '\n'.join(lines)
+
+
+def format_json(rows):
+    return json.dumps(rows, indent=1)
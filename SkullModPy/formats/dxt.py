@@ -0,0 +1,263 @@
+"""
+Table driven block decoders for DXT compressed DDS images (no dependencies)
+Colors are looked up in a rgb565 ==> abgr8 table, the interpolated palette colors in tables indexed by one channel
+of both colors, indices in byte ==> pixel row tables, the pixels are written into a flat array
+A block that is the same as the one before it (like in empty parts of sprites) reuses its rows
+The results are the same as the ones of the decoders in DDSReader (pixel for pixel)
+"""
+import struct
+import sys
+from array import array
+from operator import itemgetter
+from SkullModPy.common.helper import rgb565_to_abgr8
+
+DXT1_BLOCK = struct.Struct('<2H4B')  # c0, c1, one byte of color indices per row
+DXT3_BLOCK = struct.Struct('<8B2H4B')  # 8 bytes explicit alpha, colors
+DXT5_BLOCK = struct.Struct('<2BHI2H4B')  # a0, a1, alpha indices (16+32 bit), colors
+
+# Byte of color indices ==> getter for the 4 palette entries of the row
+COLOR_ROW_GETTERS = [itemgetter(byte & 3, (byte >> 2) & 3, (byte >> 4) & 3, byte >> 6) for byte in range(256)]
+# 12 bit alpha indices of a row ==> getter for the 4 alpha palette entries of the row
+ALPHA_ROW_GETTERS = [itemgetter(bits & 7, (bits >> 3) & 7, (bits >> 6) & 7, bits >> 9) for bits in range(4096)]
+# DXT3: byte of explicit alpha ==> alpha of two pixels (expanded to 8 bit)
+ALPHA_PAIRS = [((byte & 0xF) * 17, (byte >> 4) * 17) for byte in range(256)]
+# Position of the alpha byte in an abgr8 pixel of an array('I')
+ALPHA_BYTE = 3 if sys.byteorder == 'little' else 0
+# Interpolated palette colors: alpha of the colors and a function for each color that gets the 8 bit list of
+# a channel and the channel values of c0 and c1 (see get_color_tables())
+COLOR_INTERPOLATIONS = {
+    # 4 color DXT1 blocks: 2/3 c0 + 1/3 c1 and 1/3 c0 + 2/3 c1 of the 8 bit channels, truncated
+    'dxt1': (0xFF000000, (lambda channel, v0, v1: (2 * channel[v0] + channel[v1]) // 3,
+                          lambda channel, v0, v1: (channel[v0] + 2 * channel[v1]) // 3)),
+    # 3 color DXT1 blocks: 1/2 c0 + 1/2 c1 of the 8 bit channels, truncated
+    'dxt1_half': (0xFF000000, (lambda channel, v0, v1: (channel[v0] + channel[v1]) >> 1,)),
+    # DXT3: like dxt1 but rounded
+    'dxt3': (0, (lambda channel, v0, v1: (2 * channel[v0] + channel[v1] + 1) // 3,
+                 lambda channel, v0, v1: (channel[v0] + 2 * channel[v1] + 1) // 3)),
+    # DXT5: interpolated (and rounded) in 565 before expanding
+    'dxt5': (0, (lambda channel, v0, v1: channel[(2 * v0 + v1 + 1) // 3],
+                 lambda channel, v0, v1: channel[(v0 + 2 * v1 + 1) // 3])),
+}
+
+_rgb565_table = None
+_color_tables = {}
+
+
+def get_rgb565_table():
+    """
+    :return: Table of all rgb565 colors as abgr8 (created on first use)
+    """
+    global _rgb565_table
+    if _rgb565_table is None:
+        _rgb565_table = array('I', (rgb565_to_abgr8(color) for color in range(65536)))
+    return _rgb565_table
+
+
+def get_color_tables(name):
+    """
+    Tables for the interpolated colors of a palette (created on first use), the values are the abgr8 bits
+    of one channel, the color is red[r] | green[g] | blue[b] with the indices
+    r = c0 >> 11 | (c1 >> 6) & 0x3E0, g = (c0 >> 5) & 0x3F | (c1 << 1) & 0xFC0, b = c0 & 0x1F | (c1 & 0x1F) << 5
+    :param name: One of COLOR_INTERPOLATIONS
+    :return: Tuple of (red, green, blue) lists, one for each interpolated color, the alpha is in the red list
+    """
+    tables = _color_tables.get(name)
+    if tables is None:
+        rgb565_table = get_rgb565_table()
+        # 8 bit value of every value of a channel, number of bits of the channel, position in abgr8
+        channels = (([rgb565_table[value << 11] & 0xFF for value in range(32)], 5, 0),
+                    ([rgb565_table[value << 5] >> 8 & 0xFF for value in range(64)], 6, 8),
+                    ([rgb565_table[value] >> 16 & 0xFF for value in range(32)], 5, 16))
+        alpha, interpolations = COLOR_INTERPOLATIONS[name]
+        tables = _color_tables[name] = tuple(
+            tuple([(alpha if position == 0 else 0) |
+                   interpolate(channel, index & (1 << bits) - 1, index >> bits) << position
+                   for index in range(1 << 2 * bits)] for channel, bits, position in channels)
+            for interpolate in interpolations)
+    return tables
+
+
+def get_dxt5_alpha_palette(a0, a1):
+    """
+    :return: 8 alpha values
+    """
+    if a0 > a1:
+        return (a0, a1, (6 * a0 + a1) // 7, (5 * a0 + 2 * a1) // 7, (4 * a0 + 3 * a1) // 7,
+                (3 * a0 + 4 * a1) // 7, (2 * a0 + 5 * a1) // 7, (a0 + 6 * a1) // 7)
+    return a0, a1, (4 * a0 + a1) // 5, (3 * a0 + 2 * a1) // 5, (2 * a0 + 3 * a1) // 5, (a0 + 4 * a1) // 5, 0, 255
+
+
+def decode_dxt1(data, x_blocks, y_blocks, has_alpha_pixels=False):
+    """
+    :param data: Bytes of all blocks
+    :param has_alpha_pixels: DDSF_ALPHAPIXELS is set, color 3 is transparent instead of black in 3 color blocks
+    :return: Flat array('I') of abgr8, row after row, the width is x_blocks * 4
+    """
+    rgb565_table = get_rgb565_table()
+    (red2, green2, blue2), (red3, green3, blue3) = get_color_tables('dxt1')
+    (red_half, green_half, blue_half), = get_color_tables('dxt1_half')
+    transparent = 0 if has_alpha_pixels else 0xFF000000
+    row_getters = COLOR_ROW_GETTERS
+    image = array('I')
+    row_size = x_blocks * DXT1_BLOCK.size
+    for block_row in range(y_blocks):
+        row0, row1, row2, row3 = [], [], [], []
+        previous_block = None
+        for block in DXT1_BLOCK.iter_unpack(data[block_row * row_size:(block_row + 1) * row_size]):
+            if block != previous_block:
+                previous_block = block
+                c0, c1, i0, i1, i2, i3 = block
+                red = c0 >> 11 | (c1 >> 6) & 0x3E0
+                green = (c0 >> 5) & 0x3F | (c1 << 1) & 0xFC0
+                blue = c0 & 0x1F | (c1 & 0x1F) << 5
+                if c0 > c1:
+                    palette = (rgb565_table[c0], rgb565_table[c1], red2[red] | green2[green] | blue2[blue],
+                               red3[red] | green3[green] | blue3[blue])
+                else:
+                    palette = (rgb565_table[c0], rgb565_table[c1],
+                               red_half[red] | green_half[green] | blue_half[blue], transparent)
+                pixels0 = row_getters[i0](palette)
+                pixels1 = row_getters[i1](palette)
+                pixels2 = row_getters[i2](palette)
+                pixels3 = row_getters[i3](palette)
+            row0 += pixels0
+            row1 += pixels1
+            row2 += pixels2
+            row3 += pixels3
+        image.extend(row0)
+        image.extend(row1)
+        image.extend(row2)
+        image.extend(row3)
+    return image
+
+
+def decode_dxt3(data, x_blocks, y_blocks, has_alpha_pixels=False):
+    """
+    Explicit alpha, the first two rows use the alpha bytes of the second two rows and the other way round
+    (like DDSReader)
+    :return: Flat array('I') of abgr8, row after row, the width is x_blocks * 4
+    """
+    rgb565_table = get_rgb565_table()
+    (red2, green2, blue2), (red3, green3, blue3) = get_color_tables('dxt3')
+    row_getters = COLOR_ROW_GETTERS
+    alpha_pairs = ALPHA_PAIRS
+    image = array('I')
+    alpha = bytearray()
+    row_size = x_blocks * DXT3_BLOCK.size
+    for block_row in range(y_blocks):
+        row0, row1, row2, row3 = [], [], [], []
+        alpha_row0, alpha_row1, alpha_row2, alpha_row3 = [], [], [], []
+        previous_block = None
+        for block in DXT3_BLOCK.iter_unpack(data[block_row * row_size:(block_row + 1) * row_size]):
+            if block != previous_block:
+                previous_block = block
+                a0, a1, a2, a3, a4, a5, a6, a7, c0, c1, i0, i1, i2, i3 = block
+                red = c0 >> 11 | (c1 >> 6) & 0x3E0
+                green = (c0 >> 5) & 0x3F | (c1 << 1) & 0xFC0
+                blue = c0 & 0x1F | (c1 & 0x1F) << 5
+                palette = (rgb565_table[c0] & 0xFFFFFF, rgb565_table[c1] & 0xFFFFFF,
+                           red2[red] | green2[green] | blue2[blue], red3[red] | green3[green] | blue3[blue])
+                pixels0 = row_getters[i0](palette)
+                pixels1 = row_getters[i1](palette)
+                pixels2 = row_getters[i2](palette)
+                pixels3 = row_getters[i3](palette)
+                alpha0 = alpha_pairs[a2] + alpha_pairs[a3]
+                alpha1 = alpha_pairs[a0] + alpha_pairs[a1]
+                alpha2 = alpha_pairs[a6] + alpha_pairs[a7]
+                alpha3 = alpha_pairs[a4] + alpha_pairs[a5]
+            row0 += pixels0
+            row1 += pixels1
+            row2 += pixels2
+            row3 += pixels3
+            alpha_row0 += alpha0
+            alpha_row1 += alpha1
+            alpha_row2 += alpha2
+            alpha_row3 += alpha3
+        image.extend(row0)
+        image.extend(row1)
+        image.extend(row2)
+        image.extend(row3)
+        alpha += bytes(alpha_row0) + bytes(alpha_row1) + bytes(alpha_row2) + bytes(alpha_row3)
+    set_alpha(image, alpha)
+    return image
+
+
+def decode_dxt5(data, x_blocks, y_blocks, has_alpha_pixels=False):
+    """
+    Interpolated alpha, the alpha palettes are cached
+    :return: Flat array('I') of abgr8, row after row, the width is x_blocks * 4
+    """
+    rgb565_table = get_rgb565_table()
+    (red2, green2, blue2), (red3, green3, blue3) = get_color_tables('dxt5')
+    row_getters = COLOR_ROW_GETTERS
+    alpha_row_getters = ALPHA_ROW_GETTERS
+    alpha_palettes = {}
+    image = array('I')
+    alpha = bytearray()
+    row_size = x_blocks * DXT5_BLOCK.size
+    for block_row in range(y_blocks):
+        row0, row1, row2, row3 = [], [], [], []
+        alpha_row0, alpha_row1, alpha_row2, alpha_row3 = [], [], [], []
+        previous_block = None
+        for block in DXT5_BLOCK.iter_unpack(data[block_row * row_size:(block_row + 1) * row_size]):
+            if block != previous_block:
+                previous_block = block
+                a0, a1, alpha_low, alpha_high, c0, c1, i0, i1, i2, i3 = block
+                red = c0 >> 11 | (c1 >> 6) & 0x3E0
+                green = (c0 >> 5) & 0x3F | (c1 << 1) & 0xFC0
+                blue = c0 & 0x1F | (c1 & 0x1F) << 5
+                palette = (rgb565_table[c0] & 0xFFFFFF, rgb565_table[c1] & 0xFFFFFF,
+                           red2[red] | green2[green] | blue2[blue], red3[red] | green3[green] | blue3[blue])
+                alpha_palette = alpha_palettes.get(a0 << 8 | a1)
+                if alpha_palette is None:
+                    alpha_palette = alpha_palettes[a0 << 8 | a1] = get_dxt5_alpha_palette(a0, a1)
+                pixels0 = row_getters[i0](palette)
+                pixels1 = row_getters[i1](palette)
+                pixels2 = row_getters[i2](palette)
+                pixels3 = row_getters[i3](palette)
+                alpha0 = alpha_row_getters[alpha_low & 0xFFF](alpha_palette)
+                alpha1 = alpha_row_getters[(alpha_low >> 12) | (alpha_high & 0xFF) << 4](alpha_palette)
+                alpha2 = alpha_row_getters[(alpha_high >> 8) & 0xFFF](alpha_palette)
+                alpha3 = alpha_row_getters[alpha_high >> 20](alpha_palette)
+            row0 += pixels0
+            row1 += pixels1
+            row2 += pixels2
+            row3 += pixels3
+            alpha_row0 += alpha0
+            alpha_row1 += alpha1
+            alpha_row2 += alpha2
+            alpha_row3 += alpha3
+        image.extend(row0)
+        image.extend(row1)
+        image.extend(row2)
+        image.extend(row3)
+        alpha += bytes(alpha_row0) + bytes(alpha_row1) + bytes(alpha_row2) + bytes(alpha_row3)
+    set_alpha(image, alpha)
+    return image
+
+
+def set_alpha(image, alpha):
+    """
+    Write the alpha channel of all pixels at once
+    :param image: array('I') of abgr8 with an alpha of 0
+    :param alpha: One byte per pixel
+    """
+    with memoryview(image) as view, view.cast('B') as image_bytes:
+        image_bytes[ALPHA_BYTE::4] = alpha
+
+
+# FOURCC ==> (block size in bytes, decoder)
+DECODERS = {
+    'DXT1': (DXT1_BLOCK.size, decode_dxt1),
+    'DXT3': (DXT3_BLOCK.size, decode_dxt3),
+    'DXT5': (DXT5_BLOCK.size, decode_dxt5),
+}
+
+
+def decode(fourcc, data, x_blocks, y_blocks, has_alpha_pixels=False):
+    """
+    Decode the blocks of an image with the decoder for the FOURCC
+    :raise KeyError: No decoder for the FOURCC
+    :return: Flat array('I') of abgr8, row after row, the size is a multiple of 4
+    """
+    return DECODERS[fourcc][1](data, x_blocks, y_blocks, has_alpha_pixels)
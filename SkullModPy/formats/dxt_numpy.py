@@ -0,0 +1,159 @@
+"""
+Block decoders for DXT compressed DDS images that use NumPy, all blocks are decoded at once
+The results are the same as the ones of the decoders in DDSReader (pixel for pixel)
+NumPy is optional, importing this module raises ImportError without it
+"""
+import numpy
+
+DXT1_BLOCK = numpy.dtype([('c0', '<u2'), ('c1', '<u2'), ('indices', '<u4')])
+DXT3_BLOCK = numpy.dtype([('alpha', 'u1', (8,)), ('c0', '<u2'), ('c1', '<u2'), ('indices', '<u4')])
+DXT5_BLOCK = numpy.dtype([('a0', 'u1'), ('a1', 'u1'), ('alpha_indices', 'u1', (6,)),
+                          ('c0', '<u2'), ('c1', '<u2'), ('indices', '<u4')])
+# Shifts of the 2 bit indices of the 16 pixels (row after row)
+COLOR_INDEX_SHIFTS = numpy.arange(0, 32, 2, dtype=numpy.uint32)
+# DXT3: byte and shift of the 4 bit alpha of each pixel, the first two rows use the bytes of the second two rows
+# and the other way round (like DDSReader)
+DXT3_ALPHA_BYTES = numpy.array([2, 2, 3, 3, 0, 0, 1, 1, 6, 6, 7, 7, 4, 4, 5, 5])
+DXT3_ALPHA_SHIFTS = numpy.array([0, 4] * 8, dtype=numpy.uint8)
+# DXT5: shifts of the 3 bit alpha indices in the 48 bit index part
+ALPHA_INDEX_SHIFTS = numpy.arange(0, 48, 3, dtype=numpy.uint64)
+
+
+def rgb565_expand(color):
+    """
+    :param color: Array of rgb565 colors
+    :return: 8 bit r, g, b arrays (same rounding as helper.rgb565_to_abgr8)
+    """
+    color = color.astype(numpy.uint32)
+    return rgb565_expand_channels((color >> 11) & 0x1F, (color >> 5) & 0x3F, color & 0x1F)
+
+
+def rgb565_expand_channels(r, g, b):
+    """
+    Expand 5/6/5 bit channels to 8 bit (same rounding as helper.rgb565_to_abgr8)
+    """
+    return (r * 510 + 31) // 62, (g * 510 + 63) // 126, (b * 510 + 31) // 62
+
+
+def abgr8(r, g, b, a=0xFF):
+    return (numpy.uint32(a) << 24) | (b << 16) | (g << 8) | r
+
+
+def get_color_indices(indices):
+    """
+    :param indices: Array of the 32 bit index part of every block
+    :return: Array (blocks, 16) of the color index of each pixel
+    """
+    return (indices[:, numpy.newaxis] >> COLOR_INDEX_SHIFTS) & 3
+
+
+def blocks_to_image(pixels, x_blocks, y_blocks):
+    """
+    :param pixels: Array (blocks, 16), each block row after row
+    :return: Array (height, width) of the image
+    """
+    return pixels.reshape(y_blocks, x_blocks, 4, 4).transpose(0, 2, 1, 3).reshape(y_blocks * 4, x_blocks * 4)
+
+
+def decode_dxt1(data, x_blocks, y_blocks, has_alpha_pixels):
+    """
+    :param data: Bytes of all blocks
+    :param has_alpha_pixels: DDSF_ALPHAPIXELS is set, color 3 is transparent instead of black in 3 color blocks
+    :return: Array (height, width) of abgr8 uint32
+    """
+    blocks = numpy.frombuffer(data, DXT1_BLOCK, x_blocks * y_blocks)
+    r0, g0, b0 = rgb565_expand(blocks['c0'])
+    r1, g1, b1 = rgb565_expand(blocks['c1'])
+    is_four_color = blocks['c0'] > blocks['c1']
+
+    palette = numpy.empty((len(blocks), 4), numpy.uint32)
+    palette[:, 0] = abgr8(r0, g0, b0)
+    palette[:, 1] = abgr8(r1, g1, b1)
+    palette[:, 2] = numpy.where(is_four_color,
+                                abgr8((2 * r0 + r1) // 3, (2 * g0 + g1) // 3, (2 * b0 + b1) // 3),
+                                abgr8((r0 + r1) // 2, (g0 + g1) // 2, (b0 + b1) // 2))
+    palette[:, 3] = numpy.where(is_four_color,
+                                abgr8((2 * r1 + r0) // 3, (2 * g1 + g0) // 3, (2 * b1 + b0) // 3),
+                                0 if has_alpha_pixels else 0xFF000000)
+
+    pixels = numpy.take_along_axis(palette, get_color_indices(blocks['indices']), 1)
+    return blocks_to_image(pixels, x_blocks, y_blocks)
+
+
+def decode_dxt3(data, x_blocks, y_blocks, has_alpha_pixels=False):
+    """
+    Explicit 4 bit alpha, the colors are interpolated (and rounded) after expanding them to 8 bit
+    :return: Array (height, width) of abgr8 uint32
+    """
+    blocks = numpy.frombuffer(data, DXT3_BLOCK, x_blocks * y_blocks)
+    r0, g0, b0 = rgb565_expand(blocks['c0'])
+    r1, g1, b1 = rgb565_expand(blocks['c1'])
+
+    palette = numpy.empty((len(blocks), 4), numpy.uint32)
+    palette[:, 0] = abgr8(r0, g0, b0, 0)
+    palette[:, 1] = abgr8(r1, g1, b1, 0)
+    palette[:, 2] = abgr8((2 * r0 + r1 + 1) // 3, (2 * g0 + g1 + 1) // 3, (2 * b0 + b1 + 1) // 3, 0)
+    palette[:, 3] = abgr8((2 * r1 + r0 + 1) // 3, (2 * g1 + g0 + 1) // 3, (2 * b1 + b0 + 1) // 3, 0)
+
+    alpha = ((blocks['alpha'][:, DXT3_ALPHA_BYTES] >> DXT3_ALPHA_SHIFTS) & 0xF).astype(numpy.uint32) * 17
+    pixels = numpy.take_along_axis(palette, get_color_indices(blocks['indices']), 1) | (alpha << 24)
+    return blocks_to_image(pixels, x_blocks, y_blocks)
+
+
+def decode_dxt5(data, x_blocks, y_blocks, has_alpha_pixels=False):
+    """
+    Interpolated alpha (8 values per block), the colors are interpolated (and rounded) before expanding them
+    :return: Array (height, width) of abgr8 uint32
+    """
+    blocks = numpy.frombuffer(data, DXT5_BLOCK, x_blocks * y_blocks)
+    n_of_blocks = len(blocks)
+
+    # Alpha palette, 8 or 6 interpolated values (0 and 255 are added in the second case)
+    a0 = blocks['a0'].astype(numpy.uint32)
+    a1 = blocks['a1'].astype(numpy.uint32)
+    alpha_palette = numpy.empty((n_of_blocks, 8), numpy.uint32)
+    alpha_palette[:, 0] = a0
+    alpha_palette[:, 1] = a1
+    is_eight_alpha = a0 > a1
+    for i in range(1, 7):
+        alpha_palette[:, i + 1] = numpy.where(is_eight_alpha, ((7 - i) * a0 + i * a1) // 7,
+                                              ((5 - i) * a0 + i * a1) // 5 if i < 5 else (0 if i == 5 else 255))
+    alpha_bits = numpy.zeros(n_of_blocks, numpy.uint64)
+    for i in range(6):
+        alpha_bits |= blocks['alpha_indices'][:, i].astype(numpy.uint64) << numpy.uint64(8 * i)
+    alpha_indices = ((alpha_bits[:, numpy.newaxis] >> ALPHA_INDEX_SHIFTS) & numpy.uint64(7)).astype(numpy.intp)
+    alpha = numpy.take_along_axis(alpha_palette, alpha_indices, 1)
+
+    # Color palette, interpolated in 565
+    channels = []
+    for color in (blocks['c0'], blocks['c1']):
+        color = color.astype(numpy.uint32)
+        channels.append(((color >> 11) & 0x1F, (color >> 5) & 0x3F, color & 0x1F))
+    (r0, g0, b0), (r1, g1, b1) = channels
+    palette = numpy.empty((n_of_blocks, 4), numpy.uint32)
+    palette[:, 0] = abgr8(*rgb565_expand_channels(r0, g0, b0), 0)
+    palette[:, 1] = abgr8(*rgb565_expand_channels(r1, g1, b1), 0)
+    palette[:, 2] = abgr8(*rgb565_expand_channels((2 * r0 + r1 + 1) // 3, (2 * g0 + g1 + 1) // 3,
+                                                  (2 * b0 + b1 + 1) // 3), 0)
+    palette[:, 3] = abgr8(*rgb565_expand_channels((2 * r1 + r0 + 1) // 3, (2 * g1 + g0 + 1) // 3,
+                                                  (2 * b1 + b0 + 1) // 3), 0)
+
+    pixels = numpy.take_along_axis(palette, get_color_indices(blocks['indices']), 1) | (alpha << 24)
+    return blocks_to_image(pixels, x_blocks, y_blocks)
+
+
+# FOURCC ==> (block size in bytes, decoder)
+DECODERS = {
+    'DXT1': (8, decode_dxt1),
+    'DXT3': (16, decode_dxt3),
+    'DXT5': (16, decode_dxt5),
+}
+
+
+def decode(fourcc, data, x_blocks, y_blocks, has_alpha_pixels=False):
+    """
+    Decode the blocks of an image with the decoder for the FOURCC
+    :raise KeyError: No decoder for the FOURCC
+    :return: Array (height, width) of abgr8 uint32, the size is a multiple of 4
+    """
+    return DECODERS[fourcc][1](data, x_blocks, y_blocks, has_alpha_pixels)
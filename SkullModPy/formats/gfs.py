@@ -1,59 +1,509 @@
+import fnmatch
+import functools
+import hashlib
+import io
+import mmap
 import os
+import re
+import stat
 import struct
+import sys
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from SkullModPy.common.CommonConstants import BIG_ENDIAN
 from SkullModPy.common.Reader import Reader
+from SkullModPy.common.fileio import copy_range, get_file_hash, pwrite
+from SkullModPy.formats.gfs_order import order_metadata
+
+
+class GFSEntryTable:
+    """
+    Compact list of archive entries, offsets/lengths/alignments are stored in arrays instead of one list per entry
+    Behaves like a list of entries in form (offset,length,path,alignment), the entry tuples are created on access
+    and are read-only, use append() to add entries
+    """
+
+    __slots__ = ('offsets', 'lengths', 'paths', 'alignments')
+
+    def __init__(self, offsets=None, lengths=None, paths=None, alignments=None):
+        self.offsets = offsets if offsets is not None else array('Q')
+        self.lengths = lengths if lengths is not None else array('Q')
+        self.paths = paths if paths is not None else []
+        self.alignments = alignments if alignments is not None else array('I')
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.offsets[index], self.lengths[index], self.paths[index], self.alignments[index]
+
+    def __iter__(self):
+        return zip(self.offsets, self.lengths, self.paths, self.alignments)
+
+    def __eq__(self, other):
+        return len(self) == len(other) and all(a == tuple(b) for a, b in zip(self, other))
+
+    def append(self, entry):
+        self.offsets.append(entry[0])
+        self.lengths.append(entry[1])
+        self.paths.append(entry[2])
+        self.alignments.append(entry[3])
 
 
 class GFSReader(Reader):
     FILE_IDENTIFIER = "Reverge Package File"
     FILE_EXTENSION = "gfs"
     FILE_VERSION = "1.1"
+    # Largest chunk that is held in memory when an entry is copied
+    COPY_BUFFER_SIZE = 2 ** 20
+    # Header parts: data offset+identifier length / uint64 / file length+alignment
+    HEADER_START = struct.Struct(BIG_ENDIAN + 'LQ')
+    HEADER_UINT64 = struct.Struct(BIG_ENDIAN + 'Q')
+    HEADER_ENTRY_END = struct.Struct(BIG_ENDIAN + 'QL')
+    # Index cache: a copy of the parsed header next to the archive
+    INDEX_CACHE_EXTENSION = ".smidx"
+    INDEX_CACHE_MAGIC = b'SMGFSIDX'
+    INDEX_CACHE_VERSION = 3
+    # magic, version, archive size, archive mtime (ns), length of the archive path, number of entries,
+    # length of the paths
+    # Followed by the archive path, the offsets (uint64), lengths (uint64), alignments (uint32) and the paths
+    # separated by \0
+    INDEX_CACHE_HEADER = struct.Struct(BIG_ENDIAN + '8sLQqLQQ')
+    # Source index: size, modification time and digest of the files the archive was unpacked to or packed from,
+    # lets GFSWriter find unchanged files without reading them (text, see save_source_index())
+    SOURCE_INDEX_EXTENSION = ".smsrc"
+    SOURCE_INDEX_IDENTIFIER = "# SkullMod GFS source index"
+    SOURCE_INDEX_ALGORITHM = 'sha256'
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, memory_map=False):
+        """
+        :param file_path: Path to the .gfs file
+        :param memory_map: Map the archive into memory, entries can then be accessed without copying them
+        """
         super().__init__(open(file_path, "rb"), os.path.getsize(file_path), BIG_ENDIAN)
         self.file_path = os.path.abspath(file_path)
+        self.mapped_file = None
+        self.file_lock = threading.Lock()  # Only used if os.pread is not available
+        self.file_mtime_ns = os.fstat(self.file.fileno()).st_mtime_ns
+        if memory_map and self.file_size > 0:  # Empty files can't be mapped
+            self.mapped_file = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
 
-    def get_metadata(self):
+    def get_metadata(self, use_cache=False):
         """
         Read GFS file
         :raise ValueError: File integrity compromised
+        :param use_cache: Use the index cache next to the archive instead of parsing the header,
+                          the cache is created if it is missing or outdated
         """
-        # Basic metadata
-        data_offset = self.read_int()
-        if data_offset < 48:  # Header must be at this long to be valid
-            raise ValueError("Given file header is too short")
-        file_identifier_length = self.read_int(8)
-        # The file identifier is checked manually (instead of using read_pascal_string()) to be extra careful
-        if file_identifier_length != len(self.FILE_IDENTIFIER):
-            raise ValueError("Given file is not a GFS file (Identifier length error)")
-        file_identifier = str(self.file.read(len(self.FILE_IDENTIFIER)), 'ascii')
-        if file_identifier != GFSReader.FILE_IDENTIFIER:
-            raise ValueError("Given file is not a GFS file (Identifier string error)")
-        file_version = self.read_pascal_string()
-        if not file_version == GFSReader.FILE_VERSION:
-            raise ValueError("Given file has the wrong version")
-        n_of_files = self.read_int(8)
+        references = self.load_index_cache() if use_cache else None
+        if references is None:
+            references = self.read_references()
+            if use_cache:
+                self.save_index_cache(references)
 
         # Get file name and path
         file_name = os.path.splitext(self.file_path)[0]
         file_directory = os.path.dirname(self.file_path)
         # Make an output path
         new_dir_path = os.path.join(file_directory, file_name)
+        return {'path': new_dir_path, 'metadata': references}
 
-        # Process
-        running_offset = data_offset
-        references = []
-        for _ in range(n_of_files):
-            reference_path = self.read_pascal_string()
-            reference_length = self.read_int(8)
-            reference_alignment = self.read_int()
-            # The alignment is already included
-            running_offset += (reference_alignment - (running_offset % reference_alignment)) % reference_alignment
+    def read_references(self):
+        """
+        Parse the header, it is read with a single call and decoded with precompiled structs
+        :raise ValueError: File integrity compromised
+        :return: GFSEntryTable with entries in form (offset,length,path,alignment)
+        """
+        header_start = self.read_at(0, GFSReader.HEADER_START.size)
+        if len(header_start) < GFSReader.HEADER_START.size:
+            raise ValueError("Given file header is too short")
+        data_offset, file_identifier_length = GFSReader.HEADER_START.unpack(header_start)
+        if data_offset < 48:  # Header must be at this long to be valid
+            raise ValueError("Given file header is too short")
+        if data_offset > self.file_size:
+            raise ValueError("Given file is shorter than its header")
+        # The file identifier is checked manually (instead of reading a pascal string) to be extra careful
+        if file_identifier_length != len(self.FILE_IDENTIFIER):
+            raise ValueError("Given file is not a GFS file (Identifier length error)")
+        header = self.read_at(0, data_offset)
+        unpack_uint64 = GFSReader.HEADER_UINT64.unpack_from
+        unpack_entry_end = GFSReader.HEADER_ENTRY_END.unpack_from
+        try:
+            position = GFSReader.HEADER_START.size
+            file_identifier = str(header[position:position + file_identifier_length], 'ascii')
+            if file_identifier != GFSReader.FILE_IDENTIFIER:
+                raise ValueError("Given file is not a GFS file (Identifier string error)")
+            position += file_identifier_length
+            file_version_length = unpack_uint64(header, position)[0]
+            position += 8
+            file_version = str(header[position:position + file_version_length], 'ascii')
+            if not file_version == GFSReader.FILE_VERSION:
+                raise ValueError("Given file has the wrong version")
+            position += file_version_length
+            n_of_files = unpack_uint64(header, position)[0]
+            position += 8
 
-            references.append([running_offset, reference_length, reference_path])
+            # Process
+            running_offset = data_offset
+            references = GFSEntryTable()
+            offsets = references.offsets
+            lengths = references.lengths
+            paths = references.paths
+            alignments = references.alignments
+            for _ in range(n_of_files):
+                path_length = unpack_uint64(header, position)[0]
+                position += 8
+                if position + path_length > data_offset:
+                    raise ValueError("Given file has a header that is longer than the data offset")
+                reference_path = header[position:position + path_length].decode('ascii')
+                position += path_length
+                reference_length, reference_alignment = unpack_entry_end(header, position)
+                position += 12
+                if reference_alignment == 0:
+                    raise ValueError("Given file has an invalid alignment for: " + reference_path)
+                # The alignment is already included
+                running_offset += (reference_alignment - (running_offset % reference_alignment)) % reference_alignment
 
-            running_offset += reference_length
-        return {'path': new_dir_path, 'metadata': references}
+                offsets.append(running_offset)
+                lengths.append(reference_length)
+                paths.append(reference_path)
+                alignments.append(reference_alignment)
+
+                running_offset += reference_length
+        except struct.error:
+            raise ValueError("Given file has a header that is longer than the data offset") from None
+        except UnicodeDecodeError:
+            raise ValueError("Given file has a header with invalid characters") from None
+        return references
+
+    @staticmethod
+    def filter_metadata(output_description, include=None, exclude=None, min_size=None, max_size=None):
+        """
+        Select entries by their header data only, nothing of the payload is read
+        Patterns are globs ('*' also matches '/', a trailing '/' matches everything in the directory)
+        or regular expressions if they start with 're:' (searched anywhere in the path), both ignore case
+        :param output_description: Dict from get_metadata()
+        :param include: Only keep entries matching one of these patterns (all if None or empty)
+        :param exclude: Remove entries matching one of these patterns
+        :param min_size: Only keep entries with at least this length
+        :param max_size: Only keep entries with at most this length
+        :return: Dict like get_metadata() with the remaining entries
+        """
+        include_matcher = GFSReader.compile_patterns(include)
+        exclude_matcher = GFSReader.compile_patterns(exclude)
+        references = GFSEntryTable()
+        for entry in output_description['metadata']:
+            if min_size is not None and entry[1] < min_size or max_size is not None and entry[1] > max_size:
+                continue
+            if include_matcher is not None and not include_matcher(entry[2]):
+                continue
+            if exclude_matcher is not None and exclude_matcher(entry[2]):
+                continue
+            references.append(entry)
+        return {'path': output_description['path'], 'metadata': references}
+
+    @staticmethod
+    def compile_patterns(patterns):
+        """
+        Compile glob and 're:' patterns (see filter_metadata())
+        :return: Function that is True if a path matches any pattern, None if there are no patterns
+        """
+        if not patterns:
+            return None
+        matchers = []
+        for pattern in patterns:
+            if pattern.startswith('re:'):
+                matchers.append(re.compile(pattern[3:], re.IGNORECASE).search)
+            else:
+                pattern = pattern.replace('\\', '/')
+                if pattern.endswith('/'):
+                    pattern += '*'
+                matchers.append(re.compile(fnmatch.translate(pattern), re.IGNORECASE).match)
+        return lambda path: any(matcher(path) for matcher in matchers)
+
+    def get_index_cache_path(self):
+        return self.file_path + GFSReader.INDEX_CACHE_EXTENSION
+
+    def load_index_cache(self):
+        """
+        Load the entries from the index cache with a single read
+        :return: GFSEntryTable or None if there is no valid cache
+        """
+        try:
+            with open(self.get_index_cache_path(), 'rb') as f:
+                cache = f.read()
+        except OSError:
+            return None
+        header_size = GFSReader.INDEX_CACHE_HEADER.size
+        if len(cache) < header_size:
+            return None
+        magic, version, archive_size, archive_mtime_ns, path_length, n_of_entries, paths_length = \
+            GFSReader.INDEX_CACHE_HEADER.unpack_from(cache)
+        if magic != GFSReader.INDEX_CACHE_MAGIC or version != GFSReader.INDEX_CACHE_VERSION:
+            return None
+        # The cache is only valid for this archive in this state
+        if archive_size != self.file_size or archive_mtime_ns != self.file_mtime_ns or \
+                cache[header_size:header_size + path_length] != os.fsencode(self.file_path):
+            return None
+        references = GFSEntryTable()
+        position = header_size + path_length
+        for column in (references.offsets, references.lengths, references.alignments):
+            column_end = position + n_of_entries * column.itemsize
+            if len(cache) < column_end:
+                return None
+            column.frombytes(cache[position:column_end])
+            if sys.byteorder == 'little':
+                column.byteswap()
+            position = column_end
+        if len(cache) != position + paths_length:  # Cut off
+            return None
+        try:
+            references.paths = cache[position:].decode('ascii').split('\0') if n_of_entries > 0 else []
+        except UnicodeDecodeError:
+            return None
+        if len(references.paths) != n_of_entries:
+            return None
+        return references
+
+    def save_index_cache(self, references):
+        """
+        Write the index cache, nothing happens if it can't be written (like for read-only game directories)
+        :param references: GFSEntryTable from read_references()
+        """
+        encoded_path = os.fsencode(self.file_path)
+        encoded_paths = '\0'.join(references.paths).encode('ascii')
+        cache = bytearray(GFSReader.INDEX_CACHE_HEADER.pack(GFSReader.INDEX_CACHE_MAGIC, GFSReader.INDEX_CACHE_VERSION,
+                                                             self.file_size, self.file_mtime_ns, len(encoded_path),
+                                                             len(references), len(encoded_paths)))
+        cache += encoded_path
+        for column in (references.offsets, references.lengths, references.alignments):
+            if sys.byteorder == 'little':
+                column = array(column.typecode, column)
+                column.byteswap()
+            cache += column.tobytes()
+        cache += encoded_paths
+        cache_path = self.get_index_cache_path()
+        try:
+            with open(cache_path + '.tmp', 'wb') as f:
+                f.write(cache)
+            os.replace(cache_path + '.tmp', cache_path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def get_source_index_path(file_path):
+        return os.path.abspath(file_path) + GFSReader.SOURCE_INDEX_EXTENSION
+
+    @staticmethod
+    def load_source_index(file_path):
+        """
+        Load the source index of an archive
+        The modification time of files that were changed in the same clock tick as the index was written
+        is dropped (like git's racily clean entries), they could have been changed again without a new time
+        :param file_path: Path to the .gfs file
+        :return: Dict of path ==> (size, mtime_ns or None, digest or None), empty if there is no index
+                 for the archive in its current state
+        """
+        index_path = GFSReader.get_source_index_path(file_path)
+        try:
+            archive_stat = os.stat(file_path)
+            with open(index_path, 'r', encoding='ascii') as f:
+                index_mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                first_line = f.readline().rstrip('\n').split(' ')
+                if ' '.join(first_line[:-2]) != GFSReader.SOURCE_INDEX_IDENTIFIER or \
+                        first_line[-2:] != [str(archive_stat.st_size), str(archive_stat.st_mtime_ns)]:
+                    return {}
+                sources = {}
+                for line in f:
+                    path, size, mtime_ns, digest = line.rstrip('\n').split('\t')
+                    mtime_ns = int(mtime_ns) if mtime_ns != '-' and int(mtime_ns) < index_mtime_ns else None
+                    sources[path] = (int(size), mtime_ns, digest if digest != '-' else None)
+        except (OSError, ValueError):  # Missing or broken index, every file is compared
+            return {}
+        return sources
+
+    @staticmethod
+    def save_source_index(file_path, sources):
+        """
+        Write the source index of an archive, nothing happens if it can't be written
+        Text: a header line with the size and modification time of the archive, then path, size,
+        modification time and digest (- if not known) separated by tabs
+        :param file_path: Path to the .gfs file (after it was written)
+        :param sources: Dict of path ==> (size, mtime_ns, digest or None)
+        """
+        index_path = GFSReader.get_source_index_path(file_path)
+        try:
+            archive_stat = os.stat(file_path)
+            with open(index_path + '.tmp', 'w', encoding='ascii', newline='\n') as f:
+                f.write(GFSReader.SOURCE_INDEX_IDENTIFIER + ' ' + str(archive_stat.st_size) + ' ' +
+                        str(archive_stat.st_mtime_ns) + '\n')
+                for path, (size, mtime_ns, digest) in sources.items():
+                    f.write(path + '\t' + str(size) + '\t' + str(mtime_ns) + '\t' +
+                            (digest if digest is not None else '-') + '\n')
+            os.replace(index_path + '.tmp', index_path)
+        except OSError:
+            pass
+
+    def read_at(self, offset, length_in_bytes):
+        """
+        Read bytes at the given position, the file position is not used (safe to use from multiple threads)
+        :param offset: Absolute position in the archive
+        :param length_in_bytes: Number of bytes to read, less are returned at the end of the archive
+        :return: bytes
+        """
+        if self.mapped_file is not None:
+            return self.mapped_file[offset:offset + length_in_bytes]
+        if hasattr(os, 'pread'):
+            chunks = []
+            while length_in_bytes > 0:
+                chunk = os.pread(self.file.fileno(), length_in_bytes, offset)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                offset += len(chunk)
+                length_in_bytes -= len(chunk)
+            return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        with self.file_lock:  # Windows has no positional reads, share the file position instead
+            initial_position = self.file.tell()
+            self.file.seek(offset)
+            data = self.file.read(length_in_bytes)
+            self.file.seek(initial_position)
+        return data
+
+    def get_entry_view(self, entry):
+        """
+        Get the data of an entry without copying it
+        Release the view (or use it with 'with') before calling close()
+        :raise ValueError: Archive is not memory mapped or the entry is out of bounds
+        :param entry: Metadata entry in form [offset,length,path]
+        :return: memoryview of the entry data
+        """
+        if self.mapped_file is None:
+            raise ValueError("Archive is not memory mapped")
+        offset = entry[0]
+        length_in_bytes = entry[1]
+        if length_in_bytes < 0 or offset + length_in_bytes > self.file_size:
+            raise ValueError("Entry is out of the archive bounds: " + entry[2])
+        return memoryview(self.mapped_file)[offset:offset + length_in_bytes]
+
+    def get_entry_views(self, output_description):
+        """
+        Iterate over all entries without copying them
+        :param output_description: Dict from get_metadata()
+        :return: Generator of (path, memoryview) tuples
+        """
+        for entry in output_description['metadata']:
+            yield entry[2], self.get_entry_view(entry)
+
+    def export_files(self, output_description):
+        """
+        Export files, writes directly from the mapped archive if memory_map was used
+        :raise OSError: A file could not be created properly or reading/writing failed
+        :param output_description: Dict from get_metadata()
+        """
+        base_path = output_description['path']
+        os.makedirs(base_path, exist_ok=True)
+        sources = {}
+        for entry in output_description['metadata']:
+            file_path = os.path.abspath(os.path.join(base_path, entry[2]))
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            sources[entry[2]] = self.export_entry(entry, file_path)
+        self.save_exported_sources(base_path, sources)
+
+    def export_files_parallel(self, output_description, workers=None):
+        """
+        Export files with a pool of threads, every thread uses positional reads (read_at)
+        :raise OSError: A file could not be created properly or reading/writing failed
+        :param output_description: Dict from get_metadata()
+        :param workers: Number of threads, default: number of CPUs
+        """
+        base_path = output_description['path']
+        metadata = output_description['metadata']
+        for entry in metadata:
+            if entry[1] < 0 or entry[0] + entry[1] > self.file_size:
+                raise ValueError("Entry is out of the archive bounds: " + entry[2])
+
+        # Create every directory once before the threads start
+        file_paths = [os.path.abspath(os.path.join(base_path, entry[2])) for entry in metadata]
+        os.makedirs(base_path, exist_ok=True)
+        for directory in sorted(set(os.path.dirname(file_path) for file_path in file_paths)):
+            os.makedirs(directory, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.export_entry, entry, file_path)
+                       for entry, file_path in zip(metadata, file_paths)]
+            # Raise the first error that occurred
+            sources = {entry[2]: future.result() for entry, future in zip(metadata, futures)}
+        self.save_exported_sources(base_path, sources)
+
+    def save_exported_sources(self, base_path, sources):
+        """
+        Write the source index if the files were exported to the directory the archive is packed from
+        """
+        if os.path.abspath(base_path) == os.path.splitext(self.file_path)[0]:
+            GFSReader.save_source_index(self.file_path, sources)
+
+    def export_entry(self, entry, file_path):
+        """
+        Write a single entry to a file, the directory has to exist
+        The data is hashed while it is written (for the source index)
+        :param entry: Metadata entry in form [offset,length,path,...]
+        :param file_path: Destination
+        :return: Source index record of the file (size, modification time in ns, digest)
+        """
+        entry_hash = hashlib.new(GFSReader.SOURCE_INDEX_ALGORITHM)
+        with open(file_path, 'wb') as output_file:
+            for data in self.iter_entry_data(entry):
+                output_file.write(data)
+                entry_hash.update(data)
+        file_stat = os.stat(file_path)
+        return file_stat.st_size, file_stat.st_mtime_ns, entry_hash.hexdigest()
+
+    def iter_entry_data(self, entry):
+        """
+        Get the data of an entry in chunks (a single view if the archive is memory mapped)
+        :raise ValueError: The entry is out of the archive bounds
+        :param entry: Metadata entry in form [offset,length,path,...]
+        :return: Generator of bytes-like objects
+        """
+        if entry[1] < 0 or entry[0] + entry[1] > self.file_size:
+            raise ValueError("Entry is out of the archive bounds: " + entry[2])
+        if self.mapped_file is not None:
+            with self.get_entry_view(entry) as entry_view:
+                yield entry_view
+            return
+        offset = entry[0]
+        end = entry[0] + entry[1]
+        while offset < end:
+            data = self.read_at(offset, min(GFSReader.COPY_BUFFER_SIZE, end - offset))
+            if not data:
+                raise ValueError("Unexpected end of archive: " + entry[2])
+            yield data
+            offset += len(data)
+
+    def get_entry_hash(self, entry, algorithm='sha256'):
+        """
+        :param entry: Metadata entry in form [offset,length,path,...]
+        :param algorithm: Any algorithm supported by hashlib
+        :return: Hex digest of the entry data
+        """
+        entry_hash = hashlib.new(algorithm)
+        for data in self.iter_entry_data(entry):
+            entry_hash.update(data)
+        return entry_hash.hexdigest()
+
+    def close(self):
+        """
+        Close the archive
+        :raise BufferError: A view from get_entry_view() is still in use
+        """
+        if self.mapped_file is not None:
+            self.mapped_file.close()
+            self.mapped_file = None
+        self.file.close()
 
     def read_pascal_string(self):
         """
@@ -63,6 +513,143 @@ class GFSReader(Reader):
         return self.read_string(self.read_int(8))
 
 
+class GFSEntryFile(io.RawIOBase):
+    """
+    Read-only file object for a single entry of an archive
+    Reading and seeking is bounded to the entry, the position of the archive file is not touched
+    """
+
+    def __init__(self, reader, entry):
+        """
+        :param reader: Open GFSReader
+        :param entry: Metadata entry in form [offset,length,path,...]
+        """
+        super().__init__()
+        self.reader = reader
+        self.entry_offset = entry[0]
+        self.entry_length = entry[1]
+        self.name = entry[2]
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        length_in_bytes = min(len(buffer), self.entry_length - self.position)
+        if length_in_bytes <= 0:
+            return 0
+        data = self.reader.read_at(self.entry_offset + self.position, length_in_bytes)
+        memoryview(buffer).cast('B')[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def readall(self):
+        if self.position >= self.entry_length:
+            return b''
+        data = self.reader.read_at(self.entry_offset + self.position, self.entry_length - self.position)
+        self.position += len(data)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            new_position = offset
+        elif whence == io.SEEK_CUR:
+            new_position = self.position + offset
+        elif whence == io.SEEK_END:
+            new_position = self.entry_length + offset
+        else:
+            raise ValueError("Invalid whence")
+        if new_position < 0:
+            raise ValueError("Negative seek position")
+        self.position = new_position
+        return self.position
+
+    def tell(self):
+        return self.position
+
+
+class GFSArchive:
+    """
+    Random access to the entries of a .gfs file without unpacking it
+    The header is parsed once, entries are looked up by their path inside the archive
+    """
+
+    def __init__(self, file_path, memory_map=False, use_cache=False):
+        """
+        :raise ValueError: File integrity compromised
+        :param file_path: Path to the .gfs file
+        :param memory_map: See GFSReader
+        :param use_cache: See GFSReader.get_metadata()
+        """
+        self.reader = GFSReader(file_path, memory_map)
+        self.file_path = self.reader.file_path
+        try:
+            self.metadata = self.reader.get_metadata(use_cache)
+        except Exception:
+            self.reader.close()
+            raise
+        # path ==> (offset,length,path,alignment)
+        self.index = {entry[2]: entry for entry in self.metadata['metadata']}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, path):
+        return GFSArchive.normalize_path(path) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_paths(self):
+        """
+        :return: All entry paths in archive order
+        """
+        return [entry[2] for entry in self.metadata['metadata']]
+
+    def get_entry(self, path):
+        """
+        :raise FileNotFoundError: No entry with this path
+        :param path: Path inside the archive ('/' or '\\' as delimiter)
+        :return: Entry in form (offset,length,path,alignment)
+        """
+        try:
+            return self.index[GFSArchive.normalize_path(path)]
+        except KeyError:
+            raise FileNotFoundError("No entry in archive: " + path) from None
+
+    def open(self, path):
+        """
+        Open a single entry, nothing else is read
+        :raise FileNotFoundError: No entry with this path
+        :return: Seekable read-only file object (GFSEntryFile)
+        """
+        return GFSEntryFile(self.reader, self.get_entry(path))
+
+    def read(self, path):
+        """
+        :raise FileNotFoundError: No entry with this path
+        :return: Entry data as bytes
+        """
+        entry = self.get_entry(path)
+        return self.reader.read_at(entry[0], entry[1])
+
+    def close(self):
+        self.reader.close()
+
+    @staticmethod
+    def normalize_path(path):
+        """
+        Path inside an archive (or VirtualFileSystem) as it is stored: '/' as delimiter, no leading or trailing '/'
+        """
+        return path.replace('\\', '/').strip('/')
+
+
 class GFSWriter:
     """
     The writer is lazy:
@@ -75,9 +662,11 @@ class GFSWriter:
         self.dir_path = os.path.abspath(dir_path)
         self.is_aligned = is_aligned
 
-    def get_metadata(self):
+    def get_metadata(self, order='walk', trace_path=None):
         """
         Overwrites existing files
+        :param order: Order of the files in the archive, see gfs_order.order_metadata()
+        :param trace_path: Access order trace for the trace order
         """
         # Check if all prerequisits are met
         if not os.path.exists(self.dir_path) or not os.path.isdir(self.dir_path):
@@ -97,54 +686,255 @@ class GFSWriter:
                     # Add to file list and replace all backwards slashes with forward slashes
                     file_list.append((root[base_path_length:len(root)] + '/' + file).replace('\\', '/'))
                     file_list.append(os.path.getsize(os.path.join(root, file)))
+        if order != 'walk':
+            file_list = order_metadata(file_list, order, trace_path)
         return file_list
 
-    def write_content(self, metadata):
-        if os.path.isdir(self.dir_path + '.gfs'):
+    def write_content(self, metadata, previous_archive=None, workers=None):
+        """
+        Write the .gfs file
+        :param metadata: File list from get_metadata()
+        :param previous_archive: Path to an older version of the archive (may be the one that is overwritten),
+                                 files that didn't change are copied from it instead of being read from the directory
+        :param workers: Number of threads that write the payloads (see GFSStreamWriter.write()) and that check
+                        files against the previous archive (default: number of CPUs)
+        """
+        archive_path = self.dir_path + '.gfs'
+        if os.path.isdir(archive_path):
             raise FileExistsError('There is a directory with the same name as a .gfs file')
-        if os.path.exists(self.dir_path + '.gfs'):
-            print(os.path.basename(self.dir_path + '.gfs') + " will be overwritten")
-        # Calculate number of files
-        n_of_files = len(metadata) // 2
-        # Save alignment
-        alignment = 4096 if self.is_aligned else 1
-        # Calculate the offset for the data portion (independent of the alignment)
+        if os.path.exists(archive_path):
+            print(os.path.basename(archive_path) + " will be overwritten")
+        previous = GFSArchive(previous_archive) if previous_archive is not None else None
+        # The previous archive is still read while writing, write next to it and replace it afterwards
+        output_path = archive_path + '.tmp' if previous is not None else archive_path
+        n_of_reused_files = 0
+        try:
+            file_names = metadata[0::2]
+            file_paths = [os.path.join(self.dir_path, *file_name.split('/')) for file_name in file_names]
+            # Taken before anything is read, a file that changes afterwards gets a new time and is checked next time
+            file_mtimes_ns = [os.stat(file_path).st_mtime_ns for file_path in file_paths]
+            checks = [(None, None)] * len(file_names)
+            if previous is not None:
+                previous_sources = GFSReader.load_source_index(previous_archive)
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    checks = list(executor.map(
+                        lambda file: GFSWriter.find_unchanged_entry(previous, previous_sources.get(file[0]), *file),
+                        zip(file_names, file_paths, metadata[1::2], file_mtimes_ns)))
+            entries = []
+            sources = {}
+            for file_name, file_path, file_size, file_mtime_ns, (previous_entry, digest) in \
+                    zip(file_names, file_paths, metadata[1::2], file_mtimes_ns, checks):
+                if previous_entry is not None:
+                    entries.append((file_name, file_size, GFSEntryFile(previous.reader, previous_entry)))
+                    n_of_reused_files += 1
+                else:  # Opened when it is copied
+                    entries.append((file_name, file_size, functools.partial(open, file_path, 'rb')))
+                sources[file_name] = (file_size, file_mtime_ns, digest)
+            GFSStreamWriter(output_path, self.is_aligned).write(entries, workers)
+        except BaseException:
+            if output_path != archive_path and os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        finally:
+            if previous is not None:
+                previous.close()
+        if output_path != archive_path:
+            os.replace(output_path, archive_path)
+            print("Reused " + str(n_of_reused_files) + " of " + str(len(metadata) // 2) + " files")
+        GFSReader.save_source_index(archive_path, sources)
+
+    @staticmethod
+    def find_unchanged_entry(previous, source, file_name, file_path, file_size, file_mtime_ns):
+        """
+        Find the entry of a file in an older archive if the file didn't change, only files that may have
+        changed are read:
+        - same size and modification time as in the source index of the older archive: unchanged, nothing is read
+        - only the time changed: the file is hashed and compared with the digest in the source index
+        - no digest (or no index): the file is compared with the entry chunk by chunk, up to the first difference
+        :param previous: GFSArchive of the older archive
+        :param source: Record (size, mtime_ns, digest) of the file in the source index of the older archive or None
+        :return: Entry in form (offset,length,path,alignment) or None, digest of the file or None if it isn't known
+        """
+        entry = previous.index.get(file_name)
+        if entry is None or entry[1] != file_size:
+            return None, None
+        if source is not None and source[0] == file_size:
+            if source[1] == file_mtime_ns:
+                return entry, source[2]
+            if source[2] is not None:
+                digest = get_file_hash(file_path, GFSReader.SOURCE_INDEX_ALGORITHM)
+                return entry if digest == source[2] else None, digest
+        file_hash = hashlib.new(GFSReader.SOURCE_INDEX_ALGORITHM)
+        offset = entry[0]
+        end = entry[0] + entry[1]
+        with open(file_path, 'rb') as f:
+            while offset < end:
+                data = f.read(min(GFSReader.COPY_BUFFER_SIZE, end - offset))
+                if not data or previous.reader.read_at(offset, len(data)) != data:
+                    return None, None
+                file_hash.update(data)
+                offset += len(data)
+        return entry, file_hash.hexdigest()
+
+    @staticmethod
+    def get_layout(file_names, file_sizes, alignment):
+        """
+        Calculate where everything is placed in the archive
+        :param file_names: Paths inside the archive
+        :param file_sizes: Size of each file
+        :param alignment: Alignment of each file (1 for none)
+        :return: header_length (= offset of the data portion), list of file offsets, size of the archive
+        """
         header_length = 51  # Base size (contains offset/file string/version/nOfFiles)
-        for i in range(0, n_of_files):
-            header_length += 8 + len(metadata[i * 2]) + 8 + 4  # long strLength+fileName+long fileSize+uint alignment
-        # Calculate each position for the files (requires alignment)
+        for file_name in file_names:
+            header_length += 8 + len(file_name) + 8 + 4  # long strLength+fileName+long fileSize+uint alignment
+        # Calculate each position for the files (same as GFSReader)
         file_offsets = []
         running_offset = header_length
-        for i in range(0, n_of_files):
-            if alignment != 1:
-                running_offset += alignment - (running_offset % alignment)
+        for file_size in file_sizes:
+            running_offset += (alignment - (running_offset % alignment)) % alignment
             file_offsets.append(running_offset)
-            running_offset += metadata[i * 2 + 1]
-        # Write header
-        with open(self.dir_path + '.gfs', 'wb') as f:
-            # Q ... uint64     L ... uint32
-            f.write(struct.pack(BIG_ENDIAN + 'L', header_length))
-            GFSWriter.write_pascal_string(f, 'Reverge Package File')
-            GFSWriter.write_pascal_string(f, '1.1')
-            f.write(struct.pack(BIG_ENDIAN + 'Q', n_of_files))
-            for i in range(0, n_of_files):
-                GFSWriter.write_pascal_string(f, metadata[i * 2])
-                f.write(struct.pack(BIG_ENDIAN + 'Q', metadata[i * 2 + 1]))
-                f.write(struct.pack(BIG_ENDIAN + 'L', alignment))
-            if f.tell() % alignment != 0:  # Only align if alignment is needed
-                f.write(b'\x00' * (alignment - (f.tell() % alignment)))  # Align header if needed
-            for i in range(0, n_of_files):
-                # Open file, read chunks, write chunks into this file
-                with open(os.path.join(self.dir_path, metadata[i * 2].replace("/", "\\")), 'rb') as data_file:
-                    bytes_read = data_file.read(4096)
-                    while bytes_read:
-                        f.write(bytes_read)
-                        bytes_read = data_file.read(4096)
-                if f.tell() % alignment != 0:  # Only align if alignment is needed
-                    f.write(b'\x00' * (alignment - (f.tell() % alignment)))  # Write alignment
+            running_offset += file_size
+        running_offset += (alignment - (running_offset % alignment)) % alignment
+        return header_length, file_offsets, running_offset
+
+    @staticmethod
+    def write_header(f, header_length, file_names, file_sizes, alignment):
+        # Q ... uint64     L ... uint32
+        f.write(struct.pack(BIG_ENDIAN + 'L', header_length))
+        GFSWriter.write_pascal_string(f, GFSReader.FILE_IDENTIFIER)
+        GFSWriter.write_pascal_string(f, GFSReader.FILE_VERSION)
+        f.write(struct.pack(BIG_ENDIAN + 'Q', len(file_names)))
+        for file_name, file_size in zip(file_names, file_sizes):
+            GFSWriter.write_pascal_string(f, file_name)
+            f.write(struct.pack(BIG_ENDIAN + 'Q', file_size))
+            f.write(struct.pack(BIG_ENDIAN + 'L', alignment))
 
     @staticmethod
     def write_pascal_string(f, string):
         ascii_string = string.encode('ascii')
         f.write(struct.pack(BIG_ENDIAN + 'Q', len(ascii_string)))
         f.write(ascii_string)
+
+
+class GFSStreamWriter:
+    """
+    Write a .gfs file from entries in form (path inside the archive, size, source) in one forward pass
+    A source can be:
+    - bytes-like (bytes, bytearray, memoryview like GFSReader.get_entry_view())
+    - a readable binary file object (like GFSEntryFile or an open file), read from its current position
+    - a callable that returns one of the above, it is called right before the entry is written and
+      file objects returned by it are closed afterwards
+    Files and archive entries are copied with copy_range() (in the kernel if possible)
+    """
+
+    def __init__(self, file_path, is_aligned, alignment=None):
+        """
+        :param is_aligned: Align every entry to 4096 bytes
+        :param alignment: Alignment of every entry, overrides is_aligned (like the one of an existing archive)
+        """
+        self.file_path = os.path.abspath(file_path)
+        self.is_aligned = is_aligned
+        self.alignment = alignment
+
+    def write(self, entries, workers=None):
+        """
+        Write the archive, overwrites existing files
+        :raise ValueError: A source doesn't contain the given number of bytes
+        :param entries: Iterable of (path, size, source), the paths and sizes are required before the
+                        first payload can be written, the sources are used in order
+        :param workers: Number of threads, with more than one the archive is preallocated and every payload
+                        is written at its offset by a thread, the output is the same as with a single thread
+                        Sources must not share a file object then (only possible with os.pwrite, not on Windows)
+        """
+        entries = list(entries)
+        if self.alignment is not None:
+            alignment = self.alignment
+        else:
+            alignment = 4096 if self.is_aligned else 1
+        file_names = [entry[0] for entry in entries]
+        file_sizes = [entry[1] for entry in entries]
+        header_length, file_offsets, archive_size = GFSWriter.get_layout(file_names, file_sizes, alignment)
+        with open(self.file_path, 'wb') as f:
+            GFSWriter.write_header(f, header_length, file_names, file_sizes, alignment)
+            f.flush()
+            # Copy the payloads to their positions, alignment gaps are skipped instead of written
+            if workers is not None and workers > 1 and hasattr(os, 'pwrite'):
+                GFSStreamWriter.preallocate(f.fileno(), archive_size)
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(GFSStreamWriter.write_source, f.fileno(), file_offset, file_name,
+                                               file_size, source, True)
+                               for (file_name, file_size, source), file_offset in zip(entries, file_offsets)]
+                    for future in futures:
+                        future.result()  # Raise the first error that occurred
+            else:
+                for (file_name, file_size, source), file_offset in zip(entries, file_offsets):
+                    GFSStreamWriter.write_source(f.fileno(), file_offset, file_name, file_size, source)
+            # Trailing alignment (and the gaps on file systems without holes) are filled by setting the size
+            f.truncate(archive_size)
+
+    @staticmethod
+    def preallocate(fd, archive_size):
+        """
+        Reserve the space for the whole archive, so parallel writes don't fragment it
+        """
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, archive_size)
+                return
+            except OSError:  # Not supported by the file system
+                pass
+        os.ftruncate(fd, archive_size)
+
+    @staticmethod
+    def write_source(fd, offset, file_name, file_size, source, positional=False):
+        """
+        Write the payload of a single entry at its offset
+        :param fd: File descriptor of the archive
+        :param positional: See copy_range()
+        """
+        if callable(source):
+            source = source()
+            if hasattr(source, 'read'):
+                with source:
+                    GFSStreamWriter.write_source(fd, offset, file_name, file_size, source, positional)
+                return
+        if isinstance(source, GFSEntryFile):
+            if source.entry_length - source.position < file_size:
+                raise ValueError("Archive entry is smaller than the given size: " + file_name)
+            copy_range(source.reader.file.fileno(), fd, source.entry_offset + source.position, offset, file_size,
+                       positional)
+            source.seek(file_size, io.SEEK_CUR)
+        elif hasattr(source, 'read'):
+            source_fd = GFSStreamWriter.get_regular_fd(source)
+            if source_fd is not None:  # Skip the Python buffers, the data is copied in the kernel
+                position = source.tell()
+                copy_range(source_fd, fd, position, offset, file_size, positional)
+                source.seek(position + file_size)
+                return
+            remaining = file_size
+            while remaining > 0:
+                data = source.read(min(GFSReader.COPY_BUFFER_SIZE, remaining))
+                if not data:
+                    raise ValueError("Source ended before the given size was written: " + file_name)
+                pwrite(fd, data, offset)
+                offset += len(data)
+                remaining -= len(data)
+        else:
+            with memoryview(source) as data:
+                if data.nbytes != file_size:
+                    raise ValueError("Size of the data doesn't match the given size: " + file_name)
+                pwrite(fd, data.cast('B'), offset)
+
+    @staticmethod
+    def get_regular_fd(source):
+        """
+        :return: File descriptor if the file object is a seekable regular file, None otherwise
+        """
+        try:
+            source_fd = source.fileno()
+            if source.seekable() and stat.S_ISREG(os.fstat(source_fd).st_mode):
+                return source_fd
+        except (OSError, AttributeError, ValueError):  # io.UnsupportedOperation is an OSError and ValueError
+            pass
+        return None
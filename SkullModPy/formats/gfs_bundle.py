@@ -0,0 +1,110 @@
+import functools
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from SkullModPy.formats.gfs import GFSEntryFile, GFSStreamWriter
+
+# Bundles that are read from a stream are buffered in memory up to this size, on disk above it
+SPOOL_SIZE = 2 ** 26
+
+
+def is_zip_path(file_path):
+    return file_path.lower().endswith('.zip')
+
+
+def export_bundle(reader, output_description, output, use_zip=False):
+    """
+    Write entries of an archive into a single uncompressed tar or stored zip stream, no temporary files are used
+    The entry paths are used as they are (relative, '/' as delimiter)
+    :param reader: Open GFSReader
+    :param output_description: Dict from get_metadata() (or GFSReader.filter_metadata())
+    :param output: Path or writable binary file object (like sys.stdout.buffer, doesn't have to be seekable)
+    :param use_zip: Write a zip instead of a tar
+    """
+    if use_zip:
+        export_zip(reader, output_description, output)
+    else:
+        export_tar(reader, output_description, output)
+
+
+def export_tar(reader, output_description, output):
+    if isinstance(output, str):
+        tar = tarfile.open(output, 'w', format=tarfile.PAX_FORMAT)
+    else:  # Stream mode, the output is only written sequentially
+        tar = tarfile.open(fileobj=output, mode='w|', format=tarfile.PAX_FORMAT)
+    with tar:
+        for entry in output_description['metadata']:
+            tar_info = tarfile.TarInfo(entry[2])
+            tar_info.size = entry[1]
+            tar_info.mtime = reader.file_mtime_ns // 10 ** 9
+            tar_info.mode = 0o644
+            tar.addfile(tar_info, GFSEntryFile(reader, entry))
+
+
+def export_zip(reader, output_description, output):
+    # Zip can't store dates before 1980
+    date_time = time.localtime(max(reader.file_mtime_ns // 10 ** 9, 315532800 + 86400))[:6]
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED, allowZip64=True) as bundle:
+        for entry in output_description['metadata']:
+            zip_info = zipfile.ZipInfo(entry[2], date_time)
+            zip_info.file_size = entry[1]  # Decides if zip64 is required
+            with bundle.open(zip_info, 'w') as output_file:
+                for data in reader.iter_entry_data(entry):
+                    output_file.write(data)
+
+
+def pack_bundle(bundle, output_path, is_aligned, workers=None):
+    """
+    Pack a .gfs file from a tar or zip, the entries keep the order they have in the bundle
+    The layout is the same as with GFSWriter (see GFSStreamWriter)
+    :param bundle: Path to a .tar (may be compressed) or .zip file or a readable binary stream,
+                   a stream is buffered first because the header needs all names and sizes before the data
+    :param output_path: Path of the .gfs file
+    :param is_aligned: Align every entry to 4096 bytes
+    :param workers: See GFSStreamWriter.write()
+    """
+    if isinstance(bundle, str):
+        if is_zip_path(bundle):
+            with zipfile.ZipFile(bundle) as zip_file:
+                pack_zip(zip_file, output_path, is_aligned, workers)
+        else:
+            with tarfile.open(bundle, 'r:*') as tar:
+                pack_tar(tar, output_path, is_aligned, workers)
+        return
+    with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as buffer:
+        shutil.copyfileobj(bundle, buffer, 2 ** 20)
+        buffer.seek(0)
+        if zipfile.is_zipfile(buffer):
+            buffer.seek(0)
+            with zipfile.ZipFile(buffer) as zip_file:
+                pack_zip(zip_file, output_path, is_aligned, workers)
+        else:
+            buffer.seek(0)
+            with tarfile.open(fileobj=buffer, mode='r:*') as tar:
+                pack_tar(tar, output_path, is_aligned, workers)
+
+
+def pack_tar(tar, output_path, is_aligned, workers=None):
+    # All members share the position of one file object, so they are always copied one after another
+    entries = [(get_bundle_path(member.name), member.size, functools.partial(tar.extractfile, member))
+               for member in tar.getmembers() if member.isreg()]
+    GFSStreamWriter(output_path, is_aligned).write(entries)
+
+
+def pack_zip(zip_file, output_path, is_aligned, workers=None):
+    # ZipFile.open() can be used by several threads at once
+    entries = [(get_bundle_path(zip_info.filename), zip_info.file_size, functools.partial(zip_file.open, zip_info))
+               for zip_info in zip_file.infolist() if not zip_info.is_dir()]
+    GFSStreamWriter(output_path, is_aligned).write(entries, workers)
+
+
+def get_bundle_path(path):
+    """
+    :return: Path inside the .gfs file for a path inside a tar or zip
+    """
+    path = path.replace('\\', '/')
+    while path.startswith('./'):
+        path = path[2:]
+    return path.lstrip('/')
@@ -0,0 +1,159 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from SkullModPy.formats.gfs import GFSReader
+
+MANIFEST_IDENTIFIER = "# SkullMod GFS manifest"
+# Optional second line, the filters of a manifest that only covers some entries (see GFSReader.filter_metadata())
+MANIFEST_FILTER = "# filter"
+
+
+def get_manifest(reader, metadata, workers=None, algorithm='sha256'):
+    """
+    Hash every entry straight from the archive, the entries are hashed in parallel
+    (hashlib releases the GIL, GFSReader.read_at() doesn't need a shared file position)
+    :param reader: Open GFSReader (memory mapped or not)
+    :param metadata: Entries in form [[offset,length,path,...],...]
+    :param workers: Number of threads, default: number of CPUs
+    :param algorithm: Any algorithm supported by hashlib
+    :return: List of [path, offset, length, digest] in archive order
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        digests = list(executor.map(lambda entry: reader.get_entry_hash(entry, algorithm), metadata))
+    return [[entry[2], entry[0], entry[1], digest] for entry, digest in zip(metadata, digests)]
+
+
+def get_manifest_path(file_path):
+    """
+    :return: Default path of the manifest for an archive
+    """
+    return file_path + '.manifest.txt'
+
+
+def write_manifest(file_path, manifest, algorithm='sha256', filters=None):
+    """
+    Write a manifest as text: a header line, then path, offset, length and digest separated by tabs
+    :param filters: Dict with the arguments of GFSReader.filter_metadata() if the manifest was made for some
+                    entries only, they are written as JSON in a second header line
+    """
+    with open(file_path, 'w', encoding='ascii', newline='\n') as f:
+        f.write(MANIFEST_IDENTIFIER + ' ' + algorithm + '\n')
+        if filters is not None:
+            f.write(MANIFEST_FILTER + ' ' + json.dumps(filters) + '\n')
+        for path, offset, length_in_bytes, digest in manifest:
+            f.write(path + '\t' + str(offset) + '\t' + str(length_in_bytes) + '\t' + digest + '\n')
+
+
+def read_manifest(file_path):
+    """
+    :raise ValueError: Not a manifest
+    :return: algorithm, list of [path, offset, length, digest], filters (see write_manifest()) or None
+    """
+    with open(file_path, 'r', encoding='ascii') as f:
+        first_line = f.readline().rstrip('\n')
+        if not first_line.startswith(MANIFEST_IDENTIFIER + ' '):
+            raise ValueError("Not a GFS manifest: " + file_path)
+        algorithm = first_line[len(MANIFEST_IDENTIFIER) + 1:]
+        filters = None
+        manifest = []
+        for line_number, line in enumerate(f, 2):
+            try:
+                if line.startswith(MANIFEST_FILTER + ' ') and filters is None and not manifest:
+                    filters = json.loads(line[len(MANIFEST_FILTER) + 1:])
+                    continue
+                path, offset, length_in_bytes, digest = line.rstrip('\n').split('\t')
+                manifest.append([path, int(offset), int(length_in_bytes), digest])
+            except ValueError:  # Wrong number of columns, a column that isn't a number or broken filters
+                raise ValueError("Not a GFS manifest: " + file_path + " (line " + str(line_number) + ")") from None
+    return algorithm, manifest, filters
+
+
+def verify_archive(file_path, manifest_path=None, workers=None, memory_map=False):
+    """
+    Check the header of an archive against the file and read (hash) every entry
+    :param file_path: Path to the .gfs file
+    :param manifest_path: Compare the entries with this manifest (see write_manifest()), only the entries
+                          that match the filters of the manifest are hashed and compared
+    :param workers: Number of threads for hashing
+    :param memory_map: See GFSReader
+    :return: List of problems, empty if the archive is fine
+    """
+    problems = []
+    reader = GFSReader(file_path, memory_map)
+    try:
+        try:
+            metadata = reader.read_references()
+        except ValueError as e:  # Includes a header that doesn't end before the data portion
+            return ["Header can't be read: " + str(e)]
+        valid_entries = []
+        for entry in metadata:
+            if entry[0] + entry[1] > reader.file_size:
+                problems.append("Entry ends at " + str(entry[0] + entry[1]) + ", after the end of the file (" +
+                                str(reader.file_size) + "): " + entry[2])
+            else:
+                valid_entries.append(entry)
+
+        algorithm = 'sha256'
+        expected = None
+        if manifest_path is not None:
+            algorithm, expected_manifest, filters = read_manifest(manifest_path)
+            expected = {row[0]: row for row in expected_manifest}
+            if filters is not None:
+                valid_entries = GFSReader.filter_metadata({'path': file_path, 'metadata': valid_entries},
+                                                          **filters)['metadata']
+        manifest = get_manifest(reader, valid_entries, workers, algorithm)
+        if expected is not None:
+            for row in manifest:
+                expected_row = expected.pop(row[0], None)
+                if expected_row is None:
+                    problems.append("Not in manifest: " + row[0])
+                elif expected_row != row:
+                    problems.append("Differs from manifest: " + row[0])
+            archive_paths = set(entry[2] for entry in metadata)
+            for path in expected:
+                if path not in archive_paths:
+                    problems.append("Missing in archive: " + path)
+    finally:
+        reader.close()
+    return problems
+
+
+def diff_archives(old_file_path, new_file_path, workers=None, memory_map=False):
+    """
+    Compare two versions of an archive by their headers, only entries with the same path and length are hashed
+    Nothing is written to disk
+    :param old_file_path: Path to the older .gfs file
+    :param new_file_path: Path to the newer .gfs file
+    :param workers: Number of threads for hashing
+    :param memory_map: See GFSReader
+    :return: Dict with the sorted paths of 'added', 'removed' and 'modified' entries
+    """
+    old_reader = GFSReader(old_file_path, memory_map)
+    new_reader = None
+    try:
+        new_reader = GFSReader(new_file_path, memory_map)
+        old_entries = {entry[2]: entry for entry in old_reader.get_metadata()['metadata']}
+        new_entries = {entry[2]: entry for entry in new_reader.get_metadata()['metadata']}
+        added = sorted(path for path in new_entries if path not in old_entries)
+        removed = sorted(path for path in old_entries if path not in new_entries)
+        modified = []
+        same_length = []
+        for path, new_entry in new_entries.items():
+            old_entry = old_entries.get(path)
+            if old_entry is None:
+                continue
+            if old_entry[1] != new_entry[1]:
+                modified.append(path)
+            else:
+                same_length.append(path)
+
+        def is_modified(path):
+            return old_reader.get_entry_hash(old_entries[path]) != new_reader.get_entry_hash(new_entries[path])
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            modified += [path for path, changed in zip(same_length, executor.map(is_modified, same_length))
+                         if changed]
+    finally:
+        old_reader.close()
+        if new_reader is not None:
+            new_reader.close()
+    return {'added': added, 'removed': removed, 'modified': sorted(modified)}
@@ -0,0 +1,101 @@
+ORDER_POLICIES = ('walk', 'directory', 'stem', 'extension', 'trace')
+
+
+def order_metadata(metadata, policy, trace_path=None):
+    """
+    Change the order of the entries of an archive that is packed, files that are read together should be next
+    to each other (the game reads less and selective unpacking seeks less)
+    walk: keep the order of os.walk() (filesystem dependent)
+    directory: all files of a directory together, directories and files sorted by name
+    stem: like directory, files with the same name but another extension are next to each other
+          (like sprite.spr.msb and sprite.dds)
+    extension: all files with the same extension together (like all .dds), then like directory
+    trace: files in the order of a trace file (see read_trace()) first, all other files afterwards like stem
+    :raise ValueError: Unknown policy or trace without a trace file
+    :param metadata: File list from GFSWriter.get_metadata() in form [name, size, name, size, ...]
+    :param policy: One of ORDER_POLICIES
+    :param trace_path: Trace file for the trace policy
+    :return: Reordered file list in the same form
+    """
+    if policy not in ORDER_POLICIES:
+        raise ValueError("Unknown order policy: " + str(policy) + ", available: " + ', '.join(ORDER_POLICIES))
+    if policy == 'trace' and trace_path is None:
+        raise ValueError("The trace policy needs a trace file")
+    sizes = dict(zip(metadata[0::2], metadata[1::2]))
+    names = list(sizes)
+    if policy == 'directory':
+        names.sort(key=get_directory_key)
+    elif policy == 'stem':
+        names.sort(key=get_stem_key)
+    elif policy == 'extension':
+        names.sort(key=get_extension_key)
+    elif policy == 'trace':
+        traced_names = [name for name in read_trace(trace_path) if name in sizes]
+        traced = set(traced_names)
+        names = traced_names + sorted((name for name in names if name not in traced), key=get_stem_key)
+    ordered_metadata = []
+    for name in names:
+        ordered_metadata.append(name)
+        ordered_metadata.append(sizes[name])
+    return ordered_metadata
+
+
+def get_directory_key(path):
+    directory, _, file_name = path.lower().rpartition('/')
+    return (directory.split('/') if directory else []), file_name, path
+
+
+def get_stem_key(path):
+    directory, _, file_name = path.lower().rpartition('/')
+    stem, _, extension = file_name.partition('.')
+    return (directory.split('/') if directory else []), stem, extension, path
+
+
+def get_extension_key(path):
+    extension = path.lower().rpartition('/')[2].partition('.')[2]
+    return (extension,) + get_directory_key(path)
+
+
+def read_trace(file_path):
+    """
+    Read an access order trace: one entry path per line in the order the entries were read
+    Empty lines and lines starting with # are skipped, anything after a tab is ignored
+    (the output of a manifest can be used), an entry that is read again keeps its first position
+    :return: List of unique paths in access order
+    """
+    paths = []
+    seen = set()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            path = line.rstrip('\r\n').split('\t', 1)[0].replace('\\', '/').strip('/')
+            if not path or path.startswith('#') or path in seen:
+                continue
+            seen.add(path)
+            paths.append(path)
+    return paths
+
+
+def get_seek_distance(metadata, trace):
+    """
+    Simulate reading the entries of an archive in the order of a trace
+    A gap smaller than the alignment of the next entry is padding and is read like data, not counted as a seek
+    :param metadata: Entries in form [[offset,length,path,alignment],...]
+    :param trace: List of paths in access order (see read_trace())
+    :return: Dict with 'reads', 'seeks', 'distance' (sum of all seeks in bytes) and 'missing' (paths not in the archive)
+    """
+    entries = {entry[2]: entry for entry in metadata}
+    result = {'reads': 0, 'seeks': 0, 'distance': 0, 'missing': 0}
+    position = None
+    for path in trace:
+        entry = entries.get(path)
+        if entry is None:
+            result['missing'] += 1
+            continue
+        result['reads'] += 1
+        if position is not None:
+            gap = entry[0] - position
+            if not 0 <= gap < entry[3]:
+                result['seeks'] += 1
+                result['distance'] += abs(gap)
+        position = entry[0] + entry[1]
+    return result
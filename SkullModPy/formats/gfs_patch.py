@@ -0,0 +1,156 @@
+import functools
+import os
+from SkullModPy.common.fileio import copy_range, pread, pwrite
+from SkullModPy.formats.gfs import GFSArchive, GFSEntryFile, GFSReader, GFSStreamWriter
+
+# Offset of the first entry in the header: data offset, identifier, version and number of files
+HEADER_ENTRIES_OFFSET = GFSReader.HEADER_START.size + len(GFSReader.FILE_IDENTIFIER) + \
+                        GFSReader.HEADER_UINT64.size + len(GFSReader.FILE_VERSION) + GFSReader.HEADER_UINT64.size
+
+
+def patch_archive(file_path, replacements, workers=None):
+    """
+    Replace entries of an archive with files
+    If every new file fits into the slot of its entry (the offsets of the following entries stay the same,
+    common for aligned archives) only the length fields in the header and the payloads are written,
+    otherwise the archive is repacked and the other entries are copied from it
+    The archive is unchanged if an error occurs
+    :raise FileNotFoundError: An entry isn't in the archive
+    :raise ValueError: The archive has to be repacked but its entries have different alignments
+    :param file_path: Path to the .gfs file
+    :param replacements: Dict of entry path ==> path of the new file
+    :param workers: Number of threads for repacking, see GFSStreamWriter.write()
+    :return: True if the archive was patched in place, False if it was repacked
+    """
+    with GFSArchive(file_path) as archive:
+        metadata = archive.metadata['metadata']
+        indices = {}
+        for entry_path, source_path in replacements.items():
+            entry = archive.get_entry(entry_path)
+            indices[entry[2]] = source_path
+        patches = []
+        for index, entry in enumerate(metadata):
+            if entry[2] in indices:
+                source_path = indices[entry[2]]
+                patches.append((index, source_path, os.path.getsize(source_path)))
+        remove_sidecars(file_path)
+        if all(fits_in_place(metadata, index, new_length) for index, _, new_length in patches):
+            header_positions = get_length_positions(metadata)
+            archive.close()
+            with open(file_path, 'r+b') as f:
+                # Everything that is overwritten is kept to restore it after an error
+                file_size = os.fstat(f.fileno()).st_size
+                backup = []
+                for index, _, _ in patches:
+                    slot_end = file_size if index == len(metadata) - 1 else metadata[index + 1][0]
+                    backup.append((metadata[index][0], pread(f.fileno(), slot_end - metadata[index][0],
+                                                             metadata[index][0])))
+                    backup.append((header_positions[index], pread(f.fileno(), GFSReader.HEADER_UINT64.size,
+                                                                  header_positions[index])))
+                try:
+                    for index, source_path, new_length in patches:
+                        write_in_place(f.fileno(), metadata, index, header_positions[index], source_path,
+                                       new_length, index == len(metadata) - 1)
+                except BaseException:
+                    os.ftruncate(f.fileno(), file_size)
+                    for position, data in backup:
+                        pwrite(f.fileno(), data, position)
+                    raise
+            return True
+        repack_archive(archive, file_path, indices, workers)
+    return False
+
+
+def remove_sidecars(file_path):
+    """
+    Remove the index cache and the source index of an archive before it is changed, an in-place patch keeps
+    the size of the archive and on file systems with coarse times (FAT, ext3) maybe also its modification time,
+    so the sidecars could be taken as valid for the changed archive
+    """
+    for sidecar_path in (os.path.abspath(file_path) + GFSReader.INDEX_CACHE_EXTENSION,
+                         GFSReader.get_source_index_path(file_path)):
+        try:
+            os.remove(sidecar_path)
+        except FileNotFoundError:
+            pass
+
+
+def fits_in_place(metadata, index, new_length):
+    """
+    :param metadata: Entries in form [[offset,length,path,alignment],...]
+    :param index: Index of the entry that is replaced
+    :param new_length: Length of the new payload
+    :return: True if the following entries keep their offsets (always true for the last entry)
+    """
+    if index + 1 == len(metadata):
+        return True
+    new_end = metadata[index][0] + new_length
+    next_alignment = metadata[index + 1][3]
+    return new_end + (next_alignment - new_end % next_alignment) % next_alignment == metadata[index + 1][0]
+
+
+def get_length_positions(metadata):
+    """
+    :return: Position of the length field of every entry in the header
+    """
+    positions = []
+    position = HEADER_ENTRIES_OFFSET
+    for entry in metadata:
+        position += GFSReader.HEADER_UINT64.size + len(entry[2])  # path length + path
+        positions.append(position)
+        position += GFSReader.HEADER_ENTRY_END.size  # length + alignment
+    return positions
+
+
+def write_in_place(fd, metadata, index, length_position, source_path, new_length, is_last):
+    """
+    Write a payload into the slot of an entry, a shorter payload gets the rest of the old one zeroed,
+    the length in the header is written last
+    """
+    offset, old_length, _, alignment = metadata[index]
+    with open(source_path, 'rb') as source:
+        copy_range(source.fileno(), fd, 0, offset, new_length)
+    position = offset + new_length
+    if is_last:  # The archive ends after the (aligned) last entry
+        end = position + (alignment - position % alignment) % alignment
+        os.ftruncate(fd, end)
+    else:
+        end = offset + old_length
+    while position < end:
+        chunk_length = min(GFSReader.COPY_BUFFER_SIZE, end - position)
+        pwrite(fd, bytes(chunk_length), position)
+        position += chunk_length
+    pwrite(fd, GFSReader.HEADER_UINT64.pack(new_length), length_position)
+
+
+def repack_archive(archive, file_path, replacements, workers=None):
+    """
+    Write the archive again with the same order, entries that aren't replaced are copied from the old archive
+    :param archive: Open GFSArchive of file_path, closed afterwards
+    :param replacements: Dict of entry path ==> path of the new file
+    """
+    metadata = archive.metadata['metadata']
+    # GFSStreamWriter uses one alignment for all entries (like the archives of the game)
+    alignments = set(entry[3] for entry in metadata)
+    if len(alignments) > 1:
+        archive.close()
+        raise ValueError("Can't repack an archive with different alignments: " +
+                         ', '.join(map(str, sorted(alignments))))
+    alignment = alignments.pop() if alignments else 1
+    entries = []
+    for entry in metadata:
+        if entry[2] in replacements:
+            source_path = replacements[entry[2]]
+            entries.append((entry[2], os.path.getsize(source_path), functools.partial(open, source_path, 'rb')))
+        else:
+            entries.append((entry[2], entry[1], GFSEntryFile(archive.reader, entry)))
+    output_path = file_path + '.tmp'
+    try:
+        GFSStreamWriter(output_path, alignment > 1, alignment).write(entries, workers)
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    finally:
+        archive.close()
+    os.replace(output_path, file_path)
@@ -1,6 +1,8 @@
 import os
 import struct
+from array import array
 from SkullModPy.common.CommonConstants import LITTLE_ENDIAN
+from SkullModPy.common.Image import Image
 from SkullModPy.common.Reader import Reader
 from SkullModPy.common.helper import abgr8
 from SkullModPy.formats.png import PNGWriter
@@ -64,8 +66,6 @@ class PCXReader(Reader):
         bytes_per_plane_line = metadata[2]
 
         # Decompress the image
-
-        image_data = [[0] * width for _ in range(height)]
         decompressed_indices_buffer = bytearray()
         while len(decompressed_indices_buffer) < (bytes_per_plane_line*height):
             # Read 'instruction' byte which contains how often the following byte has to be repeated
@@ -90,21 +90,16 @@ class PCXReader(Reader):
             color = struct.unpack("3B", self.file.read(3))
             palette[palette_entry] = abgr8(color[0], color[1], color[2], 255)
 
-        # Create image data
-        for y in range(height):
-            for x in range(width):
-                color_index = decompressed_indices_buffer[y*bytes_per_plane_line + x]
-                image_data[y][x] = color_index
-        # Change indices to actual color values
-        for y in range(height):
-            for x in range(width):
-                image_data[y][x] = palette[image_data[y][x]]  # Replace palette index with color
+        # Create image data, replace the palette indices with the colors
+        # A line has bytes_per_plane_line indices, the ones after width are padding
+        colors = array('I', map(palette.__getitem__, decompressed_indices_buffer[:bytes_per_plane_line * height]))
+        image = Image(width, height, colors, bytes_per_plane_line)
 
         # Finished with this file, close it
         self.file.close()
-        return [image_data, width, height]
+        return [image, width, height]
 
-    def write_png(self, data):
+    def write_png(self, image):
         png = PNGWriter(os.path.splitext(self.file_path)[0] + '.png')
-        png.set_data_argb8_array(data)
+        png.set_image(image)
         png.write()
@@ -1,5 +1,6 @@
 import os
 import struct
+import sys
 import zlib
 
 
@@ -27,19 +28,14 @@ class PNGWriter:
             for x in range(self.width):
                 self.data += struct.pack('<L', data[y * width + x])
 
-    def set_data_argb8_array(self, data, width=None, height=None):
+    def set_image(self, image):
         """
-        Prepare abgr8 data for writing
-        :param data: 2D array (first dimension ... y, second ... x) with abgr8 int
+        Prepare an Image for writing, see get_scanlines()
+        :param image: Image with abgr8 int
         """
-        self.width = len(data[0]) if width is None else width
-        self.height = len(data) if height is None else height
-
-        self.data = bytearray()
-        for y in range(0, self.height):
-            self.data += b'\x00'  # Line start
-            for x in range(0, self.width):
-                self.data += struct.pack('<L', data[y][x])
+        self.width = image.width
+        self.height = image.height
+        self.data = get_scanlines(image)
 
     def write(self):
         """
@@ -70,3 +66,100 @@ class PNGWriter:
         """
         chunk_head = png_tag + data
         return struct.pack("!I", len(data)) + chunk_head + struct.pack("!I", 0xFFFFFFFF & zlib.crc32(chunk_head))
+
+
+class PNGStreamWriter:
+    """
+    PNG writer that compresses the rows as soon as they are added, rows can be added in several parts
+    Only the compressed data of one IDAT chunk is kept in memory, the png is complete after close()
+    An incomplete png is removed (when an error occurs inside 'with' or close() fails)
+    """
+    IDAT_SIZE = 2 ** 18  # Bytes of compressed data per IDAT chunk
+
+    def __init__(self, path, width, height):
+        """
+        :raise IsADirectoryError: The given path is a directory
+        """
+        if os.path.isdir(path):
+            raise IsADirectoryError("The given path is a directory")
+        if os.path.isfile(path):
+            print("Found a file at given path, will be overwritten")
+        self.file_path = path
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.compressor = zlib.compressobj(9)
+        self.compressed_data = bytearray()
+        self.file = open(path, 'wb')
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self.file.write(PNGWriter.png_pack(b'IHDR', struct.pack("!2I5B", width, height, 8, 6, 0, 0, 0)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write_rows(self, image):
+        """
+        Add the next rows
+        :raise ValueError: The width is different or there are more rows than the height of the png
+        :param image: Image with abgr8 int, as wide as the png
+        """
+        if image.width != self.width or self.rows_written + image.height > self.height:
+            raise ValueError("Rows don't fit into the png")
+        self.rows_written += image.height
+        self.compressed_data += self.compressor.compress(get_scanlines(image))
+        while len(self.compressed_data) >= PNGStreamWriter.IDAT_SIZE:
+            self.file.write(PNGWriter.png_pack(b'IDAT', bytes(self.compressed_data[:PNGStreamWriter.IDAT_SIZE])))
+            del self.compressed_data[:PNGStreamWriter.IDAT_SIZE]
+
+    def close(self):
+        """
+        Write the rest of the compressed data and the end of the png
+        :raise ValueError: Not all rows were written
+        """
+        try:
+            if self.rows_written != self.height:
+                raise ValueError("Only " + str(self.rows_written) + " of " + str(self.height) + " rows were written")
+            self.compressed_data += self.compressor.flush()
+            self.file.write(PNGWriter.png_pack(b'IDAT', bytes(self.compressed_data)))
+            self.file.write(PNGWriter.png_pack(b'IEND', b''))
+            self.file.close()
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self.compressed_data = bytearray()
+
+    def abort(self):
+        """
+        Close and remove the incomplete png
+        """
+        self.file.close()
+        if os.path.isfile(self.file_path):
+            os.remove(self.file_path)
+
+
+def get_scanlines(image):
+    """
+    Get the rows of an Image as png scanlines (filter type 0), the rows are copied as they are
+    (abgr8 in little endian is rgba8)
+    :param image: Image with abgr8 int
+    :return: bytearray
+    """
+    pixels = image.data
+    if sys.byteorder == 'big':
+        pixels = pixels[:image.stride * image.height]
+        pixels.byteswap()
+    row_length = image.width * 4
+    stride = image.stride * 4
+    data = bytearray()
+    with memoryview(pixels) as view, view.cast('B') as pixel_bytes:
+        for y in range(image.height):
+            data += b'\x00'  # Line start
+            data += pixel_bytes[y * stride:y * stride + row_length]
+    return data
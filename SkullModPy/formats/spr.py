@@ -1,6 +1,8 @@
+import functools
 import os
 import struct
 from SkullModPy.common.CommonConstants import BIG_ENDIAN
+from SkullModPy.common.Image import Image
 from SkullModPy.common.Reader import Reader
 from SkullModPy.formats.dds import DDSReader
 from SkullModPy.formats.png import PNGWriter
@@ -61,11 +63,16 @@ class SPR(Reader):
     FILE_VERSION = "2.0"
     DATA_FORMAT_STRING = "unigned char tile_x, tile_y, tile_u, tile_v;"
 
-    def __init__(self, file_path, charselect=False, charselect_palette=None):
+    def __init__(self, file_path, charselect=False, charselect_palette=None, engine=None):
+        """
+        :param charselect_palette: Image of the palette dds for charselect
+        :param engine: Decoder for the .dds file, see DDSReader
+        """
         super().__init__(open(file_path, "rb"), os.path.getsize(file_path), BIG_ENDIAN)
         self.file_path = os.path.abspath(file_path)
         self.charselect = charselect
         self.charselect_palette = charselect_palette
+        self.engine = engine
 
     def read_spr(self):
         if self.read_pascal_string() != SPR.FILE_VERSION:
@@ -111,31 +118,12 @@ class SPR(Reader):
         dds_path = base_dir + '.dds'
         if not os.path.exists(dds_path) or not os.path.isfile(dds_path):
             raise ValueError("dds file is missing or a directory where dds file should be")
-        dds = DDSReader(base_dir + '.dds', self.charselect)
-        png_data = dds.get_png_data()[0]
-
-        # Apply palette
+        # Only the tiles that are used by frames are decoded
+        # The palette is applied once per color that occurs in the sprite
+        transform = None
         if self.charselect:
-            for y in range(len(png_data)):
-                for x in range(len(png_data[0])):
-                    colors = rgb565_split(png_data[y][x])
-                    r = colors['r']
-                    g = colors['g']
-                    b = colors['b']
-                    color = self.charselect_palette[g][int(b/2)] # TODO round?
-                    png_data[y][x] = color
-                    # Apply outline
-                    # r ... outline blending intensity (blend not if 255, blend completly if 0)
-                    # b/2? ... x-coordinate in the palette
-                    # g ... y-coordinate in the palette
-                    if r != 31:
-                        split_color = split_abgr8(color)
-
-                        new_color = abgr8(int(split_color['r'] * (r/31.0)), # TODO round?
-                                          int(split_color['g'] * (r/31.0)),
-                                          int(split_color['b'] * (r/31.0)),
-                                          255)
-                        png_data[y][x] = new_color
+            transform = functools.lru_cache(maxsize=None)(self.get_charselect_color)
+        dds_image = DDSReader(base_dir + '.dds', self.charselect, self.engine).get_image(transform=transform)
 
         # Create directories
         if not os.path.exists(base_dir):
@@ -152,15 +140,15 @@ class SPR(Reader):
                 frame_width = bounds[0]
                 frame_height = bounds[1]
                 # Make image data
-                frame_image_data = [[0] * frame_width for _ in range(frame_height)]
+                frame_image = Image(frame_width, frame_height)
 
                 for entry in range(frame.block_offset, frame.block_offset + frame.n_of_blocks, 1):
-                    self.move_rect(frame_image_data, png_data, entries[entry].tile_u, entries[entry].tile_v,
+                    self.move_rect(frame_image, dds_image, entries[entry].tile_u, entries[entry].tile_v,
                                    entries[entry].tile_x, entries[entry].tile_y, block_width, block_height)
                 # Write image
                 png = PNGWriter(os.path.join(base_dir, sprite_name, animation.animation_name,
                                              str(framenumber - animation.frame_offset) + '.png'))
-                png.set_data_argb8_array(frame_image_data)
+                png.set_image(frame_image)
                 png.write()
                 # Create meta files
                 with open(os.path.join(base_dir, sprite_name, animation.animation_name,
@@ -199,13 +187,38 @@ class SPR(Reader):
                 html.writelines(["</div>\n",
                                 "</body>\n",
                                 "</html>"])
+        dds_image.close()
+
+    def get_charselect_color(self, color):
+        """
+        Apply the palette to a pixel of a charselect sprite
+        r ... outline blending intensity (blend not if 255, blend completly if 0)
+        b/2? ... x-coordinate in the palette
+        g ... y-coordinate in the palette
+        :param color: rgb565 color
+        :return: abgr8 color
+        """
+        colors = rgb565_split(color)
+        r = colors['r']
+        g = colors['g']
+        b = colors['b']
+        if b // 2 >= self.charselect_palette.width or g >= self.charselect_palette.height:
+            raise IndexError("Charselect color is outside of the palette")
+        color = self.charselect_palette.get_pixel(b // 2, g)  # TODO round?
+        # Apply outline
+        if r != 31:
+            split_color = split_abgr8(color)
+
+            color = abgr8(int(split_color['r'] * (r/31.0)), # TODO round?
+                          int(split_color['g'] * (r/31.0)),
+                          int(split_color['b'] * (r/31.0)),
+                          255)
+        return color
 
     @staticmethod
-    def move_rect(frame_image_data, png_data, tile_u, tile_v, tile_x, tile_y, block_width, block_height):
-        for y in range(block_height):
-            for x in range(block_width):
-                frame_image_data[tile_y * block_height + y][tile_x * block_width + x] = \
-                    png_data[tile_v * block_height + y][tile_u * block_width + x]
+    def move_rect(frame_image, dds_image, tile_u, tile_v, tile_x, tile_y, block_width, block_height):
+        tile = dds_image.get_region(tile_u * block_width, tile_v * block_height, block_width, block_height)
+        frame_image.paste(tile, tile_x * block_width, tile_y * block_height)
 
     @staticmethod
     def max_bounds(entries, block_offset, n_of_blocks, block_width, block_height):
@@ -0,0 +1,108 @@
+import os
+
+from SkullModPy.formats.gfs import GFSArchive, GFSEntryFile
+
+
+class VirtualFileSystem:
+    """
+    Merged view of several .gfs archives and directories (like unpacked mods)
+    Layers are mounted in priority order: a layer that is mounted later shadows the entries of earlier layers
+    All paths use '/' as delimiter, nothing is extracted
+    """
+
+    def __init__(self, paths=None, memory_map=False, use_cache=False):
+        """
+        :param paths: .gfs files and directories to mount, lowest priority first
+        :param memory_map: See GFSReader
+        :param use_cache: See GFSReader.get_metadata()
+        """
+        self.memory_map = memory_map
+        self.use_cache = use_cache
+        self.layers = []
+        # path ==> (layer, entry) entry is the archive entry or the absolute path of a file in a directory
+        self.index = {}
+        for path in paths or []:
+            self.mount(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, path):
+        return GFSArchive.normalize_path(path) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def mount(self, path, mount_point=''):
+        """
+        Add a layer on top of all other layers
+        :raise NotADirectoryError: Neither a .gfs file nor a directory
+        :param path: .gfs file or directory
+        :param mount_point: Prefix for all paths of this layer
+        """
+        mount_point = GFSArchive.normalize_path(mount_point)
+        prefix = mount_point + '/' if mount_point else ''
+        if os.path.isdir(path):
+            layer = os.path.abspath(path)
+            base_path_length = len(layer) + 1  # +1 because of the path delimiter
+            for root, subdirs, files in os.walk(layer):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    self.index[prefix + file_path[base_path_length:].replace('\\', '/')] = (layer, file_path)
+        elif os.path.isfile(path):
+            layer = GFSArchive(path, self.memory_map, self.use_cache)
+            for entry in layer.metadata['metadata']:
+                self.index[prefix + entry[2]] = (layer, entry)
+        else:
+            raise NotADirectoryError("Not a .gfs file or a directory: " + path)
+        self.layers.append(layer)
+
+    def resolve(self, path):
+        """
+        Find the layer an entry is read from
+        :raise FileNotFoundError: No layer contains the path
+        :return: Path of the .gfs file or directory
+        """
+        layer = self.get_entry(path)[0]
+        return layer.file_path if isinstance(layer, GFSArchive) else layer
+
+    def get_entry(self, path):
+        try:
+            return self.index[GFSArchive.normalize_path(path)]
+        except KeyError:
+            raise FileNotFoundError("No layer contains: " + path) from None
+
+    def get_paths(self):
+        return list(self.index)
+
+    def open(self, path):
+        """
+        Open the version of the file in the layer with the highest priority
+        :raise FileNotFoundError: No layer contains the path
+        :return: Read-only binary file object
+        """
+        layer, entry = self.get_entry(path)
+        if isinstance(layer, GFSArchive):
+            return GFSEntryFile(layer.reader, entry)
+        return open(entry, 'rb')
+
+    def read(self, path):
+        """
+        :raise FileNotFoundError: No layer contains the path
+        :return: File content as bytes
+        """
+        layer, entry = self.get_entry(path)
+        if isinstance(layer, GFSArchive):
+            return layer.reader.read_at(entry[0], entry[1])
+        with open(entry, 'rb') as f:
+            return f.read()
+
+    def close(self):
+        for layer in self.layers:
+            if isinstance(layer, GFSArchive):
+                layer.close()
+        self.layers = []
+        self.index = {}
@@ -0,0 +1,127 @@
+import os
+import random
+import struct
+import sys
+import zlib
+import pytest
+
+# Run the tests against the SkullModPy package of this checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SkullModPy.formats.gfs import GFSWriter  # noqa: E402
+
+# Sizes around the alignment, an empty file and nested directories
+FILE_SIZES = {
+    'a.bin': 5000,
+    'empty.txt': 0,
+    'sub/b.dds': 4096,
+    'sub/c.dds': 4097,
+    'sub/deeper/d.lua': 13,
+}
+
+
+def write_directory(path, contents):
+    """
+    :param contents: Dict of path ('/' as delimiter) ==> bytes
+    """
+    for name, data in contents.items():
+        file_path = os.path.join(path, *name.split('/'))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as f:
+            f.write(data)
+
+
+# Bytes per 4x4 block
+DXT_BLOCK_SIZES = {'DXT1': 8, 'DXT3': 16, 'DXT5': 16}
+# Uncompressed formats: bitcount, r/g/b/a bitmasks
+UNCOMPRESSED_FORMATS = {'ARGB8': (32, 0xFF0000, 0xFF00, 0xFF, 0xFF000000), 'RGB565': (16, 0xF800, 0x7E0, 0x1F, 0)}
+
+
+def make_dds(path, width, height, fourcc, has_alpha_pixels=False, mipmap_count=1, seed=0, n_of_distinct_blocks=None):
+    """
+    Write a DDS file with random blocks (or random pixels for UNCOMPRESSED_FORMATS)
+    :param n_of_distinct_blocks: Pick every block from this many random blocks (runs of equal blocks), default: all
+                                 blocks are random
+    """
+    rng = random.Random(seed)
+    if fourcc in UNCOMPRESSED_FORMATS:
+        bitcount, r_bitmask, g_bitmask, b_bitmask, a_bitmask = UNCOMPRESSED_FORMATS[fourcc]
+        pixel_format = struct.pack('<2I4s5I', 32, 0x40 | (0x1 if a_bitmask else 0), bytes(4), bitcount, r_bitmask,
+                                   g_bitmask, b_bitmask, a_bitmask)
+        block_size = bitcount // 8  # A "block" is a pixel
+    else:
+        pixel_format = struct.pack('<2I4s5I', 32, 0x4 | (0x1 if has_alpha_pixels else 0), fourcc.encode(), 0, 0, 0, 0,
+                                   0)
+        block_size = DXT_BLOCK_SIZES[fourcc]
+    distinct_blocks = None
+    if n_of_distinct_blocks is not None:
+        distinct_blocks = [bytes(rng.getrandbits(8) for _ in range(block_size)) for _ in range(n_of_distinct_blocks)]
+    data = bytearray()
+    level_width, level_height = width, height
+    for _ in range(mipmap_count):
+        if fourcc in UNCOMPRESSED_FORMATS:
+            n_of_blocks = level_width * level_height
+        else:
+            n_of_blocks = ((level_width + 3) // 4) * ((level_height + 3) // 4)
+        if distinct_blocks is None:
+            data += bytes(rng.getrandbits(8) for _ in range(n_of_blocks * block_size))
+        else:
+            data += b''.join(rng.choice(distinct_blocks) for _ in range(n_of_blocks))
+        level_width, level_height = max(1, level_width // 2), max(1, level_height // 2)
+    flags = 0x1 | 0x2 | 0x4 | 0x1000 | 0x80000 | (0x20000 if mipmap_count > 1 else 0)
+    caps = 0x1000 | (0x400008 if mipmap_count > 1 else 0)
+    header = struct.pack('<7I', 124, flags, height, width, 0, 0, mipmap_count) + bytes(44) + pixel_format + \
+        struct.pack('<5I', caps, 0, 0, 0, 0)
+    with open(path, 'wb') as f:
+        f.write(b'DDS ' + header + data)
+
+
+def read_png(path):
+    """
+    :return: IHDR and the decompressed IDAT data, the compression of two pngs may differ
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    position = 8
+    header = None
+    image_data = b''
+    while position < len(data):
+        length_in_bytes, tag = struct.unpack('>I4s', data[position:position + 8])
+        body = data[position + 8:position + 8 + length_in_bytes]
+        assert struct.unpack('>I', data[position + 8 + length_in_bytes:position + 12 + length_in_bytes])[0] == \
+            zlib.crc32(tag + body)
+        if tag == b'IHDR':
+            header = body
+        elif tag == b'IDAT':
+            image_data += body
+        position += 12 + length_in_bytes
+    assert tag == b'IEND'
+    return header, zlib.decompress(image_data)
+
+
+@pytest.fixture
+def contents():
+    """
+    Random content for every file of FILE_SIZES
+    """
+    rng = random.Random(0)
+    return {name: bytes(rng.getrandbits(8) for _ in range(size)) for name, size in FILE_SIZES.items()}
+
+
+@pytest.fixture
+def pack(tmp_path):
+    """
+    Pack files with GFSWriter into tmp_path/<name>.gfs, the source directory is tmp_path/source/<name>
+    (unpacking writes next to the archive, so it is kept away from the source)
+    :return: Function (contents, is_aligned=False, workers=None, name='data') ==> archive path
+    """
+    def pack_contents(contents, is_aligned=False, workers=None, name='data'):
+        source = str(tmp_path / 'source' / name)
+        write_directory(source, contents)
+        writer = GFSWriter(source, is_aligned)
+        writer.write_content(writer.get_metadata(), None, workers)
+        archive_path = str(tmp_path / (name + '.gfs'))
+        os.replace(source + '.gfs', archive_path)
+        return archive_path
+    return pack_contents
@@ -0,0 +1,233 @@
+import os
+import pytest
+from conftest import make_dds, read_png
+from SkullModPy.formats import dds
+from SkullModPy.formats.dds import DDSHeader, DDSReader
+
+# width, height, fourcc, has_alpha_pixels, sizes that are not a multiple of 4 have padded blocks
+IMAGES = [(36, 20, 'DXT1', False), (36, 20, 'DXT1', True), (3, 5, 'DXT1', True), (36, 20, 'DXT3', False),
+          (10, 6, 'DXT3', True), (36, 20, 'DXT5', False), (10, 6, 'DXT5', True), (36, 20, 'ARGB8', False),
+          (7, 5, 'ARGB8', False), (36, 20, 'RGB565', False), (7, 5, 'RGB565', False)]
+
+# The python engine has no block decoder, it is only used as reference
+ENGINES = [engine for engine in DDSReader.ENGINES if engine != 'python']
+
+needs_numpy = pytest.mark.skipif(not DDSReader.has_numpy(), reason="NumPy is not installed")
+
+
+def get_image_id(image):
+    width, height, fourcc, has_alpha_pixels = image
+    return fourcc + '_' + str(width) + 'x' + str(height) + ('_alpha' if has_alpha_pixels else '')
+
+
+@pytest.fixture(params=IMAGES, ids=get_image_id)
+def dds_path(tmp_path, request):
+    width, height, fourcc, has_alpha_pixels = request.param
+    path = str(tmp_path / 'image.dds')
+    make_dds(path, width, height, fourcc, has_alpha_pixels, seed=width * height)
+    return path
+
+
+@pytest.fixture(params=[(36, 20, 'DXT1', True), (10, 6, 'DXT5', False), (7, 5, 'ARGB8', False),
+                        (36, 20, 'RGB565', False)], ids=get_image_id)
+def mipmap_path(tmp_path, request):
+    """
+    Image with 3 mip levels, the last one is 9x5, 2x1 or 1x1
+    """
+    width, height, fourcc, has_alpha_pixels = request.param
+    path = str(tmp_path / 'image.dds')
+    make_dds(path, width, height, fourcc, has_alpha_pixels, 3, seed=width * height)
+    return path
+
+
+def get_pixels(path, engine, level=0):
+    """
+    The python engine decodes pixel by pixel like the original decoder, the other engines have to match it
+    """
+    image, width, height, fourcc = DDSReader(path, engine=engine).get_png_data(level)
+    return image.tolist(), width, height
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        return DDSHeader.from_bytes(f.read(DDSHeader.SIZE))
+
+
+def check_engine(engine):
+    if engine == 'numpy' and not DDSReader.has_numpy():
+        pytest.skip("NumPy is not installed")
+
+
+@needs_numpy
+def test_numpy_matches_python(dds_path):
+    assert get_pixels(dds_path, 'numpy') == get_pixels(dds_path, 'python')
+
+
+def test_engine_without_numpy(dds_path, monkeypatch):
+    monkeypatch.setattr(dds, 'dxt_numpy', None)
+    assert DDSReader(dds_path).engine == 'table'
+    with pytest.raises(ValueError):
+        DDSReader(dds_path, engine='numpy')
+    with pytest.raises(ValueError):
+        DDSReader(dds_path, engine='fast')
+
+
+def test_table_matches_python(dds_path):
+    assert get_pixels(dds_path, 'table') == get_pixels(dds_path, 'python')
+
+
+@pytest.mark.parametrize('n_of_distinct_blocks', [1, 2, 3])
+@pytest.mark.parametrize('fourcc', ['DXT1', 'DXT3', 'DXT5'])
+def test_repeated_blocks(tmp_path, fourcc, n_of_distinct_blocks):
+    """
+    The table decoder reuses the pixels of a block that is the same as the one before it
+    """
+    path = str(tmp_path / 'image.dds')
+    make_dds(path, 20, 12, fourcc, fourcc == 'DXT1', seed=n_of_distinct_blocks,
+             n_of_distinct_blocks=n_of_distinct_blocks)
+    expected = get_pixels(path, 'python')
+    assert get_pixels(path, 'table') == expected
+    if DDSReader.has_numpy():
+        assert get_pixels(path, 'numpy') == expected
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_charselect_rgb565(tmp_path, engine):
+    """
+    Charselect images keep the rgb565 colors for the palette
+    """
+    check_engine(engine)
+    path = str(tmp_path / 'image.dds')
+    make_dds(path, 7, 5, 'RGB565')
+    expected = DDSReader(path, True, 'python').get_png_data()[0].tolist()
+    assert DDSReader(path, True, engine).get_png_data()[0].tolist() == expected
+    assert max(max(row) for row in expected) <= 0xFFFF
+
+
+@pytest.mark.parametrize('cache_size', [None, 2])
+@pytest.mark.parametrize('engine', ENGINES)
+def test_image_regions(dds_path, engine, cache_size):
+    check_engine(engine)
+    expected, width, height = get_pixels(dds_path, 'python')
+    with DDSReader(dds_path, engine=engine).get_image(cache_size) as image:
+        assert image.get_region(0, 0, width, height).tolist() == expected
+        x = 5 % width
+        y = 1 % height
+        for _ in range(2):  # From the cache the second time (if it is large enough)
+            assert image.get_region(x, y, width - x, height - y).tolist() == [row[x:] for row in expected[y:]]
+        assert image.get_region(width - 1, height - 1, 1, 1).tolist() == [[expected[-1][-1]]]
+        assert image.get_region(x, y, 0, 0).tolist() == []
+        if cache_size is not None:
+            assert len(image.blocks) <= cache_size
+        with pytest.raises(ValueError):
+            image.get_region(0, 0, image.width + 1, 1)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_image_transform(dds_path, engine):
+    check_engine(engine)
+    expected, width, height = get_pixels(dds_path, 'python')
+    with DDSReader(dds_path, engine=engine).get_image(transform=lambda color: color ^ 0xFFFFFF) as image:
+        assert image.get_region(0, 0, width, height).tolist() == [[color ^ 0xFFFFFF for color in row]
+                                                                  for row in expected]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_region_decodes_only_its_blocks(tmp_path, engine):
+    check_engine(engine)
+    path = str(tmp_path / 'image.dds')
+    make_dds(path, 36, 20, 'DXT5')
+    with DDSReader(path, engine=engine).get_image() as image:
+        image.get_region(5, 6, 5, 3)
+        assert sorted(image.blocks) == [(1, 1), (1, 2), (2, 1), (2, 2)]
+
+
+@pytest.mark.parametrize('level', [1, 2])
+@pytest.mark.parametrize('engine', ENGINES)
+def test_mipmap_levels(mipmap_path, engine, level):
+    check_engine(engine)
+    expected, width, height = get_pixels(mipmap_path, 'python', level)
+    header = read_header(mipmap_path)
+    assert (width, height) == (max(header.width >> level, 1), max(header.height >> level, 1))
+    assert get_pixels(mipmap_path, engine, level) == (expected, width, height)
+    with DDSReader(mipmap_path, engine=engine).get_image(level=level) as image:
+        assert image.get_region(0, 0, width, height).tolist() == expected
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_iter_mipmap_levels(mipmap_path, engine):
+    check_engine(engine)
+    levels = [(level, data[0].tolist(), data[1], data[2])
+              for level, data in DDSReader(mipmap_path, engine=engine).iter_png_data()]
+    assert levels == [(level,) + get_pixels(mipmap_path, 'python', level) for level in range(3)]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_only_the_level_is_read(mipmap_path, engine):
+    """
+    The other levels are skipped, a level after the end of the file is an error
+    """
+    check_engine(engine)
+    header = read_header(mipmap_path)
+    expected = get_pixels(mipmap_path, 'python', 1)
+    with open(mipmap_path, 'r+b') as f:
+        f.truncate(header.get_level_offset(2))
+    assert get_pixels(mipmap_path, engine, 1) == expected
+    with pytest.raises(ValueError):
+        get_pixels(mipmap_path, engine, 2)
+
+
+def test_missing_level(mipmap_path):
+    with pytest.raises(ValueError):
+        DDSReader(mipmap_path).get_png_data(3)
+    with pytest.raises(ValueError):
+        DDSReader(mipmap_path).get_image(level=-1)
+    # Without a mipmap flag there is only one level
+    assert read_header(mipmap_path).get_mipmap_count() == 3
+    with open(mipmap_path, 'r+b') as f:
+        f.seek(8)
+        f.write((0x1 | 0x2 | 0x4 | 0x1000).to_bytes(4, 'little'))  # Flags
+        f.seek(108)
+        f.write((0x1000).to_bytes(4, 'little'))  # Caps
+    assert read_header(mipmap_path).get_mipmap_count() == 1
+    with pytest.raises(ValueError):
+        DDSReader(mipmap_path).get_png_data(1)
+
+
+@pytest.mark.parametrize('band_height', [64, 2])
+@pytest.mark.parametrize('engine', DDSReader.ENGINES)
+def test_png_stream_matches_png(mipmap_path, engine, band_height, monkeypatch):
+    check_engine(engine)
+    reader = DDSReader(mipmap_path, engine='python')
+    expected = []
+    for level, data in reader.iter_png_data():
+        reader.write_png(data, level)
+        expected.append(read_png(reader.get_png_path(level)))
+        os.remove(reader.get_png_path(level))
+    monkeypatch.setattr(DDSReader, 'BAND_HEIGHT', band_height)
+    reader = DDSReader(mipmap_path, engine=engine)
+    reader.write_png_stream()
+    assert reader.file.closed
+    assert [read_png(reader.get_png_path(level)) for level in range(len(expected))] == expected
+    os.remove(reader.get_png_path(0))
+    DDSReader(mipmap_path, engine=engine).write_png_stream([2])
+    assert read_png(reader.get_png_path(2)) == expected[2]
+    assert not os.path.exists(reader.get_png_path(0))
+
+
+def test_missing_level_leaves_no_png(mipmap_path):
+    reader = DDSReader(mipmap_path)
+    with pytest.raises(ValueError):
+        reader.write_png_stream([3])
+    assert not os.path.exists(reader.get_png_path(3))
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_cut_off_level_leaves_no_png(mipmap_path, engine):
+    check_engine(engine)
+    with open(mipmap_path, 'r+b') as f:
+        f.truncate(read_header(mipmap_path).get_level_offset(1) - 1)
+    reader = DDSReader(mipmap_path, engine=engine)
+    with pytest.raises(ValueError):
+        reader.write_png_stream([0])
+    assert not os.path.exists(reader.get_png_path(0))
@@ -0,0 +1,101 @@
+import json
+import os
+import pytest
+from conftest import make_dds
+from SkullModPy.formats.dds import DDSReader
+from SkullModPy.formats.dds_info import format_json, format_table, get_dds_info
+from SkullModPy.formats.gfs import GFSStreamWriter
+
+
+def read_file(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('width,height,fourcc,has_alpha_pixels,mipmap_count,data_length', [
+    (36, 20, 'DXT1', True, 1, 9 * 5 * 8),
+    (10, 6, 'DXT5', False, 3, 3 * 2 * 16 + 2 * 1 * 16 + 16),
+    (7, 5, 'ARGB8', True, 2, 7 * 5 * 4 + 3 * 2 * 4),  # Always has the alpha pixels flag
+    (7, 5, 'RGB565', False, 1, 7 * 5 * 2),
+])
+def test_probe(tmp_path, width, height, fourcc, has_alpha_pixels, mipmap_count, data_length):
+    path = str(tmp_path / 'image.dds')
+    make_dds(path, width, height, fourcc, has_alpha_pixels, mipmap_count)
+    reader = DDSReader(path)
+    assert reader.probe() == {'width': width, 'height': height, 'format': fourcc, 'mipmap_count': mipmap_count,
+                              'nvtt_version': None, 'alpha_pixels': has_alpha_pixels, 'data_length': data_length}
+    reader.file.close()
+
+
+def test_probe_nvtt_version(tmp_path):
+    path = str(tmp_path / 'image.dds')
+    make_dds(path, 8, 8, 'DXT1')
+    with open(path, 'r+b') as f:
+        f.seek(32 + 36)  # The end of reserved1
+        f.write(b'NVTT' + bytes([8, 0, 2]))
+    reader = DDSReader(path)
+    assert reader.probe()['nvtt_version'] == '2.0.8'
+    reader.file.close()
+
+
+def test_probe_invalid(tmp_path):
+    path = str(tmp_path / 'image.dds')
+    with open(path, 'wb') as f:
+        f.write(b'DDS ' + bytes(50))
+    reader = DDSReader(path)
+    with pytest.raises(ValueError):
+        reader.probe()
+    reader.file.close()
+
+
+@pytest.fixture
+def textures(tmp_path):
+    """
+    A directory with a texture, an archive with textures and files that aren't textures
+    """
+    directory = tmp_path / 'textures'
+    os.makedirs(str(directory / 'sub'))
+    make_dds(str(directory / 'sub' / 'b.dds'), 10, 6, 'DXT5', mipmap_count=3)
+    make_dds(str(tmp_path / 'a.dds'), 36, 20, 'DXT1', True)
+    with open(str(directory / 'readme.txt'), 'w') as f:
+        f.write("Not a texture")
+    texture = read_file(str(tmp_path / 'a.dds'))
+    GFSStreamWriter(str(directory / 'data.gfs'), True).write([
+        ('x/a.DDS', len(texture), texture), ('readme.txt', 3, b'abc'), ('broken.dds', 4, b'DDS ')])
+    return tmp_path
+
+
+def test_get_dds_info(textures):
+    a_path = str(textures / 'a.dds')
+    archive_path = os.path.join(str(textures / 'textures'), 'data.gfs')
+    b_path = os.path.join(str(textures / 'textures'), 'sub', 'b.dds')
+    missing_path = str(textures / 'missing.dds')
+    rows = get_dds_info([a_path, str(textures / 'textures'), missing_path], 4)
+    assert [row['path'] for row in rows] == [a_path, archive_path + '/x/a.DDS', archive_path + '/broken.dds',
+                                             b_path, missing_path]
+    a_row = {'path': a_path, 'width': 36, 'height': 20, 'format': 'DXT1', 'mipmap_count': 1, 'nvtt_version': None,
+             'alpha_pixels': True, 'data_length': 360, 'file_length': 128 + 360}
+    assert rows[0] == a_row
+    assert rows[1] == dict(a_row, path=archive_path + '/x/a.DDS')
+    assert rows[2] == {'path': archive_path + '/broken.dds', 'error': "Not a valid DDS file"}
+    assert rows[3]['format'] == 'DXT5' and rows[3]['mipmap_count'] == 3
+    assert set(rows[4]) == {'path', 'error'}
+
+
+def test_get_dds_info_broken_archive(tmp_path):
+    archive_path = str(tmp_path / 'broken.gfs')
+    with open(archive_path, 'wb') as f:
+        f.write(bytes(100))
+    rows = get_dds_info([archive_path])
+    assert len(rows) == 1 and rows[0]['path'] == archive_path and 'error' in rows[0]
+
+
+def test_format(textures):
+    rows = get_dds_info([str(textures)])
+    lines = format_table(rows).split('\n')
+    assert len(lines) == len(rows) + 2
+    assert lines[0].split() == ['width', 'height', 'format', 'mipmap_count', 'nvtt_version', 'alpha_pixels',
+                                'data_length', 'file_length', 'path']
+    assert lines[-1] == "3 textures, " + str(360 * 2 + 96 + 32 + 16) + " bytes of image data, 1 errors"
+    assert lines[3].startswith("error: Not a valid DDS file")
+    assert json.loads(format_json(rows)) == rows
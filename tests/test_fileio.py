@@ -0,0 +1,50 @@
+import os
+import pytest
+from SkullModPy.common import fileio
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture(params=['copy_file_range', 'sendfile', 'buffered'])
+def copy_method(request, monkeypatch):
+    """
+    Remove the kernel copies that come before the tested one, so every way of copying is used
+    """
+    if request.param != 'copy_file_range':
+        monkeypatch.delattr(os, 'copy_file_range', raising=False)
+    if request.param == 'buffered':
+        monkeypatch.delattr(os, 'sendfile', raising=False)
+    return request.param
+
+
+@pytest.mark.parametrize('positional', [False, True])
+def test_copy_range(tmp_path, copy_method, positional):
+    source_path = str(tmp_path / 'source.bin')
+    with open(source_path, 'wb') as f:
+        f.write(DATA)
+    with open(source_path, 'rb') as source, open(str(tmp_path / 'destination.bin'), 'w+b') as destination:
+        destination.write(b'x' * 100)
+        destination.flush()
+        fileio.copy_range(source.fileno(), destination.fileno(), 1000, 50, 5000, positional)
+        # The source position is never used
+        assert source.tell() == 0
+        destination.seek(0)
+        assert destination.read() == b'x' * 50 + DATA[1000:6000]
+
+
+def test_copy_range_short_source(tmp_path, copy_method):
+    source_path = str(tmp_path / 'source.bin')
+    with open(source_path, 'wb') as f:
+        f.write(DATA[:100])
+    with open(source_path, 'rb') as source, open(str(tmp_path / 'destination.bin'), 'wb') as destination:
+        with pytest.raises(ValueError):
+            fileio.copy_range(source.fileno(), destination.fileno(), 0, 0, 200)
+
+
+def test_pack_without_kernel_copies(tmp_path, pack, contents, monkeypatch):
+    with open(pack(contents, True, name='kernel'), 'rb') as f:
+        expected = f.read()
+    monkeypatch.delattr(os, 'copy_file_range', raising=False)
+    monkeypatch.delattr(os, 'sendfile', raising=False)
+    with open(pack(contents, True, name='buffered'), 'rb') as f:
+        assert f.read() == expected
@@ -0,0 +1,414 @@
+import io
+import os
+import struct
+import pytest
+from conftest import write_directory
+from SkullModPy.formats import gfs
+from SkullModPy.formats.gfs import GFSArchive, GFSEntryTable, GFSReader, GFSStreamWriter, GFSWriter
+
+
+def read_exported(tmp_path, contents):
+    exported = {}
+    for name in contents:
+        with open(os.path.join(str(tmp_path), 'data', *name.split('/')), 'rb') as f:
+            exported[name] = f.read()
+    return exported
+
+
+@pytest.mark.parametrize('workers', [None, 4])
+@pytest.mark.parametrize('memory_map', [False, True])
+@pytest.mark.parametrize('is_aligned', [False, True])
+def test_round_trip(tmp_path, pack, contents, is_aligned, memory_map, workers):
+    archive_path = pack(contents, is_aligned)
+    alignment = 4096 if is_aligned else 1
+    reader = GFSReader(archive_path, memory_map)
+    metadata = reader.get_metadata()
+    assert sorted(entry[2] for entry in metadata['metadata']) == sorted(contents)
+    for entry in metadata['metadata']:
+        assert entry[1] == len(contents[entry[2]])
+        assert entry[3] == alignment
+        assert entry[0] % alignment == 0
+    if workers is None:
+        reader.export_files(metadata)
+    else:
+        reader.export_files_parallel(metadata, workers)
+    reader.close()
+    assert read_exported(tmp_path, contents) == contents
+
+
+def test_parallel_unpack_checks_bounds(tmp_path, pack, contents):
+    reader = GFSReader(pack(contents))
+    metadata = reader.get_metadata()
+    metadata['metadata'].append((reader.file_size - 1, 2, 'out_of_bounds.bin', 1))
+    with pytest.raises(ValueError):
+        reader.export_files_parallel(metadata, 4)
+    reader.close()
+    # Nothing is written if an entry is out of bounds
+    assert not os.path.exists(str(tmp_path / 'data'))
+
+
+def test_entry_views(pack, contents):
+    reader = GFSReader(pack(contents, True), memory_map=True)
+    metadata = reader.get_metadata()
+    views = dict(reader.get_entry_views(metadata))
+    assert {path: bytes(view) for path, view in views.items()} == contents
+    for view in views.values():
+        view.release()
+    with pytest.raises(ValueError):
+        reader.get_entry_view((reader.file_size - 1, 2, 'out_of_bounds.bin'))
+    reader.close()
+
+
+def test_entry_view_needs_memory_map(pack, contents):
+    reader = GFSReader(pack(contents))
+    with pytest.raises(ValueError):
+        reader.get_entry_view(reader.get_metadata()['metadata'][0])
+    reader.close()
+
+
+def test_close_with_open_view(pack, contents):
+    reader = GFSReader(pack(contents), memory_map=True)
+    view = reader.get_entry_view(reader.get_metadata()['metadata'][0])
+    with pytest.raises(BufferError):
+        reader.close()
+    view.release()
+    reader.close()
+
+
+def test_archive_lookup(pack, contents):
+    with GFSArchive(pack(contents)) as archive:
+        assert len(archive) == len(contents)
+        assert archive.get_paths() == [entry[2] for entry in archive.metadata['metadata']]
+        assert '\\sub\\deeper\\d.lua' in archive
+        assert 'missing.bin' not in archive
+        assert archive.read('/sub/b.dds/') == contents['sub/b.dds']
+        assert archive.read('empty.txt') == b''
+        with pytest.raises(FileNotFoundError):
+            archive.get_entry('missing.bin')
+
+
+def test_entry_file(pack, contents):
+    with GFSArchive(pack(contents)) as archive:
+        with archive.open('sub/c.dds') as f:
+            assert f.read(10) == contents['sub/c.dds'][:10]
+            assert f.seek(-7, io.SEEK_END) == 4090
+            assert f.read() == contents['sub/c.dds'][-7:]
+            assert f.read(1) == b''
+            f.seek(4000)
+            assert f.read(1000) == contents['sub/c.dds'][4000:]
+            with pytest.raises(ValueError):
+                f.seek(-1)
+        # Reading an entry doesn't move the position of the archive file
+        assert archive.reader.file.tell() == 0
+
+
+def change_files(dir_path, contents):
+    """
+    Change a file (same size), touch one, change the size of one and add one
+    :return: New contents
+    """
+    changed = dict(contents)
+    changed['a.bin'] = bytes(reversed(contents['a.bin']))
+    changed['sub/deeper/d.lua'] = b'print("changed")'
+    changed['new.txt'] = b'new'
+    write_directory(dir_path, {name: changed[name] for name in ('a.bin', 'sub/deeper/d.lua', 'new.txt')})
+    os.utime(os.path.join(dir_path, 'sub', 'b.dds'), ns=(2 * 10 ** 18, 2 * 10 ** 18))
+    return changed
+
+
+def repack(dir_path, is_aligned, use_previous, monkeypatch):
+    """
+    Pack a directory again next to the archive packed from it
+    :return: Archive bytes, paths of the files that were opened (compared or copied) and that were hashed
+    """
+    opened = set()
+    hashed = set()
+
+    def get_relative_path(file_path):
+        return os.path.relpath(file_path, dir_path).replace(os.sep, '/')
+
+    def spy_open(file_path, *args, **kwargs):
+        if file_path.startswith(dir_path + os.sep):  # Not the archive or its sidecars
+            opened.add(get_relative_path(file_path))
+        return open(file_path, *args, **kwargs)
+
+    def spy_get_file_hash(file_path, algorithm='sha256'):
+        hashed.add(get_relative_path(file_path))
+        return get_file_hash(file_path, algorithm)
+    get_file_hash = gfs.get_file_hash
+    monkeypatch.setattr(gfs, 'open', spy_open, raising=False)
+    monkeypatch.setattr(gfs, 'get_file_hash', spy_get_file_hash)
+    writer = GFSWriter(dir_path, is_aligned)
+    writer.write_content(writer.get_metadata(), dir_path + '.gfs' if use_previous else None)
+    monkeypatch.undo()
+    with open(dir_path + '.gfs', 'rb') as f:
+        return f.read(), opened, hashed
+
+
+@pytest.mark.parametrize('has_source_index', [False, True])
+@pytest.mark.parametrize('is_aligned', [False, True])
+def test_incremental_repack(tmp_path, contents, is_aligned, has_source_index, monkeypatch, capsys):
+    dir_path = str(tmp_path / 'data')
+    write_directory(dir_path, contents)
+    # A time well before the source index is written, so it isn't dropped as racy
+    for name in contents:
+        os.utime(os.path.join(dir_path, *name.split('/')), ns=(10 ** 18, 10 ** 18))
+    repack(dir_path, is_aligned, False, monkeypatch)
+    if not has_source_index:
+        os.remove(GFSReader.get_source_index_path(dir_path + '.gfs'))
+    changed = change_files(dir_path, contents)
+    capsys.readouterr()
+
+    incremental, opened, hashed = repack(dir_path, is_aligned, True, monkeypatch)
+    # Files with the same size and time as in the source index are trusted without reading them,
+    # the others are compared with the archive (a fresh pack has no digests)
+    assert opened == ({'a.bin', 'sub/b.dds', 'sub/deeper/d.lua', 'new.txt'} if has_source_index else set(changed))
+    assert hashed == set()
+    assert "Reused 3 of 6 files" in capsys.readouterr().out
+    with GFSArchive(dir_path + '.gfs') as archive:
+        assert {path: archive.read(path) for path in archive.get_paths()} == changed
+    # The same bytes as a full pack
+    assert repack(dir_path, is_aligned, False, monkeypatch)[0] == incremental
+
+
+def test_repack_after_unpack(tmp_path, pack, contents, monkeypatch, capsys):
+    reader = GFSReader(pack(contents, True))
+    reader.export_files(reader.get_metadata())
+    reader.close()
+    # Written a while after the files, with coarse file times they could be dropped as racy
+    source_index_path = GFSReader.get_source_index_path(str(tmp_path / 'data.gfs'))
+    source_index_time = os.stat(source_index_path).st_mtime_ns + 10 ** 10
+    os.utime(source_index_path, ns=(source_index_time, source_index_time))
+    dir_path = str(tmp_path / 'data')
+    changed = change_files(dir_path, contents)
+    capsys.readouterr()
+    # The source index with digests was written while unpacking: files with a new time are hashed, not compared
+    incremental, opened, hashed = repack(dir_path, True, True, monkeypatch)
+    assert hashed == {'a.bin', 'sub/b.dds'}
+    assert opened == {'a.bin', 'sub/deeper/d.lua', 'new.txt'}  # Copied
+    assert "Reused 3 of 6 files" in capsys.readouterr().out
+    assert repack(dir_path, True, False, monkeypatch)[0] == incremental
+    with GFSArchive(dir_path + '.gfs') as archive:
+        assert {path: archive.read(path) for path in archive.get_paths()} == changed
+
+
+def get_cached_metadata(archive_path, monkeypatch):
+    """
+    :return: Metadata from get_metadata(use_cache=True), True if the header was parsed (the cache wasn't used)
+    """
+    parsed = []
+
+    def read_references(self):
+        parsed.append(True)
+        return original_read_references(self)
+    original_read_references = GFSReader.read_references
+    monkeypatch.setattr(GFSReader, 'read_references', read_references)
+    reader = GFSReader(archive_path)
+    metadata = reader.get_metadata(use_cache=True)
+    reader.close()
+    monkeypatch.undo()
+    return metadata, bool(parsed)
+
+
+def test_index_cache(pack, contents, monkeypatch):
+    archive_path = pack(contents, True)
+    reader = GFSReader(archive_path)
+    expected = reader.get_metadata()
+    reader.close()
+    assert not os.path.exists(archive_path + GFSReader.INDEX_CACHE_EXTENSION)
+    assert get_cached_metadata(archive_path, monkeypatch) == (expected, True)
+    assert os.path.exists(archive_path + GFSReader.INDEX_CACHE_EXTENSION)
+    assert get_cached_metadata(archive_path, monkeypatch) == (expected, False)
+    with GFSArchive(archive_path, use_cache=True) as archive:
+        assert archive.read('sub/c.dds') == contents['sub/c.dds']
+
+
+def test_index_cache_invalidation(tmp_path, pack, contents, monkeypatch):
+    archive_path = pack(contents)
+    get_cached_metadata(archive_path, monkeypatch)
+    cache_path = archive_path + GFSReader.INDEX_CACHE_EXTENSION
+    with open(cache_path, 'rb') as f:
+        cache = f.read()
+
+    # Another archive at the same path
+    changed = dict(contents)
+    changed['sub/deeper/d.lua'] = b'print("changed")'
+    archive_path = pack(changed)
+    reader = GFSReader(archive_path)
+    expected = reader.get_metadata()
+    reader.close()
+    assert get_cached_metadata(archive_path, monkeypatch) == (expected, True)
+
+    # A cache that is cut off
+    with open(cache_path, 'rb') as f:
+        cache = f.read()
+    with open(cache_path, 'wb') as f:
+        f.write(cache[:-10])
+    assert get_cached_metadata(archive_path, monkeypatch) == (expected, True)
+
+    # The cache of a copy of the archive at another path
+    copy_path = str(tmp_path / 'copy.gfs')
+    with open(archive_path, 'rb') as source, open(copy_path, 'wb') as f:
+        f.write(source.read())
+    os.utime(copy_path, ns=(os.stat(archive_path).st_mtime_ns,) * 2)
+    with open(copy_path + GFSReader.INDEX_CACHE_EXTENSION, 'wb') as f:
+        f.write(cache)
+    metadata, parsed = get_cached_metadata(copy_path, monkeypatch)
+    assert metadata['metadata'] == expected['metadata'] and parsed
+
+
+@pytest.mark.parametrize('workers', [None, 4])
+@pytest.mark.parametrize('is_aligned', [False, True])
+def test_stream_writer_sources(tmp_path, pack, contents, is_aligned, workers):
+    """
+    Every kind of source gives the same archive as GFSWriter
+    """
+    archive_path = pack(contents, is_aligned)
+    source_path = str(tmp_path / 'source.bin')
+    with open(source_path, 'wb') as f:
+        f.write(b'skipped' + contents['sub/b.dds'])
+    opened = []
+
+    def open_source():
+        opened.append(open(source_path, 'rb'))
+        opened[-1].seek(7)
+        return opened[-1]
+    stream_path = str(tmp_path / 'stream.gfs')
+    with GFSArchive(archive_path) as archive:
+        sources = {
+            'a.bin': bytearray(contents['a.bin']),  # bytes-like
+            'empty.txt': b'',
+            'sub/b.dds': open_source,  # callable, returns a regular file (copied in the kernel)
+            'sub/c.dds': io.BytesIO(contents['sub/c.dds']),  # file object without a file descriptor
+            'sub/deeper/d.lua': archive.open('sub/deeper/d.lua'),  # archive entry
+        }
+        entries = [(path, len(contents[path]), sources[path]) for path in archive.get_paths()]
+        GFSStreamWriter(stream_path, is_aligned).write(entries, workers)
+    assert opened[0].closed
+    with open(archive_path, 'rb') as expected, open(stream_path, 'rb') as f:
+        assert f.read() == expected.read()
+
+
+def test_stream_writer_memoryview(tmp_path, pack, contents):
+    archive_path = pack(contents, True)
+    stream_path = str(tmp_path / 'stream.gfs')
+    reader = GFSReader(archive_path, memory_map=True)
+    views = list(reader.get_entry_views(reader.get_metadata()))
+    GFSStreamWriter(stream_path, True).write((path, len(view), view) for path, view in views)
+    for path, view in views:
+        view.release()
+    reader.close()
+    with open(archive_path, 'rb') as expected, open(stream_path, 'rb') as f:
+        assert f.read() == expected.read()
+
+
+@pytest.mark.parametrize('source', [b'1234', io.BytesIO(b'1234')], ids=['bytes', 'file'])
+def test_stream_writer_wrong_size(tmp_path, source):
+    with pytest.raises(ValueError):
+        GFSStreamWriter(str(tmp_path / 'stream.gfs'), False).write([('a.bin', 5, source)])
+
+
+def test_entry_table():
+    table = GFSEntryTable()
+    table.append((51, 10, 'a.bin', 1))
+    table.append([61, 0, 'b.bin', 1])
+    assert len(table) == 2
+    assert table[1] == (61, 0, 'b.bin', 1)
+    assert table[-1] == table[1]
+    assert table[:1] == [(51, 10, 'a.bin', 1)]
+    assert list(table) == [(51, 10, 'a.bin', 1), (61, 0, 'b.bin', 1)]
+    assert table == [[51, 10, 'a.bin', 1], (61, 0, 'b.bin', 1)]
+    assert table != [(51, 10, 'a.bin', 1)]
+
+
+@pytest.mark.parametrize('is_aligned', [False, True])
+def test_many_entries(tmp_path, is_aligned):
+    file_names = ['dir' + str(i % 7) + '/file' + str(i) + '.bin' for i in range(1000)]
+    file_sizes = [i % 13 for i in range(1000)]
+    archive_path = str(tmp_path / 'many.gfs')
+    GFSStreamWriter(archive_path, is_aligned).write((file_name, file_size, bytes(file_size))
+                                                    for file_name, file_size in zip(file_names, file_sizes))
+    alignment = 4096 if is_aligned else 1
+    header_length, file_offsets, archive_size = GFSWriter.get_layout(file_names, file_sizes, alignment)
+    reader = GFSReader(archive_path)
+    assert reader.file_size == archive_size
+    assert reader.read_references() == list(zip(file_offsets, file_sizes, file_names, [alignment] * 1000))
+    reader.close()
+
+
+def break_header(archive_path, position, data):
+    with open(archive_path, 'r+b') as f:
+        f.seek(position)
+        f.write(data)
+
+
+# Header: data offset (uint32), identifier length (uint64), identifier, version length (uint64), version,
+# number of files (uint64), then every entry: path length (uint64), path, length (uint64), alignment (uint32)
+FIRST_ALIGNMENT_POSITION = 51 + 8 + len('a.bin') + 8
+
+
+@pytest.mark.parametrize('position,data', [
+    (0, struct.pack('>L', 20)),  # Data offset in the header
+    (0, struct.pack('>L', 2 ** 31)),  # Data offset after the end of the file
+    (4, struct.pack('>Q', 19)),  # Identifier length
+    (12, b'X'),  # Identifier
+    (40, b'2'),  # Version
+    (43, struct.pack('>Q', 2 ** 40)),  # Number of files
+    (51, struct.pack('>Q', 2 ** 20)),  # Path length
+    (59, b'\xff'),  # Path
+    (FIRST_ALIGNMENT_POSITION, struct.pack('>L', 0)),  # Alignment
+], ids=['data_offset', 'data_offset_size', 'identifier_length', 'identifier', 'version', 'n_of_files', 'path_length',
+        'path', 'alignment'])
+def test_broken_header(tmp_path, position, data):
+    archive_path = str(tmp_path / 'broken.gfs')
+    GFSStreamWriter(archive_path, False).write([('a.bin', 3, b'abc'), ('b.bin', 2, b'de')])
+    break_header(archive_path, position, data)
+    reader = GFSReader(archive_path)
+    with pytest.raises(ValueError):
+        reader.get_metadata()
+    reader.close()
+
+
+def test_short_file(tmp_path):
+    archive_path = str(tmp_path / 'short.gfs')
+    with open(archive_path, 'wb') as f:
+        f.write(b'\0\0')
+    reader = GFSReader(archive_path)
+    with pytest.raises(ValueError):
+        reader.get_metadata()
+    reader.close()
+
+
+@pytest.mark.parametrize('workers', [1, 2, 8])
+@pytest.mark.parametrize('is_aligned', [False, True])
+def test_parallel_pack_is_identical(pack, contents, is_aligned, workers):
+    with open(pack(contents, is_aligned, name='serial'), 'rb') as f:
+        expected = f.read()
+    for i in range(3):
+        with open(pack(contents, is_aligned, workers, 'parallel' + str(i)), 'rb') as f:
+            assert f.read() == expected
+
+
+@pytest.mark.parametrize('filters,expected', [
+    ({}, ['a.bin', 'empty.txt', 'sub/b.dds', 'sub/c.dds', 'sub/deeper/d.lua']),
+    ({'include': ['*.DDS']}, ['sub/b.dds', 'sub/c.dds']),
+    ({'include': ['sub/']}, ['sub/b.dds', 'sub/c.dds', 'sub/deeper/d.lua']),
+    ({'include': ['sub\\*.lua']}, ['sub/deeper/d.lua']),  # '*' also matches '/'
+    ({'include': ['re:^[a-e]\\.']}, ['a.bin']),
+    ({'include': ['re:deeper']}, ['sub/deeper/d.lua']),
+    ({'include': ['*.bin', '*.txt']}, ['a.bin', 'empty.txt']),
+    ({'exclude': ['sub/', 're:\\.txt$']}, ['a.bin']),
+    ({'include': ['sub/'], 'exclude': ['*/deeper/*']}, ['sub/b.dds', 'sub/c.dds']),
+    ({'min_size': 4096}, ['a.bin', 'sub/b.dds', 'sub/c.dds']),
+    ({'max_size': 13}, ['empty.txt', 'sub/deeper/d.lua']),
+    ({'min_size': 1, 'max_size': 4096, 'include': ['*.dds']}, ['sub/b.dds']),
+])
+def test_filter_metadata(pack, contents, filters, expected):
+    reader = GFSReader(pack(contents))
+    metadata = reader.get_metadata()
+    reader.close()
+    filtered = GFSReader.filter_metadata(metadata, **filters)
+    assert filtered['path'] == metadata['path']
+    assert sorted(entry[2] for entry in filtered['metadata']) == expected
+    # The entries are kept as they are, in archive order
+    assert filtered['metadata'] == [entry for entry in metadata['metadata'] if entry[2] in expected]
@@ -0,0 +1,104 @@
+import gzip
+import io
+import tarfile
+import zipfile
+import pytest
+from SkullModPy.formats.gfs import GFSReader
+from SkullModPy.formats.gfs_bundle import export_bundle, get_bundle_path, pack_bundle
+
+
+class Stream(io.RawIOBase):
+    """
+    Pipe-like stream (like sys.stdin.buffer or sys.stdout.buffer), it can't seek or tell
+    """
+
+    def __init__(self, data=b''):
+        super().__init__()
+        self.buffer = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.buffer.readinto(buffer)
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def export(archive_path, output, use_zip):
+    reader = GFSReader(archive_path)
+    export_bundle(reader, reader.get_metadata(), output, use_zip)
+    reader.close()
+
+
+def read_bundle(data):
+    """
+    :return: Dict of path ==> content of all files in a tar or zip
+    """
+    if zipfile.is_zipfile(io.BytesIO(data)):
+        with zipfile.ZipFile(io.BytesIO(data)) as bundle:
+            return {name: bundle.read(name) for name in bundle.namelist()}
+    with tarfile.open(fileobj=io.BytesIO(data)) as bundle:
+        return {member.name: bundle.extractfile(member).read() for member in bundle.getmembers()}
+
+
+@pytest.mark.parametrize('use_zip', [False, True])
+def test_export_bundle(tmp_path, pack, contents, use_zip):
+    archive_path = pack(contents, True)
+    bundle_path = str(tmp_path / ('data.zip' if use_zip else 'data.tar'))
+    export(archive_path, bundle_path, use_zip)
+    with open(bundle_path, 'rb') as f:
+        data = f.read()
+    assert read_bundle(data) == contents
+    stream = Stream()
+    export(archive_path, stream, use_zip)
+    assert read_bundle(stream.buffer.getvalue()) == contents
+
+
+@pytest.mark.parametrize('bundle_name', ['data.tar', 'data.tar.gz', 'data.zip', 'stream.tar', 'stream.zip'])
+@pytest.mark.parametrize('is_aligned', [False, True])
+def test_bundle_round_trip(tmp_path, pack, contents, is_aligned, bundle_name):
+    """
+    Unpacking into a bundle and packing it again gives the same archive
+    """
+    archive_path = pack(contents, is_aligned)
+    use_zip = bundle_name.endswith('.zip')
+    if bundle_name.startswith('stream'):
+        stream = Stream()
+        export(archive_path, stream, use_zip)
+        bundle = Stream(stream.buffer.getvalue())
+    else:
+        bundle = str(tmp_path / bundle_name)
+        export(archive_path, bundle, use_zip)
+        if bundle_name.endswith('.gz'):
+            with open(bundle, 'rb') as f:
+                data = gzip.compress(f.read())
+            with open(bundle, 'wb') as f:
+                f.write(data)
+    repacked_path = str(tmp_path / 'repacked.gfs')
+    pack_bundle(bundle, repacked_path, is_aligned, 4)
+    with open(archive_path, 'rb') as expected, open(repacked_path, 'rb') as f:
+        assert f.read() == expected.read()
+
+
+def test_pack_bundle_paths(tmp_path):
+    bundle_path = str(tmp_path / 'data.zip')
+    with zipfile.ZipFile(bundle_path, 'w') as bundle:
+        bundle.writestr('./a.bin', b'a')
+        bundle.writestr('sub/', b'')  # Directory
+        bundle.writestr('/sub/b.bin', b'bb')
+    archive_path = str(tmp_path / 'data.gfs')
+    pack_bundle(bundle_path, archive_path, False)
+    reader = GFSReader(archive_path)
+    assert [(entry[2], entry[1]) for entry in reader.get_metadata()['metadata']] == [('a.bin', 1), ('sub/b.bin', 2)]
+    reader.close()
+
+
+@pytest.mark.parametrize('path,expected', [('a.bin', 'a.bin'), ('./././a.bin', 'a.bin'), ('/sub/a.bin', 'sub/a.bin'),
+                                           ('sub\\a.bin', 'sub/a.bin')])
+def test_get_bundle_path(path, expected):
+    assert get_bundle_path(path) == expected
@@ -0,0 +1,135 @@
+import os
+import pytest
+from SkullModPy.formats.gfs import GFSReader
+from SkullModPy.formats.gfs_manifest import diff_archives, get_manifest, get_manifest_path, read_manifest, \
+    verify_archive, write_manifest
+
+
+def make_manifest(archive_path, workers=None, filters=None):
+    reader = GFSReader(archive_path)
+    metadata = reader.get_metadata()
+    if filters is not None:
+        metadata = GFSReader.filter_metadata(metadata, **filters)
+    manifest = get_manifest(reader, metadata['metadata'], workers)
+    reader.close()
+    manifest_path = get_manifest_path(archive_path)
+    write_manifest(manifest_path, manifest, filters=filters)
+    return manifest_path, manifest
+
+
+def change_byte(file_path, position):
+    with open(file_path, 'r+b') as f:
+        f.seek(position)
+        data = f.read(1)
+        f.seek(position)
+        f.write(bytes([data[0] ^ 0xFF]))
+
+
+@pytest.mark.parametrize('workers', [None, 1, 4])
+def test_manifest(pack, contents, workers):
+    archive_path = pack(contents, True)
+    manifest_path, manifest = make_manifest(archive_path, workers)
+    reader = GFSReader(archive_path)
+    assert [row[:3] for row in manifest] == [[entry[2], entry[0], entry[1]]
+                                             for entry in reader.get_metadata()['metadata']]
+    reader.close()
+    assert read_manifest(manifest_path) == ('sha256', manifest, None)
+    assert verify_archive(archive_path) == []
+    assert verify_archive(archive_path, manifest_path, workers, memory_map=True) == []
+
+
+def test_verify_changed_archive(pack, contents):
+    archive_path = pack(contents, True)
+    manifest_path, manifest = make_manifest(archive_path)
+    entry_offset = {row[0]: row[1] for row in manifest}['sub/b.dds']
+    change_byte(archive_path, entry_offset + 100)
+    assert verify_archive(archive_path, manifest_path) == ["Differs from manifest: sub/b.dds"]
+
+    # Cut off after the first entries
+    with open(archive_path, 'r+b') as f:
+        f.truncate(entry_offset + 10)
+    problems = verify_archive(archive_path, manifest_path)
+    assert any(problem.startswith("Entry ends at") and problem.endswith(": sub/b.dds") for problem in problems)
+    assert "Differs from manifest: sub/b.dds" not in problems
+
+
+def test_verify_missing_and_extra_entries(tmp_path, pack, contents):
+    archive_path = pack(contents)
+    manifest_path, manifest = make_manifest(archive_path)
+    changed = dict(contents)
+    del changed['a.bin']
+    changed['new.txt'] = b'new'
+    new_archive_path = pack(changed, name='new')
+    problems = verify_archive(new_archive_path, manifest_path)
+    # The other entries moved, the offset is part of a manifest row
+    assert "Missing in archive: a.bin" in problems
+    assert "Not in manifest: new.txt" in problems
+
+
+def test_verify_broken_header(pack, contents):
+    archive_path = pack(contents)
+    change_byte(archive_path, 10)  # Inside the file identifier
+    problems = verify_archive(archive_path)
+    assert len(problems) == 1 and problems[0].startswith("Header can't be read")
+
+
+def test_read_invalid_manifest(tmp_path, pack, contents):
+    manifest_path = str(tmp_path / 'manifest.txt')
+    with open(manifest_path, 'w') as f:
+        f.write("not a manifest\n")
+    with pytest.raises(ValueError):
+        read_manifest(manifest_path)
+    manifest_path, manifest = make_manifest(pack(contents))
+    with open(manifest_path, 'a') as f:
+        f.write("only\ttwo\n")
+    with pytest.raises(ValueError, match=r"\(line " + str(len(manifest) + 2) + r"\)"):
+        read_manifest(manifest_path)
+    os.remove(manifest_path)
+    with pytest.raises(OSError):
+        read_manifest(manifest_path)
+
+
+def test_filtered_manifest(pack, contents):
+    archive_path = pack(contents, True)
+    filters = {'include': ['*.dds'], 'exclude': None, 'min_size': 1, 'max_size': None}
+    manifest_path, manifest = make_manifest(archive_path, filters=filters)
+    assert [row[0] for row in manifest] == ['sub/b.dds', 'sub/c.dds']
+    assert read_manifest(manifest_path) == ('sha256', manifest, filters)
+    # The entries the filters don't cover are neither reported nor hashed
+    assert verify_archive(archive_path, manifest_path) == []
+    reader = GFSReader(archive_path)
+    entry_offsets = {entry[2]: entry[0] for entry in reader.read_references()}
+    reader.close()
+    change_byte(archive_path, entry_offsets['a.bin'])
+    assert verify_archive(archive_path, manifest_path) == []
+    change_byte(archive_path, entry_offsets['sub/c.dds'])
+    assert verify_archive(archive_path, manifest_path) == ["Differs from manifest: sub/c.dds"]
+
+
+@pytest.mark.parametrize('workers', [None, 4])
+def test_diff(pack, contents, workers):
+    old_archive_path = pack(contents, True)
+    changed = dict(contents)
+    del changed['empty.txt']
+    changed['new.txt'] = b'new'
+    changed['a.bin'] = bytes(reversed(contents['a.bin']))  # Same length
+    changed['sub/deeper/d.lua'] = b'print("changed")'
+    new_archive_path = pack(changed, False, name='new')
+    assert diff_archives(old_archive_path, new_archive_path, workers) == \
+        {'added': ['new.txt'], 'removed': ['empty.txt'], 'modified': ['a.bin', 'sub/deeper/d.lua']}
+    # Only the content counts, not the layout
+    assert diff_archives(old_archive_path, pack(contents, False, name='unaligned'), workers, True) == \
+        {'added': [], 'removed': [], 'modified': []}
+
+
+def test_diff_errors(tmp_path, pack, contents):
+    archive_path = pack(contents)
+    with pytest.raises(FileNotFoundError):
+        diff_archives(archive_path, str(tmp_path / 'missing.gfs'))
+    with pytest.raises(FileNotFoundError):
+        diff_archives(str(tmp_path / 'missing.gfs'), archive_path)
+    not_an_archive_path = str(tmp_path / 'not_an_archive.gfs')
+    with open(not_an_archive_path, 'wb') as f:
+        f.write(bytes(100))
+    with pytest.raises(ValueError):
+        diff_archives(archive_path, not_an_archive_path)
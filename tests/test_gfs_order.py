@@ -0,0 +1,65 @@
+import pytest
+from conftest import write_directory
+from SkullModPy.formats.gfs import GFSWriter
+from SkullModPy.formats.gfs_order import get_seek_distance, order_metadata, read_trace
+
+NAMES = ['b/x.dds', 'a.lua', 'b/x.spr.msb', 'A/z.dds', 'b/c/y.lua', 'b/w.lua']
+METADATA = [value for i, name in enumerate(NAMES) for value in (name, i)]
+
+
+def get_names(metadata):
+    return metadata[0::2]
+
+
+@pytest.mark.parametrize('policy,expected', [
+    ('walk', NAMES),
+    ('directory', ['a.lua', 'A/z.dds', 'b/w.lua', 'b/x.dds', 'b/x.spr.msb', 'b/c/y.lua']),
+    ('stem', ['a.lua', 'A/z.dds', 'b/w.lua', 'b/x.dds', 'b/x.spr.msb', 'b/c/y.lua']),
+    ('extension', ['A/z.dds', 'b/x.dds', 'a.lua', 'b/w.lua', 'b/c/y.lua', 'b/x.spr.msb']),
+])
+def test_order_metadata(policy, expected):
+    ordered = order_metadata(METADATA, policy)
+    assert get_names(ordered) == expected
+    # Every name keeps its size
+    assert dict(zip(ordered[0::2], ordered[1::2])) == dict(zip(METADATA[0::2], METADATA[1::2]))
+
+
+def test_stem_keeps_sprites_together():
+    metadata = [value for name in ['s/x.spr.msb', 's/x-b.dds', 's/x.dds', 's/x.a.dds'] for value in (name, 1)]
+    assert get_names(order_metadata(metadata, 'directory')) == ['s/x-b.dds', 's/x.a.dds', 's/x.dds', 's/x.spr.msb']
+    assert get_names(order_metadata(metadata, 'stem')) == ['s/x.a.dds', 's/x.dds', 's/x.spr.msb', 's/x-b.dds']
+
+
+def test_trace(tmp_path):
+    trace_path = str(tmp_path / 'trace.txt')
+    with open(trace_path, 'w') as f:
+        f.write("# Comment\n\nb\\w.lua\tsome\tcolumns\nmissing.dds\n/a.lua/\nb/w.lua\n")
+    assert read_trace(trace_path) == ['b/w.lua', 'missing.dds', 'a.lua']
+    assert get_names(order_metadata(METADATA, 'trace', trace_path)) == \
+        ['b/w.lua', 'a.lua', 'A/z.dds', 'b/x.dds', 'b/x.spr.msb', 'b/c/y.lua']
+
+
+def test_order_errors(tmp_path):
+    with pytest.raises(ValueError):
+        order_metadata(METADATA, 'size')
+    with pytest.raises(ValueError):
+        order_metadata(METADATA, 'trace')
+    with pytest.raises(OSError):
+        order_metadata(METADATA, 'trace', str(tmp_path / 'missing.txt'))
+
+
+def test_seek_distance():
+    metadata = [(100, 10, 'a', 1), (110, 20, 'b', 1), (4096, 5, 'c', 4096), (8192, 1, 'd', 4096)]
+    # The gap between b and c is padding, read like data
+    assert get_seek_distance(metadata, ['a', 'b', 'c', 'd']) == {'reads': 4, 'seeks': 0, 'distance': 0, 'missing': 0}
+    assert get_seek_distance(metadata, ['c', 'a', 'x', 'd']) == \
+        {'reads': 3, 'seeks': 2, 'distance': 4001 + 8082, 'missing': 1}
+
+
+def test_writer_order(tmp_path):
+    dir_path = str(tmp_path / 'data')
+    write_directory(dir_path, {name: bytes(size) for name, size in zip(NAMES, range(len(NAMES)))})
+    metadata = GFSWriter(dir_path, False).get_metadata('extension')
+    assert metadata == order_metadata(metadata, 'extension')
+    assert sorted(get_names(metadata)) == sorted(NAMES)
+    assert get_names(metadata)[:2] == ['A/z.dds', 'b/x.dds']
@@ -0,0 +1,108 @@
+import os
+import pytest
+from SkullModPy.formats.gfs import GFSArchive, GFSReader, GFSStreamWriter
+from SkullModPy.formats.gfs_patch import patch_archive
+
+
+def write_archive(file_path, contents, is_aligned):
+    """
+    Archive with the entries in sorted order, 'sub/deeper/d.lua' is the last one
+    """
+    GFSStreamWriter(file_path, is_aligned).write((path, len(data), data) for path, data in sorted(contents.items()))
+
+
+def write_replacements(tmp_path, replacements):
+    """
+    :param replacements: Dict of entry path ==> new content
+    :return: Dict of entry path ==> path of the new file
+    """
+    paths = {}
+    for i, (entry_path, data) in enumerate(replacements.items()):
+        paths[entry_path] = str(tmp_path / ('replacement' + str(i)))
+        with open(paths[entry_path], 'wb') as f:
+            f.write(data)
+    return paths
+
+
+def read_file(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('replacements', [
+    {'a.bin': b'shorter' * 600},  # Fills a part of the last 4096 bytes of the slot
+    {'sub/b.dds': b'x' * 4096, 'sub/c.dds': b'longer' * 1300},
+    {'sub/deeper/d.lua': b'longer' * 2000},  # The last entry can always grow
+    {'sub/deeper/d.lua': b''},
+], ids=['shorter', 'same_size_and_longer', 'last_longer', 'last_empty'])
+def test_patch_in_place(tmp_path, contents, replacements):
+    archive_path = str(tmp_path / 'data.gfs')
+    write_archive(archive_path, contents, True)
+    reader = GFSReader(archive_path)
+    offsets = [entry[0] for entry in reader.read_references()]
+    reader.close()
+    assert patch_archive(archive_path, write_replacements(tmp_path, replacements)) is True
+    patched = dict(contents)
+    patched.update(replacements)
+    with GFSArchive(archive_path) as archive:
+        assert [entry[0] for entry in archive.metadata['metadata']] == offsets
+        assert {path: archive.read(path) for path in archive.get_paths()} == patched
+    # The same bytes as a new archive, the rest of a slot is zeroed
+    expected_path = str(tmp_path / 'expected.gfs')
+    write_archive(expected_path, patched, True)
+    assert read_file(archive_path) == read_file(expected_path)
+
+
+@pytest.mark.parametrize('workers', [None, 4])
+@pytest.mark.parametrize('is_aligned', [False, True])
+def test_patch_repack(tmp_path, contents, is_aligned, workers):
+    archive_path = str(tmp_path / 'data.gfs')
+    write_archive(archive_path, contents, is_aligned)
+    replacements = {'a.bin': b'longer' * 2000, 'sub/b.dds': b'shorter'}
+    assert patch_archive(archive_path, write_replacements(tmp_path, replacements), workers) is False
+    patched = dict(contents)
+    patched.update(replacements)
+    expected_path = str(tmp_path / 'expected.gfs')
+    write_archive(expected_path, patched, is_aligned)
+    assert read_file(archive_path) == read_file(expected_path)
+    assert not os.path.exists(archive_path + '.tmp')
+
+
+@pytest.mark.parametrize('is_aligned', [False, True])
+def test_patch_rollback(tmp_path, contents, is_aligned):
+    """
+    A directory as the last replacement fails after the other entries were written (in place) or while the
+    archive is repacked
+    """
+    archive_path = str(tmp_path / 'data.gfs')
+    write_archive(archive_path, contents, is_aligned)
+    original = read_file(archive_path)
+    replacements = write_replacements(tmp_path, {'a.bin': b'shorter' * 600})
+    replacements['sub/deeper/d.lua'] = str(tmp_path / 'directory')
+    os.mkdir(replacements['sub/deeper/d.lua'])
+    with pytest.raises(OSError):
+        patch_archive(archive_path, replacements)
+    assert read_file(archive_path) == original
+    assert not os.path.exists(archive_path + '.tmp')
+
+
+def test_patch_missing_entry(tmp_path, contents):
+    archive_path = str(tmp_path / 'data.gfs')
+    write_archive(archive_path, contents, True)
+    original = read_file(archive_path)
+    replacements = write_replacements(tmp_path, {'a.bin': b'shorter', 'missing.bin': b'new'})
+    with pytest.raises(FileNotFoundError):
+        patch_archive(archive_path, replacements)
+    assert read_file(archive_path) == original
+
+
+def test_patch_removes_sidecars(tmp_path, contents):
+    archive_path = str(tmp_path / 'data.gfs')
+    write_archive(archive_path, contents, True)
+    reader = GFSReader(archive_path)
+    reader.export_files(reader.get_metadata(use_cache=True))  # Writes the source index
+    reader.close()
+    sidecar_paths = [archive_path + GFSReader.INDEX_CACHE_EXTENSION, GFSReader.get_source_index_path(archive_path)]
+    assert all(os.path.exists(sidecar_path) for sidecar_path in sidecar_paths)
+    patch_archive(archive_path, write_replacements(tmp_path, {'a.bin': b'shorter'}))
+    assert not any(os.path.exists(sidecar_path) for sidecar_path in sidecar_paths)
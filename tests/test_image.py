@@ -0,0 +1,73 @@
+from array import array
+import pytest
+from SkullModPy.common.Image import Image
+from SkullModPy.formats.png import PNGWriter, get_scanlines
+
+ROWS = [[y * 16 + x for x in range(5)] for y in range(3)]
+
+
+def test_rows():
+    image = Image.from_rows(ROWS)
+    assert (image.width, image.height, image.stride) == (5, 3, 5)
+    assert image.tolist() == ROWS
+    assert image.get_pixel(4, 2) == 36
+    image.set_pixel(4, 2, 0xFFFFFFFF)
+    assert image.get_row(2).tolist() == [32, 33, 34, 35, 0xFFFFFFFF]
+    assert Image.from_rows([]).tolist() == []
+
+
+def test_new_image():
+    assert Image(3, 2).tolist() == [[0] * 3] * 2
+    with pytest.raises(ValueError):
+        Image(-1, 2)
+    with pytest.raises(ValueError):
+        Image(3, 2, stride=2)
+    with pytest.raises(ValueError):
+        Image(3, 2, array('I', [0] * 5))
+
+
+def test_stride():
+    """
+    The pixels after the width of a row are ignored (like padded DXT images)
+    """
+    image = Image(3, 2, array('I', range(10)), 5)
+    assert image.tolist() == [[0, 1, 2], [5, 6, 7]]
+    assert image.get_region(1, 1, 2, 1).tolist() == [[6, 7]]
+    assert image.map(lambda color: color * 2).tolist() == [[0, 2, 4], [10, 12, 14]]
+
+
+def test_crop():
+    image = Image.from_rows(ROWS)
+    cropped = image.crop(2, 2)
+    assert cropped.tolist() == [[0, 1], [16, 17]]
+    assert cropped.data is image.data  # Shared, not copied
+    with pytest.raises(ValueError):
+        image.crop(6, 1)
+
+
+def test_region():
+    image = Image.from_rows(ROWS)
+    assert image.get_region(0, 0, 5, 3).tolist() == ROWS
+    assert image.get_region(0, 1, 5, 2).tolist() == ROWS[1:]  # Whole rows
+    assert image.get_region(1, 1, 3, 2).tolist() == [row[1:4] for row in ROWS[1:]]
+    assert image.get_region(4, 2, 0, 0).tolist() == []
+    for x, y, width, height in [(-1, 0, 1, 1), (0, 0, 6, 1), (4, 2, 1, 2)]:
+        with pytest.raises(ValueError):
+            image.get_region(x, y, width, height)
+
+
+def test_paste():
+    image = Image(6, 4)
+    image.paste(Image.from_rows(ROWS).crop(2, 3), 3, 1)
+    assert image.tolist() == [[0] * 6, [0, 0, 0, 0, 1, 0], [0, 0, 0, 16, 17, 0], [0, 0, 0, 32, 33, 0]]
+    with pytest.raises(ValueError):
+        image.paste(Image(2, 2), 5, 0)
+
+
+def test_scanlines():
+    image = Image(2, 2, array('I', [0x44332211, 0x88776655, 0, 0xDDCCBBAA, 0xFF, 0]), 3)
+    assert get_scanlines(image) == b'\x00\x11\x22\x33\x44\x55\x66\x77\x88\x00\xaa\xbb\xcc\xdd\xff\x00\x00\x00'
+    # The same as the flat list writer
+    writer = PNGWriter('unused.png')
+    writer.set_data_argb8([0x44332211, 0x88776655, 0xDDCCBBAA, 0xFF], 2, 2)
+    assert get_scanlines(image) == writer.data
@@ -0,0 +1,45 @@
+import os
+from array import array
+import pytest
+from conftest import read_png
+from SkullModPy.common.Image import Image
+from SkullModPy.formats.png import PNGStreamWriter, PNGWriter
+
+
+def make_image(width, height, seed=0):
+    return Image(width, height, array('I', [(i * 2654435761 + seed) & 0xFFFFFFFF for i in range(width * height)]))
+
+
+@pytest.mark.parametrize('idat_size', [PNGStreamWriter.IDAT_SIZE, 16])
+def test_stream_matches_png(tmp_path, idat_size, monkeypatch):
+    image = make_image(7, 9)
+    png_path = str(tmp_path / 'image.png')
+    png = PNGWriter(png_path)
+    png.set_image(image)
+    png.write()
+    expected = read_png(png_path)
+    monkeypatch.setattr(PNGStreamWriter, 'IDAT_SIZE', idat_size)  # Several IDAT chunks
+    stream_path = str(tmp_path / 'stream.png')
+    with PNGStreamWriter(stream_path, 7, 9) as png:
+        for y in range(0, 9, 4):
+            png.write_rows(image.get_region(0, y, 7, min(4, 9 - y)))
+    assert read_png(stream_path) == expected
+
+
+def test_incomplete_png_is_removed(tmp_path):
+    png_path = str(tmp_path / 'image.png')
+    png = PNGStreamWriter(png_path, 7, 9)
+    png.write_rows(make_image(7, 4))
+    with pytest.raises(ValueError):
+        png.write_rows(make_image(6, 1))  # Other width
+    with pytest.raises(ValueError):
+        png.write_rows(make_image(7, 6))  # Too many rows
+    with pytest.raises(ValueError):
+        png.close()  # Not all rows
+    assert not os.path.exists(png_path)
+
+    with pytest.raises(RuntimeError):
+        with PNGStreamWriter(png_path, 7, 9) as png:
+            png.write_rows(make_image(7, 9))
+            raise RuntimeError()
+    assert not os.path.exists(png_path)
@@ -0,0 +1,64 @@
+import os
+import pytest
+from conftest import write_directory
+from SkullModPy.vfs import VirtualFileSystem
+
+
+@pytest.fixture
+def layers(tmp_path, pack, contents):
+    """
+    An archive and a mod directory that replaces one of its files and adds another one
+    :return: Archive path, mod directory, merged contents
+    """
+    archive_path = pack(contents, True)
+    mod_path = str(tmp_path / 'mod')
+    mod_contents = {'sub/b.dds': b'modded', 'sub/new.dds': b'new'}
+    write_directory(mod_path, mod_contents)
+    merged = dict(contents)
+    merged.update(mod_contents)
+    return archive_path, mod_path, merged
+
+
+def test_later_layers_shadow(layers):
+    archive_path, mod_path, merged = layers
+    with VirtualFileSystem([archive_path, mod_path]) as vfs:
+        assert len(vfs) == len(merged)
+        assert sorted(vfs.get_paths()) == sorted(merged)
+        assert {path: vfs.read(path) for path in merged} == merged
+        assert vfs.resolve('sub/b.dds') == os.path.abspath(mod_path)
+        assert vfs.resolve('\\sub\\c.dds') == os.path.abspath(archive_path)
+        with vfs.open('/sub/b.dds') as f:
+            assert f.read() == b'modded'
+        with vfs.open('sub/c.dds') as f:
+            f.seek(4000)
+            assert f.read() == merged['sub/c.dds'][4000:]
+
+
+def test_mount_order(layers, contents):
+    archive_path, mod_path, merged = layers
+    with VirtualFileSystem([mod_path, archive_path], memory_map=True) as vfs:
+        assert vfs.read('sub/b.dds') == contents['sub/b.dds']
+        assert vfs.read('sub/new.dds') == b'new'
+
+
+def test_mount_point(layers, contents):
+    archive_path, mod_path, merged = layers
+    with VirtualFileSystem([archive_path]) as vfs:
+        vfs.mount(mod_path, '/mods/')
+        assert vfs.read('sub/b.dds') == contents['sub/b.dds']
+        assert vfs.read('mods/sub/b.dds') == b'modded'
+        assert 'mods\\sub\\new.dds' in vfs
+        assert 'sub/new.dds' not in vfs
+
+
+def test_errors(tmp_path, layers):
+    archive_path, mod_path, merged = layers
+    vfs = VirtualFileSystem([archive_path])
+    with pytest.raises(FileNotFoundError):
+        vfs.read('missing.bin')
+    with pytest.raises(FileNotFoundError):
+        vfs.resolve('missing.bin')
+    with pytest.raises(NotADirectoryError):
+        vfs.mount(str(tmp_path / 'missing'))
+    vfs.close()
+    assert len(vfs) == 0